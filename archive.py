@@ -0,0 +1,272 @@
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import TYPE_CHECKING
+
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+from metrics import metrics
+try:
+    from config import config
+except ImportError:
+    from test_config import test_config
+    config = test_config
+
+if TYPE_CHECKING:
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class RequestArchive:
+    """
+    Класс для переноса старых заявок из базы данных в сжатые архивы по месяцам.
+
+    Заявки старше max_age_days (по столбцу created_at) переносятся в файлы
+    <папка архива>/requests-<ГГГГ-ММ>.jsonl.gz: каждая строка - JSON-объект с зашифрованными
+    значениями столбцов, поэтому архив так же защищен, как и база данных. Файл месяца
+    перезаписывается атомарно и только после этого строки удаляются из базы; повторный
+    запуск после сбоя не создает дублей (строки объединяются по request_id или row_token).
+    Заявки без created_at (созданные до появления столбца) в архив не переносятся.
+
+    Экспорты читают архив, если им передана папка архива (см. ExportData._read_rows).
+    При смене ключа rotate.py перешифровывает и архив (см. rotate), если папка архива задана
+    в config['archive']['archive_dir'].
+    """
+    TABLE_NAME = 'requests'
+
+    def __init__(self, database_path: str, archive_dir: str, max_age_days: int = 365):
+        """
+        Инициализирует архив.
+
+        Параметры:
+        database_path (str): Путь к файлу базы данных.
+        archive_dir (str): Папка для файлов архива.
+        max_age_days (int): Возраст заявки в днях, после которого она переносится в архив.
+        """
+        self.database_path = database_path
+        self.archive_dir = archive_dir
+        self.max_age_days = max_age_days
+
+    @staticmethod
+    def month_file(archive_dir: str, table_name: str, month: str) -> str:
+        """
+        Возвращает путь к файлу архива за месяц.
+
+        Параметры:
+        archive_dir (str): Папка архива.
+        table_name (str): Имя таблицы.
+        month (str): Месяц в формате ГГГГ-ММ.
+
+        Возвращает:
+        str: Путь к файлу.
+        """
+        return os.path.join(archive_dir, f'{table_name}-{month}.jsonl.gz')
+
+    @staticmethod
+    def read(archive_dir: str, table_name: str, columns: list):
+        """
+        Построчно читает архив таблицы в порядке месяцев.
+
+        Параметры:
+        archive_dir (str): Папка архива.
+        table_name (str): Имя таблицы.
+        columns (list): Столбцы, значения которых нужно вернуть.
+
+        Возвращает:
+        generator: Генератор строк в виде списков значений (в зашифрованном виде).
+        """
+        for path in sorted(glob.glob(RequestArchive.month_file(glob.escape(archive_dir), table_name, '*'))):
+            with gzip.open(path, 'rt', encoding='UTF-8') as file:
+                for line in file:
+                    record = json.loads(line)
+                    yield [record.get(column) for column in columns]
+
+    def run(self) -> dict:
+        """
+        Переносит заявки старше max_age_days в архив.
+
+        Возвращает:
+        dict: Словарь {месяц: количество перенесенных заявок}.
+        """
+        cutoff = int(time.time()) - self.max_age_days * 24 * 60 * 60
+        month = "strftime('%Y-%m', created_at, 'unixepoch')"
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        connection = sqlite3.connect(self.database_path)
+        try:
+            columns = (*BotDatabase.stored_columns(connection, self.TABLE_NAME), 'created_at')
+            months = [row[0] for row in connection.execute(
+                f"SELECT DISTINCT {month} FROM {self.TABLE_NAME} WHERE created_at < ? ORDER BY 1", (cutoff,))]
+
+            archived = {}
+            for current_month in months:
+                rows = connection.execute(
+                    f"SELECT rowid, {', '.join(columns)} FROM {self.TABLE_NAME} "
+                    f"WHERE created_at < ? AND {month} = ? ORDER BY rowid", (cutoff, current_month)).fetchall()
+
+                # Сначала архив надежно записывается на диск, и только потом строки удаляются из базы
+                self._merge(current_month, [dict(zip(columns, row[1:])) for row in rows])
+                with metrics.time('db_operation_seconds', operation='archive_delete'), connection:
+                    connection.executemany(
+                        f"DELETE FROM {self.TABLE_NAME} WHERE rowid = ?", [(row[0],) for row in rows])
+
+                archived[current_month] = len(rows)
+                logger.info(f'Архив {current_month}: перенесено заявок {len(rows)}')
+            return archived
+        finally:
+            connection.close()
+
+    def _merge(self, month: str, records: list) -> None:
+        """
+        Добавляет записи в файл архива за месяц, перезаписывая его атомарно.
+
+        Параметры:
+        month (str): Месяц в формате ГГГГ-ММ.
+        records (list): Список словарей с зашифрованными значениями столбцов.
+        """
+        path = self.month_file(self.archive_dir, self.TABLE_NAME, month)
+        existing = []
+        if os.path.exists(path):
+            with gzip.open(path, 'rt', encoding='UTF-8') as file:
+                existing = [json.loads(line) for line in file]
+
+        # Токены AEAD (BLOB) хранятся в архиве текстом, как при публикации
+        records = [{column: Crypt.to_text(value) for column, value in record.items()} for record in records]
+
+        # Записи, уже попавшие в архив до сбоя, не дублируются
+        def record_id(record: dict) -> str:
+            return record.get(BotDatabase.ROW_TOKEN_COLUMN) or record['request_id']
+
+        known = {record_id(record) for record in existing}
+        self._write(path, existing + [record for record in records if record_id(record) not in known])
+
+    def rotate(self) -> int:
+        """
+        Перешифровывает все файлы архива основным ключом и алгоритмом (Crypt.rotate_value).
+
+        Каждый файл перезаписывается атомарно, поэтому прерванное перешифрование можно запустить
+        заново: уже перешифрованные значения просто перешифровываются еще раз.
+
+        Возвращает:
+        int: Количество перешифрованных записей.
+        """
+        columns = (*BotDatabase.ENCRYPTED_COLUMNS[self.TABLE_NAME], BotDatabase.ROW_TOKEN_COLUMN)
+        rotated = 0
+        for path in sorted(glob.glob(self.month_file(glob.escape(self.archive_dir), self.TABLE_NAME, '*'))):
+            with gzip.open(path, 'rt', encoding='UTF-8') as file:
+                records = [json.loads(line) for line in file]
+            for record in records:
+                for column in columns:
+                    if record.get(column) is not None:
+                        record[column] = Crypt.to_text(Crypt.rotate_value(record[column]))
+
+            self._write(path, records)
+            rotated += len(records)
+            logger.info(f'Перешифрование архива {os.path.basename(path)}: {len(records)} записей')
+        return rotated
+
+    def _write(self, path: str, records: list) -> None:
+        """
+        Атомарно перезаписывает файл архива и фиксирует его на диске.
+
+        Параметры:
+        path (str): Путь к файлу архива.
+        records (list): Список словарей со значениями столбцов (токены в текстовом виде).
+        """
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as raw_file:
+            with gzip.GzipFile(fileobj=raw_file, mode='wb', mtime=0) as file:
+                for record in records:
+                    file.write(json.dumps(record, ensure_ascii=False).encode('UTF-8') + b'\n')
+            raw_file.flush()
+            os.fsync(raw_file.fileno())
+        os.replace(temp_path, path)
+
+        if hasattr(os, 'O_DIRECTORY'):  # Фиксируем переименование (на Windows не поддерживается)
+            directory = os.open(self.archive_dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    @staticmethod
+    def vacuum(database_path: str, full: bool = False) -> int:
+        """
+        Возвращает освободившееся место в базе данных операционной системе.
+
+        Обычно выполняется PRAGMA incremental_vacuum, который только отдает свободные страницы и
+        почти не блокирует базу. Полный VACUUM (переписывает и дефрагментирует файл) выполняется
+        по запросу или один раз, чтобы перевести старую базу в режим auto_vacuum = INCREMENTAL.
+        После очистки обновляется статистика планировщика запросов (PRAGMA optimize).
+
+        Параметры:
+        database_path (str): Путь к файлу базы данных.
+        full (bool): Выполнить полный VACUUM.
+
+        Возвращает:
+        int: Количество освобожденных страниц.
+        """
+        connection = sqlite3.connect(database_path, isolation_level=None)
+        try:
+            pages_before = connection.execute("PRAGMA page_count").fetchone()[0]
+            if full or connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                with metrics.time('db_operation_seconds', operation='vacuum'):
+                    connection.execute("VACUUM")
+            else:
+                with metrics.time('db_operation_seconds', operation='incremental_vacuum'):
+                    connection.execute("PRAGMA incremental_vacuum").fetchall()
+            connection.execute("PRAGMA optimize")
+            return pages_before - connection.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            connection.close()
+
+    @metrics.timed('scheduler_job_seconds', job='archive')
+    def compact(self) -> None:
+        """
+        Переносит старые заявки в архив и очищает освободившееся место.
+        """
+        archived = self.run()
+        freed = self.vacuum(self.database_path)
+        logger.info(f'Архивация: перенесено заявок {sum(archived.values())}, освобождено страниц {freed}')
+
+    def add_job(self, scheduler: 'BackgroundScheduler', hour: int, minutes: int) -> None:
+        """
+        Добавляет ежедневную архивацию в планировщик.
+
+        Параметры:
+        scheduler (BackgroundScheduler): Планировщик (например, планировщик публикации страниц).
+        hour (int): Час, в который будет выполняться задача.
+        minutes (int): Минуты, в которые будет выполняться задача.
+        """
+        scheduler.add_job(self.compact, 'cron', hour=hour, minute=minutes)
+
+
+if __name__ == "__main__":
+    """
+    Этот модуль можно запустить напрямую через терминал в формате:
+    `python archive.py <путь к базе данных> <папка архива> -d <возраст в днях>`, тем самым перенеся
+    старые заявки в архив и очистив освободившееся место. С флагом `--full_vacuum` база данных
+    переписывается полностью (VACUUM), с флагом `--vacuum_only` заявки не переносятся.
+    """
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Move old requests into monthly archives and vacuum the database')
+
+    parser.add_argument('database_path', help='Path to database')
+    parser.add_argument('archive_dir', help='Directory for archive files')
+    parser.add_argument('-d', '--max_age_days', type=int, default=365, help='Archive requests older than this')
+    parser.add_argument('--full_vacuum', action='store_true', help='Rewrite the whole database file')
+    parser.add_argument('--vacuum_only', action='store_true', help='Only vacuum, do not archive')
+    args = parser.parse_args()
+
+    request_archive = RequestArchive(args.database_path, args.archive_dir, args.max_age_days)
+    if not args.vacuum_only:
+        print(request_archive.run())
+    print(f'Освобождено страниц: {RequestArchive.vacuum(args.database_path, args.full_vacuum)}')
@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from unittest.mock import AsyncMock, Mock
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from commands import RequestCommand, config  # noqa: E402
+from crypt_data import Crypt  # noqa: E402
+from dbscripts import BotDatabase  # noqa: E402
+from expdata import ExportData  # noqa: E402
+from pagedwn import parse_table_page  # noqa: E402
+from search import SearchIndex  # noqa: E402
+
+DB_SIZE_ROWS = 200  # Заявок в базе при измерении ее размера: от -n не зависит, иначе результаты несравнимы
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+EXPORT_FORMATS = {
+    'word': ('docx', ExportData.export_to_word),
+    'excel': ('xlsx', ExportData.export_to_excel),
+    'csv': ('csv', ExportData.export_to_csv),
+    'html': ('html', ExportData.export_to_html),
+}
+
+
+def synthetic_request(i: int) -> tuple:
+    """
+    Возвращает поля одной синтетической заявки.
+
+    :param i: Порядковый номер заявки.
+    :return: Кортеж (user_id, user_name, request_id, problem_description, contact_info, contact_time).
+    """
+    return (str(100000 + i % 5000), 'Иван Иванов', str(i),
+            f'Не работает котел в квартире {i}, нужен мастер. ' * 3, f'8999{i:07d}', 'после 18:00')
+
+
+def generate_dataset(path: str, rows: int) -> None:
+    """
+    Создает базу данных с указанным количеством зашифрованных синтетических заявок.
+
+    :param path: Путь к файлу базы данных.
+    :param rows: Количество заявок.
+    :return: None
+    """
+    BotDatabase(path).create_tables()
+
+    users, requests = [], []
+    for i in range(rows):
+        user_id, user_name, request_id, problem_description, contact_info, contact_time = synthetic_request(i)
+        users.append(Crypt.encrypt_values(user_id, user_name, contact_info))
+        requests.append(Crypt.encrypt_values(request_id, user_id, problem_description, contact_time))
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO users (user_id, user_name, contact_info) VALUES (?,?,?)", users)
+        connection.executemany("""
+            INSERT INTO requests (request_id, user_id, problem_description, contact_time)
+            VALUES (?,?,?,?)""", requests)
+    connection.close()
+
+
+def measure(func, operations: int, repeat: int = 3) -> float:
+    """
+    Измеряет время выполнения функции (лучший результат из нескольких запусков).
+
+    :param func: Функция без аргументов, выполняющая operations операций.
+    :param operations: Количество операций, выполняемых за один вызов func.
+    :param repeat: Количество запусков.
+    :return: Время одной операции в секундах.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best / operations
+
+
+def bench_crypt(cells: int) -> dict:
+    """
+    Измеряет шифрование и расшифровку одной ячейки, а также строки заявки одним токеном.
+
+    :param cells: Количество ячеек (и строк) в одном замере.
+    :return: Словарь результатов.
+    """
+    value = synthetic_request(0)[3]
+    tokens = asyncio.run(Crypt.encrypt_data(*[value] * cells))
+    row = synthetic_request(0)[2:]
+    row_tokens = [Crypt.seal_values(*row) for _ in range(cells)]
+
+    results = {
+        'crypt_encrypt_cell': measure(lambda: asyncio.run(Crypt.encrypt_data(*[value] * cells)), cells),
+        'crypt_decrypt_cell': measure(lambda: [Crypt.decrypt_data(token) for token in tokens], cells),
+        'crypt_seal_row': measure(lambda: [Crypt.seal_values(*row) for _ in range(cells)], cells),
+        'crypt_open_row': measure(lambda: [Crypt.open_values(token) for token in row_tokens], cells),
+    }
+
+    # Сравнение алгоритмов: шифрование и расшифровка ячейки без цикла событий
+    data = value.encode()
+    for cipher in ('fernet', 'aes-gcm', 'chacha20'):
+        config['db']['cipher'] = cipher
+        cipher_tokens = [Crypt.encrypt_bytes(data) for _ in range(cells)]
+        name = cipher.replace('-', '_')
+        results[f'crypt_{name}_encrypt_cell'] = measure(lambda: [Crypt.encrypt_bytes(data) for _ in range(cells)], cells)
+        results[f'crypt_{name}_decrypt_cell'] = measure(
+            lambda: [Crypt.decrypt_bytes(token) for token in cipher_tokens], cells)
+    config['db']['cipher'] = 'fernet'
+    return results
+
+
+def bench_search(work_dir: str, table_sizes: list) -> dict:
+    """
+    Измеряет построение поискового индекса (на одну заявку) и поиск по нему.
+
+    :param work_dir: Рабочая папка.
+    :param table_sizes: Список размеров таблицы.
+    :return: Словарь результатов.
+    """
+    results = {}
+    for rows in table_sizes:
+        path = os.path.join(work_dir, f'search_{rows}.db')
+        generate_dataset(path, rows)
+        search_index = SearchIndex(path)
+        results[f'search_index_{rows}'] = measure(search_index.rebuild, rows, repeat=1)
+        # Худший случай: слова есть во всех заявках
+        results[f'search_query_{rows}'] = measure(
+            lambda: [search_index.search('котел мастер') for _ in range(10)], 10)
+    return results
+
+
+def bench_save_user_data(work_dir: str, rows: int) -> dict:
+    """
+    Измеряет пропускную способность BotDatabase.save_user_data.
+
+    :param work_dir: Рабочая папка.
+    :param rows: Количество сохраняемых заявок в одном замере.
+    :return: Словарь результатов.
+    """
+    def run(count: int = rows):
+        path = os.path.join(work_dir, 'save.db')
+        if os.path.exists(path):
+            os.remove(path)
+        database = BotDatabase(path)
+        database.create_tables()
+
+        async def save():
+            for i in range(count):
+                await database.save_user_data(*synthetic_request(i))
+        asyncio.run(save())
+
+    results = {'db_save_user_data': measure(run, rows)}
+
+    # Размер базы данных на одну заявку при разных алгоритмах, с токенами по столбцам и одним
+    # токеном на строку (байты, а не секунды)
+    for cipher in ('fernet', 'aes-gcm', 'chacha20'):
+        for row_envelope in (False, True):
+            config['db'].update(cipher=cipher, row_envelope=row_envelope)
+            run(DB_SIZE_ROWS)
+            name = f'db_size_{cipher.replace("-", "_")}{"_envelope" if row_envelope else ""}_bytes_per_row'
+            results[name] = os.path.getsize(os.path.join(work_dir, 'save.db')) / DB_SIZE_ROWS
+    config['db'].update(cipher='fernet', row_envelope=False)
+    return results
+
+
+def bench_exports(work_dir: str, row_counts: list) -> dict:
+    """
+    Измеряет каждый формат экспорта и разбор опубликованной страницы для разных размеров таблицы.
+
+    :param work_dir: Рабочая папка.
+    :param row_counts: Список размеров таблицы.
+    :return: Словарь результатов (время экспорта всей таблицы).
+    """
+    results = {}
+    for rows in row_counts:
+        path = os.path.join(work_dir, f'export_{rows}.db')
+        generate_dataset(path, rows)
+
+        for method, (extension, export) in EXPORT_FORMATS.items():
+            output_file = os.path.join(work_dir, f'requests_{rows}.{extension}')
+            results[f'export_{method}_{rows}'] = measure(lambda: export(path, 'requests', output_file), 1)
+
+        page_file = os.path.join(work_dir, f'published_{rows}.html')
+        ExportData.export_to_html(path, 'requests', page_file, decrypt=False)
+        with open(page_file, encoding='UTF-8') as file:
+            html_data = file.read()
+        results[f'pagedwn_parse_{rows}'] = measure(lambda: parse_table_page(html_data, decrypt=True), 1)
+    return results
+
+
+def bench_request_dialog(work_dir: str, dialogs: int) -> dict:
+    """
+    Измеряет обработку сообщений диалога /request (все шаги, включая запись в базу данных).
+
+    :param work_dir: Рабочая папка.
+    :param dialogs: Количество диалогов в одном замере.
+    :return: Словарь результатов (время обработки одного сообщения).
+    """
+    config['db']['database_path'] = os.path.join(work_dir, 'dialog.db')
+    BotDatabase(config['db']['database_path']).create_tables()
+
+    command = RequestCommand()
+    context = Mock()
+    context.user_data = {}
+    context.bot.send_message = AsyncMock()
+    messages = ['Не работает котел, нужен мастер', 'Иван Иванов', '89991234567', 'после 18:00']
+
+    async def run_dialogs():
+        for i in range(dialogs):
+            update = Mock()
+            update.update_id = i
+            await command.run(update, context)
+            for text in messages:
+                update.message.text = text
+                await command._next_step(update, context)
+
+    return {'request_dialog_message': measure(lambda: asyncio.run(run_dialogs()), dialogs * (len(messages) + 1))}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> tuple:
+    """
+    Сравнивает результаты с базовыми.
+
+    :param results: Текущие результаты (секунды на операцию).
+    :param baseline: Базовые результаты.
+    :param tolerance: Допустимое относительное замедление (0.5 - на 50%).
+    :return: Кортеж (список строк с описанием регрессий, список результатов, которых нет в базовых).
+    """
+    regressions, missing = [], []
+    for name, value in sorted(results.items()):
+        if name not in baseline:
+            missing.append(name)
+        elif value > baseline[name] * (1 + tolerance):
+            regressions.append(f'{name}: {format_value(name, value)} > {format_value(name, baseline[name])} '
+                               f'(x{value / baseline[name]:.2f})')
+    return regressions, missing
+
+
+def format_value(name: str, value: float) -> str:
+    """
+    Форматирует результат бенчмарка в его единицах измерения.
+
+    :param name: Имя бенчмарка.
+    :param value: Результат (байты на строку для *_bytes_per_row, иначе секунды на операцию).
+    :return: Строка со значением и единицей измерения.
+    """
+    if name.endswith('_bytes_per_row'):
+        return f'{value:.1f} B'
+    return f'{value * 1000:.3f} ms'
+
+
+def main() -> None:
+    """
+    Главная функция для обработки аргументов командной строки и запуска бенчмарков.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Run performance benchmarks and compare them with the baseline.')
+
+    parser.add_argument('-r', '--rows', type=int, nargs='+', default=[100, 1000], help='Table sizes for exports')
+    parser.add_argument('-n', '--operations', type=int, default=200, help='Operations per micro-benchmark')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.5, help='Allowed relative slowdown')
+    parser.add_argument('-b', '--baseline', default=BASELINE_FILE, help='Path to the baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        results = {}
+        results.update(bench_crypt(args.operations))
+        results.update(bench_save_user_data(work_dir, args.operations))
+        results.update(bench_request_dialog(work_dir, args.operations))
+        results.update(bench_exports(work_dir, args.rows))
+        results.update(bench_search(work_dir, args.rows))
+    finally:
+        shutil.rmtree(work_dir)
+
+    for name, value in sorted(results.items()):
+        print(f'{name:<40} {format_value(name, value):>13}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='UTF-8') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='UTF-8') as file:
+            regressions, missing = compare(results, json.load(file), args.tolerance)
+        if missing:  # Новые бенчмарки или другие размеры таблиц: эти результаты не проверены
+            print('\nNOT IN BASELINE (not checked, re-save with --save-baseline):\n' + '\n'.join(missing))
+        if regressions:
+            print('\nPERFORMANCE REGRESSIONS:\n' + '\n'.join(regressions))
+            sys.exit(1)
+        print('\nNo regressions against the baseline.')
+
+
+if __name__ == '__main__':
+    """
+    Этот модуль можно запустить напрямую через терминал в формате:
+    `python benchmarks/bench.py -r <размеры таблиц> -n <число операций> -t <допустимое замедление>`,
+    тем самым сравнив производительность с benchmarks/baseline.json (при замедлении код возврата 1).
+    Базовые значения зависят от машины: их нужно пересохранить флагом `--save-baseline` на эталонной машине.
+    """
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ['bot', 'dbscripts', 'expdata', 'pageupd', 'pagedwn']
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def measure_import(module: str) -> list:
+    """
+    Импортирует модуль в отдельном процессе с `-X importtime` и разбирает отчет интерпретатора.
+
+    :param module: Имя модуля (точки входа), который нужно импортировать.
+    :return: Список кортежей (глубина вложенности, имя модуля, накопленное время в микросекундах)
+    в порядке отчета (вложенные импорты идут перед импортировавшим их модулем).
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+
+    records = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            records.append(((len(match.group(3)) - 1) // 2, match.group(4), int(match.group(2))))
+    return records
+
+
+def direct_imports(records: list, module: str) -> list:
+    """
+    Возвращает импорты первого уровня, выполненные при импорте модуля.
+
+    :param records: Разобранный отчет `-X importtime`.
+    :param module: Имя модуля (точки входа).
+    :return: Список кортежей (имя модуля, накопленное время в микросекундах).
+    """
+    children = []
+    for depth, name, cumulative in records:
+        if depth == 0:
+            if name == module:
+                return children
+            children = []  # Импорты, выполненные до точки входа (например, site), не учитываем
+        elif depth == 1:
+            children.append((name, cumulative))
+    return children
+
+
+def report(modules: list, repeat: int, top: int) -> dict:
+    """
+    Измеряет время холодного импорта каждой точки входа и печатает самые тяжелые зависимости.
+
+    :param modules: Список точек входа.
+    :param repeat: Количество повторов (берется медиана).
+    :param top: Сколько самых тяжелых импортов показать для каждой точки входа.
+    :return: Словарь {точка входа: медианное время импорта в миллисекундах}.
+    """
+    totals = {}
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        totals[module] = statistics.median(
+            next(time for depth, name, time in run if depth == 0 and name == module) for run in runs) / 1000
+        print(f'{module}: {totals[module]:.1f} ms')
+
+        heaviest = sorted(direct_imports(runs[-1], module), key=lambda item: item[1], reverse=True)[:top]
+        for name, time in heaviest:
+            print(f'    {name:<30} {time / 1000:8.1f} ms')
+    return totals
+
+
+def main() -> None:
+    """
+    Главная функция для обработки аргументов командной строки и вывода отчета о времени запуска.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Measure cold import time of the entry points.')
+
+    parser.add_argument('modules', nargs='*', default=ENTRY_POINTS, help='Entry points to measure')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Number of runs per entry point')
+    parser.add_argument('-t', '--top', type=int, default=5, help='Number of heaviest imports to show')
+
+    args = parser.parse_args()
+    report(args.modules, args.repeat, args.top)
+
+
+if __name__ == '__main__':
+    """
+    Этот модуль можно запустить напрямую через терминал в формате:
+    `python benchmarks/importtime.py <точки входа (опционально, по умолчанию все)> -r <число повторов> -t <число импортов>`,
+    тем самым получив время запуска каждой точки входа и список самых тяжелых импортов.
+    """
+    main()
@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import collections
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder
+from telegram.request import BaseRequest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from bench import synthetic_request  # noqa: E402
+from commands import CommandsFactory, config  # noqa: E402
+from dbscripts import BotDatabase  # noqa: E402
+from outbox import Outbox  # noqa: E402
+from recorder import UpdateRecorder  # noqa: E402
+from writer import DatabaseWriter  # noqa: E402
+
+FAKE_TOKEN = '123456:replay'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Replay', 'username': 'replay_bot'}
+PERCENTILES = (50, 90, 99)
+
+
+class FakeBotApi(BaseRequest):
+    """
+    Локальная замена Bot API: отвечает на запросы бота без сети, как если бы они были успешными.
+
+    sendMessage (и другие методы отправки) возвращает сообщение с новым message_id, getMe -
+    пользователя BOT_USER, остальные методы - True. Задержка ответа задается параметром latency.
+    """
+    def __init__(self, latency: float = 0.0):
+        """
+        :param latency: Задержка каждого ответа в секундах (имитация сети до api.telegram.org).
+        """
+        super().__init__()
+        self.latency = latency
+        self.calls = collections.Counter()
+        self._message_id = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None) -> tuple:
+        """
+        Отвечает на запрос бота.
+
+        :param url: Адрес метода Bot API (имя метода - последняя часть адреса).
+        :param method: HTTP-метод.
+        :param request_data: Параметры запроса.
+        :return: Кортеж (HTTP-код, тело ответа).
+        """
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        parameters = request_data.parameters if request_data is not None else {}
+        if endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint.startswith('send') or endpoint == 'editMessageText':
+            self._message_id += 1
+            result = {'message_id': parameters.get('message_id', self._message_id), 'date': int(time.time()),
+                      'chat': {'id': parameters.get('chat_id', 0), 'type': 'private'}, 'from': BOT_USER}
+            if 'text' in parameters:
+                result['text'] = parameters['text']
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+class ReplayApplication(Application):
+    """
+    Приложение, которое замеряет задержку обновлений: время от постановки в очередь до конца обработки.
+    """
+    def track(self, updates: int) -> None:
+        """
+        Готовит замер.
+
+        :param updates: Количество обновлений, после обработки которых замер завершается.
+        :return: None
+        """
+        self.enqueued = {}
+        self.latencies = []
+        self.errors = 0
+        self.remaining = updates
+        self.finished = asyncio.Event()
+
+    async def process_update(self, update: object) -> None:
+        try:
+            await super().process_update(update)
+        finally:
+            self.latencies.append(time.perf_counter() - self.enqueued.pop(update.update_id))
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.finished.set()
+
+
+def synthetic_recording(dialogs: int, interval: float, think_time: float) -> list:
+    """
+    Создает запись диалогов /request разных пользователей (в формате UpdateRecorder.load).
+
+    :param dialogs: Количество диалогов.
+    :param interval: Интервал между началами диалогов в секундах.
+    :param think_time: Пауза пользователя между сообщениями диалога в секундах.
+    :return: Список кортежей (время, обновление), упорядоченный по времени.
+    """
+    messages = []
+    for i in range(dialogs):
+        user_id, user_name, _, problem_description, contact_info, contact_time = synthetic_request(i)
+        user_id = int(user_id) + i  # Отдельный пользователь для каждого диалога
+        for step, text in enumerate(('/request', problem_description, user_name, contact_info, contact_time)):
+            messages.append((i * interval + step * think_time, user_id, text))
+    messages.sort(key=lambda message: message[0])
+
+    records = []
+    for update_id, (offset, user_id, text) in enumerate(messages, start=1):
+        message = {'message_id': update_id, 'date': int(offset), 'chat': {'id': user_id, 'type': 'private'},
+                   'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'}, 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        records.append((offset, {'update_id': update_id, 'message': message}))
+    return records
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Возвращает перцентиль выборки (ближайшее значение сверху).
+
+    :param values: Отсортированная выборка.
+    :param percent: Перцентиль (от 0 до 100).
+    :return: Значение перцентиля.
+    """
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def replay(records: list, speed: float, api: FakeBotApi, concurrent_updates: int = 1,
+                 drain=None) -> dict:
+    """
+    Воспроизводит записанные обновления через обработчики CommandsFactory.
+
+    :param records: Список кортежей (время получения, обновление).
+    :param speed: Множитель скорости (2 - вдвое быстрее записи, 0 - без пауз между обновлениями).
+    :param api: Замена Bot API.
+    :param concurrent_updates: Количество одновременно обрабатываемых обновлений (1 - как в боте).
+    :param drain: Функция без аргументов, ожидающая завершения отложенной записи в базу данных.
+    :return: Словарь результатов.
+    """
+    writes = []
+    listener = writes.append
+    BotDatabase.add_write_listener(listener)
+
+    application = (ApplicationBuilder().token(FAKE_TOKEN).application_class(ReplayApplication).request(api)
+                   .updater(None).concurrent_updates(concurrent_updates).build())
+    CommandsFactory.create_commands(application)
+    application.track(len(records))
+
+    async def count_error(update, context) -> None:
+        application.errors += 1
+
+    application.add_error_handler(count_error)
+
+    try:
+        async with application:
+            await application.start()
+            start = time.perf_counter()
+            first = records[0][0]
+            for offset, data in records:
+                if speed:
+                    delay = (offset - first) / speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                update = Update.de_json(data, application.bot)
+                application.enqueued[update.update_id] = time.perf_counter()
+                await application.update_queue.put(update)
+            await application.finished.wait()
+            if drain is not None:
+                await asyncio.to_thread(drain)
+            duration = time.perf_counter() - start
+            await application.stop()
+    finally:
+        BotDatabase.write_listeners.remove(listener)
+
+    latencies = sorted(application.latencies)
+    results = {
+        'updates': len(records),
+        'errors': application.errors,
+        'duration_seconds': duration,
+        'throughput_updates_per_second': len(records) / duration,
+        'db_writes': sum(writes),
+        'db_writes_per_second': sum(writes) / duration,
+        'api_calls': sum(api.calls.values()),
+    }
+    for percent in PERCENTILES:
+        results[f'latency_p{percent}_ms'] = percentile(latencies, percent) * 1000
+    results['latency_max_ms'] = latencies[-1] * 1000
+    return results
+
+
+def run(records: list, speed: float, api_latency: float, concurrent_updates: int, storage: str) -> dict:
+    """
+    Готовит временную базу данных и выбранный способ записи заявок, затем воспроизводит обновления.
+
+    :param records: Список кортежей (время получения, обновление).
+    :param speed: Множитель скорости.
+    :param api_latency: Задержка ответов Bot API в секундах.
+    :param concurrent_updates: Количество одновременно обрабатываемых обновлений.
+    :param storage: Способ записи заявок: database (напрямую), outbox (журнал) или writer (сервис записи).
+    :return: Словарь результатов.
+    """
+    work_dir = tempfile.mkdtemp()
+    saved = dict(config['db'])
+    config['db'].update(database_path=os.path.join(work_dir, 'replay.db'), outbox_path=None, writer_socket=None)
+    BotDatabase(config['db']['database_path']).create_tables()
+    writer, drain = None, None
+    try:
+        if storage == 'outbox':
+            config['db']['outbox_path'] = os.path.join(work_dir, 'outbox.log')
+            drain = Outbox.open(config['db']['outbox_path'], config['db']['database_path']).wait
+        elif storage == 'writer':
+            config['db']['writer_socket'] = os.path.join(work_dir, 'writer.sock')
+            writer = DatabaseWriter(config['db']['database_path'], config['db']['writer_socket'])
+            writer.start()
+        return asyncio.run(replay(records, speed, FakeBotApi(api_latency), concurrent_updates, drain))
+    finally:
+        if writer is not None:
+            writer.stop()
+        config['db'].clear()
+        config['db'].update(saved)
+        shutil.rmtree(work_dir)
+
+
+def main() -> None:
+    """
+    Главная функция для обработки аргументов командной строки и запуска воспроизведения.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Replay recorded Telegram updates against the bot handlers.')
+
+    parser.add_argument('recording', nargs='?', help='Recorded updates (see recorder.py)')
+    parser.add_argument('-s', '--speed', type=float, default=1.0, help='Speed multiplier (0 - as fast as possible)')
+    parser.add_argument('--synthetic', type=int, metavar='DIALOGS', help='Replay synthetic /request dialogs')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between synthetic dialog starts')
+    parser.add_argument('--think-time', type=float, default=5.0, help='Seconds between synthetic dialog messages')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='Bot API response delay in milliseconds')
+    parser.add_argument('-c', '--concurrent-updates', type=int, default=1, help='Updates processed concurrently')
+    parser.add_argument('--storage', choices=['database', 'outbox', 'writer'], default='database',
+                        help='How requests are written')
+
+    args = parser.parse_args()
+    if args.synthetic:
+        records = synthetic_recording(args.synthetic, args.interval, args.think_time)
+    elif args.recording:
+        records = UpdateRecorder.load(args.recording)
+    else:
+        parser.error('a recording or --synthetic is required')
+    if not records:
+        parser.error('the recording is empty')
+
+    results = run(records, args.speed, args.api_latency / 1000, args.concurrent_updates, args.storage)
+    for name, value in results.items():
+        print(f'{name:<30} {value:10.3f}' if isinstance(value, float) else f'{name:<30} {value:10d}')
+
+
+if __name__ == '__main__':
+    """
+    Этот модуль можно запустить напрямую через терминал в формате:
+    `python benchmarks/replay.py <файл записи> -s <множитель скорости>`, тем самым воспроизведя
+    записанные ботом обновления (config['bot']['record_updates'], см. recorder.py) против обработчиков
+    команд с локальной заменой Bot API. Без записи можно воспроизвести синтетические диалоги /request:
+    `python benchmarks/replay.py --synthetic 1000 -s 0`.
+    """
+    main()
@@ -1,8 +1,15 @@
 import logging
 from telegram.ext import ApplicationBuilder
+from archive import RequestArchive
 from commands import CommandsFactory
 from dbscripts import BotDatabase
-from pageupd import GithubPageUpdater
+from metrics import metrics
+from outbox import Outbox
+from pageupd import GithubPageUpdater, PublishTrigger
+from recorder import UpdateRecorder
+from search import SearchIndex
+from workers import WorkerPool
+from writer import DatabaseWriter
 try:
     from config import config
 except ImportError:
@@ -16,20 +23,29 @@ logging.basicConfig(
 
 
 class Bot:
-    def __init__(self, token: str) -> None:
+    def __init__(self, token: str, worker_pool: WorkerPool = None) -> None:
         """
         Инициализация бота.
 
         Этот метод создает экземпляр бота и привязывает команды к приложению.
+        Если передан пул процессов, бот только получает обновления и пересылает их
+        процессам-обработчикам, а команды выполняются в них.
 
         Параметры:
         token (str): Токен для аутентификации бота в API.
+        worker_pool (WorkerPool): Пул процессов-обработчиков.
 
         Возвращает:
         None: Этот метод ничего не возвращает.
         """
         self.application = ApplicationBuilder().token(token).build()
-        self.commands = CommandsFactory.create_commands(self.application)
+        self.worker_pool = worker_pool
+        if worker_pool is not None:
+            worker_pool.setup(self.application)
+            self.commands = []
+        else:
+            self.commands = CommandsFactory.create_commands(self.application)
+        metrics.gauge('bot_update_queue_size', self.application.update_queue.qsize)
 
     def run(self) -> None:
         """
@@ -40,7 +56,13 @@ class Bot:
         Возвращает:
         None: Этот метод ничего не возвращает.
         """
-        return self.application.run_polling()
+        if self.worker_pool is None:
+            return self.application.run_polling()
+        self.worker_pool.start()
+        try:
+            return self.application.run_polling()
+        finally:
+            self.worker_pool.stop()
 
 
 def main() -> None:
@@ -54,17 +76,64 @@ def main() -> None:
     Возвращает:
     None: Эта функция ничего не возвращает.
     """
+    # Сервис записи: единственный писатель базы данных для процессов-обработчиков. Заявки записываются
+    # либо через него, либо через журнал Outbox: иначе журнал открывался бы, но не использовался
+    writer_socket = config['db'].get('writer_socket')
+    workers = config['bot'].get('workers')
+    if workers and not writer_socket:
+        raise ValueError("Для config['bot']['workers'] нужен config['db']['writer_socket']")
+    if writer_socket and config['db'].get('outbox_path'):
+        raise ValueError("config['db']['writer_socket'] и config['db']['outbox_path'] нельзя задавать вместе")
+
     # Инициализация базы данных
     database = BotDatabase(config['db']['database_path'])
     database.create_tables()
 
+    if writer_socket:
+        DatabaseWriter(config['db']['database_path'], writer_socket).start()
+
+    # Перенос в базу данных заявок, оставшихся в журнале после прошлого запуска
+    if config['db'].get('outbox_path'):
+        Outbox.open(config['db']['outbox_path'], config['db']['database_path'])
+
+    # Поисковый индекс обновляется в фоновом потоке после каждой записи заявок (сначала индексируются накопившиеся)
+    if config['db'].get('search_index'):
+        search_index = SearchIndex(config['db']['database_path'])
+        search_index.start()
+        BotDatabase.add_write_listener(search_index.notify)
+    else:
+        SearchIndex.disable(config['db']['database_path'])
+
     # Инициализация и запуск UpdateGithubPage
     updater = GithubPageUpdater(**config['pageupd'])
     scheduler = updater.run_on_schedule(**config['update_time'])
 
+    # Публикация вскоре после записи новых заявок (ежедневная публикация остается запасной)
+    if config.get('publish_trigger'):
+        trigger = PublishTrigger(updater.publish, scheduler, **config['publish_trigger'])
+        BotDatabase.add_write_listener(trigger.on_write)
+
+    # Ежедневный перенос старых заявок в архив и очистка базы, если задана папка архива
+    archive_config = config.get('archive', {})
+    if archive_config.get('archive_dir'):
+        request_archive = RequestArchive(
+            config['db']['database_path'], archive_config['archive_dir'], archive_config.get('max_age_days', 365))
+        request_archive.add_job(scheduler, archive_config.get('hour', 3), archive_config.get('minutes', 0))
+
+    # Запуск эндпоинта метрик и/или периодической записи метрик в лог, если они настроены
+    metrics_config = config.get('metrics', {})
+    if metrics_config.get('port') is not None:
+        metrics.serve(metrics_config['port'])
+    if metrics_config.get('log_interval'):
+        metrics.log_periodically(metrics_config['log_interval'])
+
     try:
         # Запуск бота
-        bot = Bot(config['bot']['telegram_token'])
+        token = config['bot']['telegram_token']
+        bot = Bot(token, WorkerPool(token, workers) if workers else None)
+        # Запись обезличенных обновлений для воспроизведения нагрузки (benchmarks/replay.py)
+        if config['bot'].get('record_updates'):
+            UpdateRecorder(config['bot']['record_updates']).setup(bot.application)
         bot.run()
 
         # Держим главный поток живым, чтобы позволить планировщику работать
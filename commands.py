@@ -1,4 +1,9 @@
+import asyncio
+import os
 import re
+import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
 from telegram.ext import CommandHandler, MessageHandler, filters
 
@@ -9,6 +14,11 @@ except ImportError:
     config = test_config
 
 from dbscripts import BotDatabase
+from expdata import EXPORT_WRITERS, ExportCancelled, ExportData
+from metrics import metrics
+from outbox import Outbox
+from search import SearchIndex
+from writer import WriterClient
 
 
 class Commands(ABC):
@@ -113,6 +123,7 @@ class StartCommand(Commands):
         start_handler = CommandHandler('start', self.run)
         bot.add_handler(start_handler)
 
+    @metrics.timed('bot_handler_seconds', handler='start')
     async def run(self, update, context) -> None:
         """
         Обрабатывает команду /start.
@@ -158,6 +169,7 @@ class HelpCommand(Commands):
         help_handler = CommandHandler('help', self.run)
         bot.add_handler(help_handler)
 
+    @metrics.timed('bot_handler_seconds', handler='help')
     async def run(self, update, context) -> None:
         """
         Обрабатывает команду /help.
@@ -203,6 +215,7 @@ class SettingsCommand(Commands):
         settings_handler = CommandHandler('settings', self.run)
         bot.add_handler(settings_handler)
 
+    @metrics.timed('bot_handler_seconds', handler='settings')
     async def run(self, update, context) -> None:
         """
         Обрабатывает команду /settings.
@@ -253,6 +266,7 @@ class RequestCommand(Commands):
         bot.add_handler(request_handler)
         bot.add_handler(script_handler)
 
+    @metrics.timed('bot_handler_seconds', handler='request')
     async def run(self, update, context) -> None:
         """
         Запускает процесс создания заявки.
@@ -275,6 +289,7 @@ class RequestCommand(Commands):
             context.user_data.clear()  # Сброс состояния
             await self.run(update, context)
 
+    @metrics.timed('bot_handler_seconds', handler='request_step_1')
     async def _step_1(self, update, context) -> None:
         """
         Обрабатывает первый шаг процесса создания заявки.
@@ -292,6 +307,7 @@ class RequestCommand(Commands):
         context.user_data['problem_description'] = update.message.text
         await context.bot.send_message(chat_id=update.effective_chat.id, text=self.USER_NAME_QUESTION)
 
+    @metrics.timed('bot_handler_seconds', handler='request_step_2')
     async def _step_2(self, update, context) -> None:
         """
         Обрабатывает второй шаг процесса создания заявки.
@@ -316,6 +332,7 @@ class RequestCommand(Commands):
         else:
             await context.bot.send_message(chat_id=update.effective_chat.id, text=self.NAME_ERROR)
 
+    @metrics.timed('bot_handler_seconds', handler='request_step_3')
     async def _step_3(self, update, context) -> None:
         """
         Обрабатывает третий шаг процесса создания заявки.
@@ -354,12 +371,17 @@ class RequestCommand(Commands):
         else:
             await context.bot.send_message(chat_id=update.effective_chat.id, text=self.PHONE_NUMBER_ERROR)
 
+    @metrics.timed('bot_handler_seconds', handler='request_step_4')
     async def _step_4(self, update, context) -> None:
         """
         Обрабатывает четвертый шаг процесса создания заявки.
 
         Этот метод сохраняет данные пользователя в базе данных и отправляет
-        сообщение о том, что заявка принята.
+        сообщение о том, что заявка принята. Если в конфигурации указан
+        config['db']['outbox_path'], заявка записывается в надежный журнал
+        (см. outbox.py), и ответ не ждет записи в базу данных. Если указан
+        config['db']['writer_socket'], заявка записывается через сервис записи (см. writer.py).
+        Оба параметра вместе bot.main не допускает.
 
         Параметры:
         update: Объект обновления, содержащий информацию о сообщении.
@@ -369,15 +391,22 @@ class RequestCommand(Commands):
         None: Этот метод ничего не возвращает.
         """
         context.user_data['contact_time'] = update.message.text
-        database = BotDatabase(config['db']['database_path'])
+        outbox_path = config['db'].get('outbox_path')
+        if config['db'].get('writer_socket'):
+            storage = WriterClient.open(config['db']['writer_socket'])
+        elif outbox_path:
+            storage = Outbox.open(outbox_path, config['db']['database_path'])
+        else:
+            storage = BotDatabase(config['db']['database_path'])
 
-        await database.save_user_data(
+        await storage.save_user_data(
             user_id=update.effective_user.id,
             request_id=update.update_id,
             **context.user_data)
 
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id, text=self.FINAL_TEXT.format(context.user_data['user_name']))
+        with metrics.time('bot_send_message_seconds', handler='request_step_4'):
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id, text=self.FINAL_TEXT.format(context.user_data['user_name']))
         context.user_data.clear()  # Сброс состояния
 
     async def _next_step(self, update, context) -> None:
@@ -398,6 +427,242 @@ class RequestCommand(Commands):
             await getattr(self, f'_step_{len(context.user_data)}')(update, context)
 
 
+class StatsCommand(Commands):
+    """
+    Команда администратора для просмотра статистики заявок.
+
+    Эта команда обрабатывает команду /stats только от пользователей из
+    config['bot']['admin_ids']; для остальных она считается неизвестной.
+    Статистика читается из таблиц, которые обновляются при записи заявок
+    (см. BotDatabase.request_stats), поэтому заявки не расшифровываются.
+    """
+    STATS_TEXT = "Заявок сегодня: {today}\nЗа 7 дней: {week}\nВсего: {total}\nПользователей: {users}"
+    HOURS_TEXT = "\n\nПо часам (UTC, последние 24 ч):\n{}"
+
+    def setup(self, bot) -> None:
+        """
+        Настраивает команду для указанного бота.
+
+        Этот метод привязывает команду /stats к обработчику, который
+        будет вызывать метод `run` только для администраторов.
+
+        Параметры:
+        bot: Объект бота, к которому будет привязана команда.
+
+        Возвращает:
+        None: Этот метод ничего не возвращает.
+        """
+        admins = filters.User(user_id=config['bot'].get('admin_ids') or [])
+        stats_handler = CommandHandler('stats', self.run, filters=admins)
+        bot.add_handler(stats_handler)
+
+    @metrics.timed('bot_handler_seconds', handler='stats')
+    async def run(self, update, context) -> None:
+        """
+        Отправляет администратору статистику заявок.
+
+        Параметры:
+        update: Объект обновления, содержащий информацию о сообщении.
+        context: Контекст, содержащий информацию о состоянии бота.
+
+        Возвращает:
+        None: Этот метод ничего не возвращает.
+        """
+        database = BotDatabase(config['db']['database_path'])
+        stats = await asyncio.to_thread(database.request_stats)
+
+        text = self.STATS_TEXT.format(**stats)
+        hours = [f"{time.strftime('%H:00', time.gmtime(hour * 3600))} - {requests}"
+                 for hour, requests in stats['hours'] if requests]
+        if hours:
+            text += self.HOURS_TEXT.format('\n'.join(hours))
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+
+class ExportCommand(Commands):
+    """
+    Команда администратора для выгрузки таблицы файлом в Telegram.
+
+    Команда /export <таблица> [формат] запускает ExportData.export_many в отдельном потоке
+    и сразу завершает обработчик, поэтому остальные обновления обрабатываются во время
+    выгрузки. Файл пишется во временный файл (в памяти до SPOOL_MAX_SIZE байт, дальше на
+    диске) и отправляется документом. Ход выгрузки показывается в редактируемом сообщении,
+    а /export cancel прерывает выгрузку. Команда доступна только пользователям из
+    config['bot']['admin_ids'].
+    """
+    USAGE_TEXT = "Использование: /export <users|requests> [word|excel|csv|html] или /export cancel."
+    PROGRESS_TEXT = "Выгрузка таблицы {}: записано строк {}..."
+    DONE_TEXT = "Выгрузка таблицы {} готова."
+    RUNNING_TEXT = "Выгрузка уже выполняется. Чтобы прервать ее, отправьте /export cancel."
+    CANCEL_TEXT = "Выгрузка прервана."
+    NO_EXPORT_TEXT = "Нет выполняющейся выгрузки."
+    ERROR_TEXT = "Не удалось выгрузить таблицу {}."
+    TOO_LARGE_TEXT = "Файл слишком большой для отправки в Telegram ({:.1f} МБ)."
+
+    DEFAULT_FORMAT = 'excel'
+    SPOOL_MAX_SIZE = 8 * 1024 * 1024  # Файл большего размера переносится из памяти на диск
+    UPLOAD_MAX_SIZE = 50 * 1024 * 1024  # Ограничение Bot API на размер отправляемого файла
+    PROGRESS_INTERVAL = 3  # Секунд между обновлениями сообщения о ходе выгрузки
+
+    def __init__(self):
+        """
+        Инициализирует команду.
+        """
+        self.exports = {}  # Выполняющиеся выгрузки: {chat_id: событие отмены}
+
+    def setup(self, bot) -> None:
+        """
+        Настраивает команду для указанного бота.
+
+        Этот метод привязывает команду /export к обработчику, который
+        будет вызывать метод `run` только для администраторов.
+
+        Параметры:
+        bot: Объект бота, к которому будет привязана команда.
+
+        Возвращает:
+        None: Этот метод ничего не возвращает.
+        """
+        admins = filters.User(user_id=config['bot'].get('admin_ids') or [])
+        export_handler = CommandHandler('export', self.run, filters=admins)
+        bot.add_handler(export_handler)
+
+    @metrics.timed('bot_handler_seconds', handler='export')
+    async def run(self, update, context) -> None:
+        """
+        Запускает выгрузку таблицы в фоне или прерывает выполняющуюся выгрузку.
+
+        Параметры:
+        update: Объект обновления, содержащий информацию о сообщении.
+        context: Контекст, содержащий информацию о состоянии бота.
+
+        Возвращает:
+        None: Этот метод ничего не возвращает.
+        """
+        chat_id = update.effective_chat.id
+        args = context.args or []
+        if args == ['cancel']:
+            if chat_id in self.exports:
+                self.exports[chat_id].set()  # Сообщение об отмене отправит сама выгрузка
+            else:
+                await context.bot.send_message(chat_id=chat_id, text=self.NO_EXPORT_TEXT)
+            return
+        if chat_id in self.exports:
+            await context.bot.send_message(chat_id=chat_id, text=self.RUNNING_TEXT)
+            return
+        table_name, method = (*args, self.DEFAULT_FORMAT)[:2] if args else (None, None)
+        if len(args) > 2 or table_name not in BotDatabase.ENCRYPTED_COLUMNS or method not in EXPORT_WRITERS:
+            await context.bot.send_message(chat_id=chat_id, text=self.USAGE_TEXT)
+            return
+
+        self.exports[chat_id] = threading.Event()
+        context.application.create_task(self._export(context.bot, chat_id, table_name, method), update=update)
+
+    async def _export(self, bot, chat_id: int, table_name: str, method: str) -> None:
+        """
+        Выгружает таблицу во временный файл в отдельном потоке и отправляет его документом.
+
+        Параметры:
+        bot: Объект бота.
+        chat_id (int): Чат администратора.
+        table_name (str): Имя таблицы.
+        method (str): Формат файла (ключ EXPORT_WRITERS).
+        """
+        cancelled = self.exports[chat_id]
+        rows_done = 0
+
+        def progress(rows: int) -> None:
+            nonlocal rows_done
+            if cancelled.is_set():
+                raise ExportCancelled  # Прерывает ExportData.export_many
+            rows_done = rows
+
+        try:
+            message = await bot.send_message(chat_id=chat_id, text=self.PROGRESS_TEXT.format(table_name, 0))
+            with tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_SIZE) as output:
+                job = asyncio.ensure_future(asyncio.to_thread(
+                    ExportData.export_many, config['db']['database_path'], table_name, {method: output},
+                    archive_dir=config.get('archive', {}).get('archive_dir'), progress=progress))
+                shown = 0
+                while not job.done():
+                    await asyncio.wait({job}, timeout=self.PROGRESS_INTERVAL)
+                    if not job.done() and rows_done != shown:
+                        shown = rows_done
+                        await message.edit_text(self.PROGRESS_TEXT.format(table_name, shown))
+
+                # Отмена, пришедшая после завершения выгрузки, не мешает отправить готовый файл
+                if not job.result():
+                    await message.edit_text(
+                        self.CANCEL_TEXT if cancelled.is_set() else self.ERROR_TEXT.format(table_name))
+                elif output.seek(0, os.SEEK_END) > self.UPLOAD_MAX_SIZE:
+                    await message.edit_text(self.TOO_LARGE_TEXT.format(output.tell() / 1024 / 1024))
+                else:
+                    output.seek(0)
+                    await bot.send_document(
+                        chat_id=chat_id, document=output, filename=f'{table_name}.{EXPORT_WRITERS[method].extension}')
+                    await message.edit_text(self.DONE_TEXT.format(table_name))
+        finally:
+            del self.exports[chat_id]
+
+
+class SearchCommand(Commands):
+    """
+    Команда администратора для поиска заявок по словам описания проблемы.
+
+    Эта команда обрабатывает команду /search <слова> только от пользователей из
+    config['bot']['admin_ids'] и ищет заявки в зашифрованном поисковом индексе
+    (см. search.py), расшифровывая только найденные заявки.
+    """
+    USAGE_TEXT = "Использование: /search <слова из описания проблемы>."
+    NOT_FOUND_TEXT = "Заявки не найдены."
+    RESULT_TEXT = "{request_id} ({contact_time}): {problem_description}"
+    MAX_RESULTS = 20
+    MAX_DESCRIPTION = 200  # Символов описания в ответе
+    MAX_MESSAGE = 4096  # Ограничение Telegram на длину сообщения
+
+    def setup(self, bot) -> None:
+        """
+        Настраивает команду для указанного бота.
+
+        Этот метод привязывает команду /search к обработчику, который
+        будет вызывать метод `run` только для администраторов.
+
+        Параметры:
+        bot: Объект бота, к которому будет привязана команда.
+
+        Возвращает:
+        None: Этот метод ничего не возвращает.
+        """
+        admins = filters.User(user_id=config['bot'].get('admin_ids') or [])
+        search_handler = CommandHandler('search', self.run, filters=admins)
+        bot.add_handler(search_handler)
+
+    @metrics.timed('bot_handler_seconds', handler='search')
+    async def run(self, update, context) -> None:
+        """
+        Отправляет администратору найденные заявки.
+
+        Параметры:
+        update: Объект обновления, содержащий информацию о сообщении.
+        context: Контекст, содержащий информацию о состоянии бота.
+
+        Возвращает:
+        None: Этот метод ничего не возвращает.
+        """
+        query = ' '.join(context.args or [])
+        if not SearchIndex.query_terms(query):
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=self.USAGE_TEXT)
+            return
+
+        search_index = SearchIndex(config['db']['database_path'])
+        requests = await asyncio.to_thread(search_index.search, query, self.MAX_RESULTS)
+        lines = [self.RESULT_TEXT.format(**dict(
+            request, problem_description=request['problem_description'][:self.MAX_DESCRIPTION]))
+            for request in requests]
+        text = '\n\n'.join(lines)[:self.MAX_MESSAGE] if lines else self.NOT_FOUND_TEXT
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+
 class UnknownCommand(Commands):
     """
     Команда для обработки неизвестных команд.
@@ -424,6 +689,7 @@ class UnknownCommand(Commands):
         unknown_handler = MessageHandler(filters.COMMAND, self.run)
         bot.add_handler(unknown_handler)
 
+    @metrics.timed('bot_handler_seconds', handler='unknown')
     async def run(self, update, context):
         """
         Обрабатывает неизвестные команды.
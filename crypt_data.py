@@ -1,4 +1,14 @@
-from cryptography.fernet import Fernet
+import asyncio
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from metrics import metrics
 try:
     from config import config
 except ImportError:
@@ -8,29 +18,288 @@ except ImportError:
 
 class Crypt:
     """
-    Класс для шифрования и дешифрования данных с использованием Fernet.
+    Класс для шифрования и дешифрования данных с использованием Fernet или AEAD.
+
+    Данные шифруются ключом config['db']['key'], а расшифровываются любым из ключей
+    config['db']['key'] и config['db']['old_keys'] (необязательный список). Это позволяет
+    сменить ключ без остановки бота: новый ключ становится основным, старый переносится
+    в old_keys, а существующие строки перешифровываются скриптом rotate.py.
+
+    Для поиска пользователя без расшифровки используется детерминированный ключ
+    (HMAC-SHA256 от user_id) на отдельном ключе config['db']['index_key']. Если он не
+    задан, ключ выводится из основного ключа шифрования; тогда после смены основного
+    ключа ключи пользователей пересчитываются, а поисковый индекс перестраивается в конце
+    rotate.py (вручную - python dbscripts.py <путь> --compact_users и python search.py <путь>
+    --rebuild). На том же ключе (с разными префиксами) вычисляются токены поискового индекса
+    (search_token) и псевдонимы пользователей в записях обновлений (pseudonym).
+
+    Если включен config['db']['row_envelope'], значения строки хранятся не отдельными токенами
+    в каждом столбце, а одним токеном в столбце row_token (см. seal_values): открытый текст
+    токена - байт версии формата (ROW_FORMAT_VERSION) и компактный JSON-массив значений.
+    Читаются оба формата.
+
+    Алгоритм шифрования выбирается в config['db']['cipher']: 'fernet' (по умолчанию,
+    текстовые токены), 'aes-gcm' или 'chacha20' (AES-256-GCM или ChaCha20-Poly1305). Токены AEAD
+    хранятся как BLOB: байт версии (AEAD_VERSIONS), 4 байта отпечатка ключа, 12 байт nonce и
+    шифротекст с тегом. Ключ AEAD выводится из ключа Fernet, поэтому old_keys работают так же.
+    Расшифровываются токены любого алгоритма; перевести старые строки на новый алгоритм можно
+    скриптом rotate.py. При публикации без расшифровки токены AEAD выводятся в base64 (to_text).
+
+    Асинхронные методы (encrypt_data, encrypt_row, encrypt_rows, decrypt_many) выполняют
+    шифрование в отдельном пуле потоков (config['db']['crypto_workers'] потоков), а не в цикле
+    событий: cryptography освобождает GIL в коде на C, поэтому длинная заявка одного
+    пользователя не задерживает ответы другим. Пакетные методы шифруют много значений за один
+    переход в пул. Синхронные методы (encrypt_values, encrypt_row_values) остаются для кода без
+    цикла событий.
     """
+    ROW_FORMAT_VERSION = 1  # Версия формата запечатанной строки (первый байт открытого текста)
+    AEAD_VERSIONS = {'aes-gcm': (1, AESGCM), 'chacha20': (2, ChaCha20Poly1305)}
+    FERNET_PREFIX = 'gAAAAA'  # Начало любого текстового токена Fernet (байт версии 0x80 и время)
+    NONCE_SIZE = 12
+    SEARCH_TOKEN_SIZE = 8  # Байт HMAC в токене поискового индекса
+
+    @staticmethod
+    def fernet() -> MultiFernet:
+        """
+        Возвращает объект шифрования для текущих ключей из конфигурации.
+
+        Возвращает:
+        MultiFernet: Шифрует основным ключом, расшифровывает любым из ключей.
+        """
+        return Crypt._multi_fernet(config['db']['key'], tuple(config['db'].get('old_keys', ())))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def _multi_fernet(key: bytes, old_keys: tuple) -> MultiFernet:
+        """
+        Создает (и кэширует) объект шифрования для набора ключей.
+
+        Параметры:
+        key (bytes): Основной ключ.
+        old_keys (tuple): Старые ключи, которые принимаются только при расшифровке.
+
+        Возвращает:
+        MultiFernet: Объект шифрования.
+        """
+        return MultiFernet([Fernet(key), *(Fernet(old_key) for old_key in old_keys)])
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _executor() -> ThreadPoolExecutor:
+        """
+        Возвращает общий пул потоков для шифрования из асинхронного кода.
+
+        Возвращает:
+        ThreadPoolExecutor: Пул из config['db']['crypto_workers'] потоков (по умолчанию - как у Python).
+        """
+        return ThreadPoolExecutor(config['db'].get('crypto_workers'), thread_name_prefix='crypt')
+
+    @staticmethod
+    async def _offload(func, *args):
+        """
+        Выполняет функцию в пуле потоков шифрования, не блокируя цикл событий.
+
+        Параметры:
+        func (callable): Синхронная функция.
+        *args: Аргументы функции.
+
+        Возвращает:
+        Результат функции.
+        """
+        return await asyncio.get_running_loop().run_in_executor(Crypt._executor(), func, *args)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def _aead_ciphers(key: bytes, old_keys: tuple) -> dict:
+        """
+        Создает (и кэширует) объекты AEAD для набора ключей.
+
+        Параметры:
+        key (bytes): Основной ключ (ключ Fernet).
+        old_keys (tuple): Старые ключи.
+
+        Возвращает:
+        dict: Словарь {(байт версии, отпечаток ключа): объект AEAD}; первыми идут объекты основного ключа.
+        """
+        ciphers = {}
+        for fernet_key in (key, *old_keys):
+            aead_key = hmac.new(base64.urlsafe_b64decode(fernet_key), b'bsmdb aead', hashlib.sha256).digest()
+            key_id = hashlib.sha256(aead_key).digest()[:4]
+            for version, cipher_class in Crypt.AEAD_VERSIONS.values():
+                ciphers.setdefault((version, key_id), cipher_class(aead_key))
+        return ciphers
+
+    @staticmethod
+    def encrypt_bytes(data: bytes):
+        """
+        Шифрует байты алгоритмом из конфигурации основным ключом.
+
+        Параметры:
+        data (bytes): Открытый текст.
+
+        Возвращает:
+        str | bytes: Текстовый токен Fernet или BLOB-токен AEAD.
+        """
+        cipher = config['db'].get('cipher', 'fernet')
+        if cipher == 'fernet':
+            return Crypt.fernet().encrypt(data).decode()
+
+        version = Crypt.AEAD_VERSIONS[cipher][0]
+        ciphers = Crypt._aead_ciphers(config['db']['key'], tuple(config['db'].get('old_keys', ())))
+        key_id, aead = next((key_id, aead) for (item_version, key_id), aead in ciphers.items() if item_version == version)
+        nonce = os.urandom(Crypt.NONCE_SIZE)
+        return bytes([version]) + key_id + nonce + aead.encrypt(nonce, data, None)
+
+    @staticmethod
+    def decrypt_bytes(token) -> bytes:
+        """
+        Расшифровывает токен любого алгоритма.
+
+        Параметры:
+        token (str | bytes): Токен Fernet, BLOB-токен AEAD или его base64-представление.
+
+        Возвращает:
+        bytes: Открытый текст.
+
+        Исключения:
+        cryptography.fernet.InvalidToken, cryptography.exceptions.InvalidTag: Если токен поврежден
+        или выпущен неизвестным ключом.
+        """
+        if isinstance(token, str):
+            if token.startswith(Crypt.FERNET_PREFIX):
+                return Crypt.fernet().decrypt(token.encode())
+            token = base64.urlsafe_b64decode(token)
+
+        ciphers = Crypt._aead_ciphers(config['db']['key'], tuple(config['db'].get('old_keys', ())))
+        aead = ciphers.get((token[0], bytes(token[1:5])))
+        if aead is None:
+            raise InvalidToken
+        nonce_end = 5 + Crypt.NONCE_SIZE
+        return aead.decrypt(bytes(token[5:nonce_end]), bytes(token[nonce_end:]), None)
+
+    @staticmethod
+    def rotate_value(token):
+        """
+        Перешифровывает токен основным ключом и алгоритмом из конфигурации.
+
+        Параметры:
+        token (str | bytes): Токен любого алгоритма.
+
+        Возвращает:
+        str | bytes: Новый токен.
+        """
+        if config['db'].get('cipher', 'fernet') == 'fernet' and isinstance(token, str) \
+                and token.startswith(Crypt.FERNET_PREFIX):
+            return Crypt.fernet().rotate(token.encode()).decode()  # Сохраняет время создания токена
+        return Crypt.encrypt_bytes(Crypt.decrypt_bytes(token))
+
+    @staticmethod
+    def to_text(value):
+        """
+        Возвращает текстовое представление токена (BLOB-токены AEAD кодируются в base64).
+
+        Параметры:
+        value: Значение столбца.
+
+        Возвращает:
+        Значение, пригодное для текстовых форматов (HTML, CSV, JSON).
+        """
+        return base64.urlsafe_b64encode(value).decode() if isinstance(value, bytes) else value
+
+    @staticmethod
+    def from_text(value):
+        """
+        Возвращает токен в виде для хранения (base64-представление AEAD снова становится BLOB).
+
+        Параметры:
+        value: Токен или его текстовое представление.
+
+        Возвращает:
+        Значение для записи в базу данных.
+        """
+        if isinstance(value, str) and not value.startswith(Crypt.FERNET_PREFIX):
+            return base64.urlsafe_b64decode(value)
+        return value
+
+    @staticmethod
+    def user_key(user_id: str) -> str:
+        """
+        Возвращает детерминированный ключ пользователя для поиска и дедупликации.
+
+        Параметры:
+        user_id (str): Идентификатор пользователя.
+
+        Возвращает:
+        str: HMAC-SHA256 от идентификатора в шестнадцатеричном виде.
+        """
+        return hmac.new(Crypt._index_key(), str(user_id).encode(), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def search_token(term: str) -> bytes:
+        """
+        Возвращает токен слова для поискового индекса (слово по токену не восстанавливается).
+
+        Параметры:
+        term (str): Слово или начало слова в нижнем регистре.
+
+        Возвращает:
+        bytes: Первые SEARCH_TOKEN_SIZE байт HMAC-SHA256 от слова.
+        """
+        return hmac.new(Crypt._index_key(), b'search:' + term.encode(), hashlib.sha256).digest()[:Crypt.SEARCH_TOKEN_SIZE]
+
+    @staticmethod
+    def pseudonym(identifier: int) -> int:
+        """
+        Возвращает псевдоним идентификатора для обезличенных записей обновлений (см. recorder.py).
+
+        HMAC вычисляется с отдельным префиксом, поэтому псевдоним не совпадает с user_key
+        и по нему нельзя найти запись пользователя в базе данных.
+
+        Параметры:
+        identifier (int): Идентификатор пользователя или чата.
+
+        Возвращает:
+        int: Первые 6 байт HMAC-SHA256 как положительное число.
+        """
+        digest = hmac.new(Crypt._index_key(), b'recorder:' + str(identifier).encode(), hashlib.sha256).digest()
+        return int.from_bytes(digest[:6], 'big')
+
     @staticmethod
+    def _index_key() -> bytes:
+        """
+        Возвращает ключ для детерминированных ключей (config['db']['index_key'] или производный от основного).
+
+        Возвращает:
+        bytes: Ключ HMAC.
+        """
+        index_key = config['db'].get('index_key')
+        if index_key:
+            return index_key if isinstance(index_key, bytes) else index_key.encode()
+        key = config['db']['key']
+        return hmac.new(key if isinstance(key, bytes) else key.encode(), b'bsmdb user_key', hashlib.sha256).digest()
+
+    @staticmethod
+    @metrics.timed('crypto_seconds', operation='decrypt')
     def decrypt_data(data: str) -> str:
         """
         Дешифрует зашифрованные данные.
 
-        Этот метод принимает зашифрованные данные в виде строки и возвращает
-        их в расшифрованном виде.
+        Этот метод принимает зашифрованные данные (токен любого алгоритма, см. decrypt_bytes)
+        и возвращает их в расшифрованном виде.
 
         Параметры:
-        data (str): Зашифрованные данные в виде строки.
+        data (str | bytes): Зашифрованные данные.
 
         Возвращает:
         str: Расшифрованные данные в виде строки.
         """
-        fernet = Fernet(config['db']['key'])
-        return fernet.decrypt(data.encode()).decode()
+        return Crypt.decrypt_bytes(data).decode()
 
     @staticmethod
+    @metrics.timed('crypto_seconds', operation='encrypt')
     async def encrypt_data(*args: str) -> tuple:
         """
-        Шифрует данные.
+        Шифрует данные в пуле потоков, не блокируя цикл событий.
 
         Этот метод принимает произвольное количество аргументов и возвращает
         их в зашифрованном виде в виде кортежа.
@@ -41,5 +310,113 @@ class Crypt:
         Возвращает:
         tuple: Кортеж зашифрованных данных.
         """
-        fernet = Fernet(config['db']['key'])
-        return tuple(fernet.encrypt(str(arg).encode()).decode() for arg in args)
+        return await Crypt._offload(Crypt.encrypt_values, *args)
+
+    @staticmethod
+    @metrics.timed('crypto_seconds', operation='encrypt')
+    async def encrypt_row(*args: str) -> tuple:
+        """
+        Шифрует значения строки в формате хранения из конфигурации в пуле потоков.
+
+        Параметры:
+        *args (str): Значения зашифрованных столбцов строки.
+
+        Возвращает:
+        tuple: Значения столбцов и значение столбца row_token (см. encrypt_row_values).
+        """
+        return await Crypt._offload(Crypt.encrypt_row_values, *args)
+
+    @staticmethod
+    @metrics.timed('crypto_seconds', operation='encrypt_batch')
+    async def encrypt_rows(rows: list) -> list:
+        """
+        Шифрует несколько строк за один переход в пул потоков.
+
+        Параметры:
+        rows (list): Список кортежей значений зашифрованных столбцов.
+
+        Возвращает:
+        list: Список строк в формате encrypt_row_values.
+        """
+        return await Crypt._offload(lambda: [Crypt.encrypt_row_values(*row) for row in rows])
+
+    @staticmethod
+    @metrics.timed('crypto_seconds', operation='decrypt_batch')
+    async def decrypt_many(tokens: list) -> list:
+        """
+        Дешифрует несколько токенов за один переход в пул потоков.
+
+        Параметры:
+        tokens (list): Список токенов (None остается None).
+
+        Возвращает:
+        list: Список расшифрованных строк.
+        """
+        return await Crypt._offload(
+            lambda: [None if token is None else Crypt.decrypt_bytes(token).decode() for token in tokens])
+
+    @staticmethod
+    def encrypt_row_values(*args: str) -> tuple:
+        """
+        Шифрует значения строки синхронно в формате хранения из конфигурации.
+
+        Параметры:
+        *args (str): Значения зашифрованных столбцов строки.
+
+        Возвращает:
+        tuple: Токены столбцов и None в row_token, либо (при config['db']['row_envelope'])
+        None в столбцах и один токен строки в row_token.
+        """
+        if config['db'].get('row_envelope'):
+            return (*(None,) * len(args), Crypt.seal_values(*args))
+        return (*Crypt.encrypt_values(*args), None)
+
+    @staticmethod
+    def seal_values(*args: str) -> str:
+        """
+        Шифрует значения строки одним токеном.
+
+        Параметры:
+        *args (str): Значения строки.
+
+        Возвращает:
+        str | bytes: Токен с версией формата и JSON-массивом значений.
+        """
+        payload = json.dumps([str(arg) for arg in args], ensure_ascii=False, separators=(',', ':'))
+        return Crypt.encrypt_bytes(bytes([Crypt.ROW_FORMAT_VERSION]) + payload.encode())
+
+    @staticmethod
+    @metrics.timed('crypto_seconds', operation='decrypt_row')
+    def open_values(token) -> list:
+        """
+        Расшифровывает токен строки, созданный seal_values.
+
+        Параметры:
+        token (str | bytes): Токен строки.
+
+        Возвращает:
+        list: Значения строки.
+
+        Исключения:
+        ValueError: Если версия формата неизвестна.
+        """
+        payload = Crypt.decrypt_bytes(token)
+        if payload[0] != Crypt.ROW_FORMAT_VERSION:
+            raise ValueError(f'Неизвестная версия формата строки: {payload[0]}')
+        return json.loads(payload[1:].decode())
+
+    @staticmethod
+    def encrypt_values(*args: str) -> tuple:
+        """
+        Шифрует данные синхронно.
+
+        Этот метод используется там, где нет цикла событий (например, в процессах
+        массового импорта), и возвращает данные в том же виде, что и encrypt_data.
+
+        Параметры:
+        *args (str): Данные для шифрования.
+
+        Возвращает:
+        tuple: Кортеж зашифрованных данных.
+        """
+        return tuple(Crypt.encrypt_bytes(str(arg).encode()) for arg in args)
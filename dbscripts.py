@@ -1,6 +1,11 @@
 import argparse
+import logging
 import sqlite3
+import time
 from crypt_data import Crypt
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 
 class BotDatabase:
@@ -10,6 +15,59 @@ class BotDatabase:
     Этот класс предоставляет методы для создания таблиц и сохранения
     данных пользователей и их заявок в базе данных SQLite.
     """
+    # Зашифрованные столбцы каждой таблицы
+    ENCRYPTED_COLUMNS = {
+        'users': ('user_id', 'user_name', 'contact_info'),
+        'requests': ('request_id', 'user_id', 'problem_description', 'contact_time'),
+    }
+    # Столбец с токеном всей строки (Crypt.seal_values); в строках такого формата столбцы выше пустые
+    ROW_TOKEN_COLUMN = 'row_token'
+    # user_key (Crypt.user_key) одинаков для всех заявок пользователя, поэтому запись пользователя обновляется
+    INSERT_USER_SQL = """
+        INSERT INTO users (user_id, user_name, contact_info, row_token, user_key)
+        VALUES (?,?,?,?,?)
+        ON CONFLICT(user_key) DO UPDATE SET
+        user_id = excluded.user_id, user_name = excluded.user_name, contact_info = excluded.contact_info,
+        row_token = excluded.row_token"""
+    # created_at (время приема заявки, unix time) хранится открыто: по нему заявки переносятся в архив
+    INSERT_REQUEST_SQL = """
+        INSERT INTO requests (request_id, user_id, problem_description, contact_time, row_token, created_at)
+        VALUES(?,?,?,?,?, CAST(strftime('%s', 'now') AS INTEGER))"""
+    # Статистика для /stats: заявки по часам (unix time // 3600) и счетчик пользователей обновляются
+    # триггерами в той же транзакции, что и запись, при любом способе записи (бот, Outbox, сервис записи, импорт)
+    STATS_SQL = """
+        CREATE TABLE IF NOT EXISTS request_stats (hour INTEGER PRIMARY KEY, requests INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        CREATE TRIGGER IF NOT EXISTS request_stats_insert AFTER INSERT ON requests BEGIN
+            INSERT INTO request_stats (hour, requests) VALUES (COALESCE(NEW.created_at, 0) / 3600, 1)
+            ON CONFLICT(hour) DO UPDATE SET requests = requests + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_count_insert AFTER INSERT ON users BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'users';
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_count_delete AFTER DELETE ON users BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'users';
+        END;"""
+    # Поисковый индекс (search.py): токены слов описаний заявок. Строки удаленных (например, перенесенных
+    # в архив) заявок удаляются из индекса
+    SEARCH_SQL = """
+        CREATE TABLE IF NOT EXISTS search_index (
+        token BLOB, request_rowid INTEGER, PRIMARY KEY (token, request_rowid)) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS search_index_request ON search_index (request_rowid);
+        CREATE TABLE IF NOT EXISTS search_pending (request_rowid INTEGER PRIMARY KEY);
+        CREATE TRIGGER IF NOT EXISTS search_index_delete AFTER DELETE ON requests BEGIN
+            DELETE FROM search_index WHERE request_rowid = OLD.rowid;
+            DELETE FROM search_pending WHERE request_rowid = OLD.rowid;
+        END;"""
+    # Очередь индексации: новые заявки попадают в search_pending при любом способе записи. Триггер
+    # создается только при включенном индексе (SearchIndex.enable), иначе очередь росла бы без конца
+    SEARCH_PENDING_SQL = """
+        CREATE TRIGGER IF NOT EXISTS search_pending_insert AFTER INSERT ON requests BEGIN
+            INSERT OR IGNORE INTO search_pending (request_rowid) VALUES (NEW.rowid);
+        END;"""
+    # Функции, вызываемые после записи заявок (например, PublishTrigger.on_write)
+    write_listeners = []
+
     def __init__(self, path: str):
         """
         Инициализирует объект базы данных.
@@ -24,21 +82,47 @@ class BotDatabase:
         Создает таблицы в базе данных.
 
         Этот метод создает таблицы для пользователей и заявок, если они
-        еще не существуют.
+        еще не существуют. Новая база данных создается в режиме auto_vacuum = INCREMENTAL,
+        а в таблицы старой базы добавляются столбцы created_at, user_key и row_token. База данных переводится
+        в режим WAL, чтобы экспорты читали снимок и не блокировали запись заявок. Таблицы статистики
+        (STATS_SQL) при создании заполняются по уже записанным заявкам (заявки без created_at
+        учитываются только в общем количестве). Таблицы поискового индекса (SEARCH_SQL) создаются
+        пустыми: заявки ставятся в очередь индексации, только когда индекс включен (SearchIndex.enable).
         """
         connection = sqlite3.connect(self.path)
         cursor = connection.cursor()
         cursor.executescript("""
+            PRAGMA auto_vacuum = INCREMENTAL;
+            PRAGMA journal_mode = WAL;
             BEGIN;
-            CREATE TABLE IF NOT EXISTS users (user_id PRIMARY KEY, user_name, contact_info);
+            CREATE TABLE IF NOT EXISTS users (user_id PRIMARY KEY, user_name, contact_info, user_key TEXT, row_token);
             CREATE TABLE IF NOT EXISTS requests (
             request_id PRIMARY KEY,
             user_id,
             problem_description,
             contact_time,
+            created_at INTEGER,
+            row_token,
             FOREIGN KEY(user_id) REFERENCES users(user_id));
             END;
             """)
+        if 'created_at' not in [column[1] for column in cursor.execute("PRAGMA table_info(requests)")]:
+            cursor.execute("ALTER TABLE requests ADD COLUMN created_at INTEGER")
+        if 'user_key' not in [column[1] for column in cursor.execute("PRAGMA table_info(users)")]:
+            cursor.execute("ALTER TABLE users ADD COLUMN user_key TEXT")
+        for table_name in self.ENCRYPTED_COLUMNS:
+            if self.ROW_TOKEN_COLUMN not in [column[1] for column in cursor.execute(f"PRAGMA table_info({table_name})")]:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {self.ROW_TOKEN_COLUMN}")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_user_key ON users (user_key)")
+
+        stats_exist = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'request_stats'").fetchone()
+        cursor.executescript(f"BEGIN; {self.STATS_SQL} {self.SEARCH_SQL} COMMIT;")
+        if not stats_exist:
+            cursor.execute("""
+                INSERT INTO request_stats (hour, requests)
+                SELECT COALESCE(created_at, 0) / 3600, COUNT(*) FROM requests GROUP BY 1""")
+        cursor.execute("INSERT OR IGNORE INTO counters (name, value) SELECT 'users', COUNT(*) FROM users")
+        connection.commit()
         connection.close()
 
     async def save_user_data(self,
@@ -52,7 +136,7 @@ class BotDatabase:
         """
         Сохраняет данные пользователя и его заявку в базе данных.
 
-        Этот метод шифрует данные и сохраняет их в соответствующих таблицах.
+        Этот метод шифрует данные (в пуле потоков, в формате из Crypt.encrypt_rows) и сохраняет их в соответствующих таблицах.
 
         Параметры:
         user_id (str): Идентификатор пользователя.
@@ -62,31 +146,232 @@ class BotDatabase:
         contact_info (str): Контактная информация пользователя.
         contact_time (str): Предпочтительное время для связи.
         """
-        connection = sqlite3.connect(self.path)
+        # Обе строки шифруются за один переход в пул потоков
+        user_row, request_row = await Crypt.encrypt_rows(
+            [(user_id, user_name, contact_info), (request_id, user_id, problem_description, contact_time)])
+        user_row = (*user_row, Crypt.user_key(user_id))
+
+        with metrics.time('db_operation_seconds', operation='connect'):
+            connection = sqlite3.connect(self.path)
         cursor = connection.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO users (user_id, user_name, contact_info)
-            VALUES (?,?,?)""",
-                       await Crypt.encrypt_data(user_id, user_name, contact_info))
-        cursor.execute("""
-            INSERT INTO requests (request_id, user_id, problem_description, contact_time)
-            VALUES(?,?,?,?)""",
-                       await Crypt.encrypt_data(request_id, user_id, problem_description, contact_time))
-        connection.commit()
+        with metrics.time('db_operation_seconds', operation='insert'):
+            cursor.execute(self.INSERT_USER_SQL, user_row)
+            cursor.execute(self.INSERT_REQUEST_SQL, request_row)
+        with metrics.time('db_operation_seconds', operation='commit'):
+            connection.commit()
         connection.close()
+        BotDatabase.notify_write(1)
+
+    def request_stats(self, now: int = None) -> dict:
+        """
+        Возвращает статистику заявок из таблиц статистики без чтения и расшифровки заявок.
+
+        Параметры:
+        now (int): Текущее время (unix time); по умолчанию - время вызова.
+
+        Возвращает:
+        dict: Заявки за текущие сутки UTC ('today'), за последние 7 суток ('week'), всего ('total'),
+        количество пользователей ('users') и заявки по часам за последние 24 часа ('hours': список пар
+        (час в unix time // 3600, количество)).
+        """
+        now = int(time.time()) if now is None else now
+        hour = now // 3600
+        connection = sqlite3.connect(self.path)
+        try:
+            week = dict(connection.execute(
+                "SELECT hour, requests FROM request_stats WHERE hour > ?", (hour - 7 * 24,)).fetchall())
+            total = connection.execute("SELECT COALESCE(SUM(requests), 0) FROM request_stats").fetchone()[0]
+            users = connection.execute("SELECT value FROM counters WHERE name = 'users'").fetchone()[0]
+        finally:
+            connection.close()
+
+        day_start = now // 86400 * 24
+        return {
+            'today': sum(requests for stats_hour, requests in week.items() if stats_hour >= day_start),
+            'week': sum(week.values()),
+            'total': total,
+            'users': users,
+            'hours': [(stats_hour, week.get(stats_hour, 0)) for stats_hour in range(hour - 23, hour + 1)],
+        }
+
+    @staticmethod
+    def add_write_listener(listener) -> None:
+        """
+        Подписывает функцию на запись заявок в базу данных (из save_user_data и Outbox).
+
+        Параметры:
+        listener (callable): Функция, принимающая количество записанных заявок.
+        """
+        BotDatabase.write_listeners.append(listener)
+
+    @staticmethod
+    def notify_write(count: int) -> None:
+        """
+        Сообщает подписчикам о записи заявок. Ошибка подписчика не прерывает запись.
+
+        Параметры:
+        count (int): Количество записанных заявок.
+        """
+        for listener in BotDatabase.write_listeners:
+            try:
+                listener(count)
+            except Exception as e:
+                logger.error(f'Ошибка обработчика записи {listener}: {e}')
+
+    @staticmethod
+    def stored_columns(connection: sqlite3.Connection, table_name: str) -> tuple:
+        """
+        Возвращает зашифрованные столбцы таблицы вместе со столбцом row_token, если он есть в базе.
+
+        Параметры:
+        connection (sqlite3.Connection): Соединение с базой данных.
+        table_name (str): Имя таблицы из ENCRYPTED_COLUMNS.
+
+        Возвращает:
+        tuple: Имена столбцов.
+        """
+        columns = BotDatabase.ENCRYPTED_COLUMNS[table_name]
+        if BotDatabase.ROW_TOKEN_COLUMN in [column[1] for column in connection.execute(f"PRAGMA table_info({table_name})")]:
+            return (*columns, BotDatabase.ROW_TOKEN_COLUMN)
+        return columns
+
+    @staticmethod
+    def decrypt_row(columns: tuple, row, decrypt_value=Crypt.decrypt_data) -> list:
+        """
+        Расшифровывает строку любого из форматов хранения.
+
+        Параметры:
+        columns (tuple): Имена столбцов строки (последним может быть row_token).
+        row: Значения столбцов.
+        decrypt_value: Функция расшифровки одного значения (например, с кэшем).
+
+        Возвращает:
+        list: Расшифрованные значения без столбца row_token.
+        """
+        if columns and columns[-1] == BotDatabase.ROW_TOKEN_COLUMN:
+            if row[-1] is not None:
+                return Crypt.open_values(row[-1])
+            row = row[:-1]
+        return [decrypt_value(value) for value in row]
+
+    @staticmethod
+    def to_record(user_row: tuple, request_row: tuple) -> dict:
+        """
+        Возвращает зашифрованную заявку в виде записи для JSON (журнал Outbox, сервис записи).
+
+        Токены AEAD (BLOB) записываются текстом.
+
+        Параметры:
+        user_row (tuple): Значения для INSERT_USER_SQL.
+        request_row (tuple): Значения для INSERT_REQUEST_SQL.
+
+        Возвращает:
+        dict: Словарь {'user': [...], 'request': [...]}.
+        """
+        return {'user': [Crypt.to_text(value) for value in user_row],
+                'request': [Crypt.to_text(value) for value in request_row]}
+
+    @staticmethod
+    def record_user_row(record: dict) -> list:
+        """
+        Возвращает строку для таблицы users из записи (см. to_record).
+
+        Записи, сделанные до появления user_key и row_token, дополняются ключом по расшифрованному
+        user_id и пустым row_token. Токены AEAD, записанные текстом, снова становятся BLOB.
+
+        Параметры:
+        record (dict): Запись.
+
+        Возвращает:
+        list: Значения для INSERT_USER_SQL.
+        """
+        user_row = record['user']
+        if len(user_row) == 3:
+            user_row = [*user_row, Crypt.user_key(Crypt.decrypt_data(user_row[0]))]
+        if len(user_row) == 4:
+            user_row = [*user_row[:3], None, user_row[3]]
+        return [*map(Crypt.from_text, user_row[:-1]), user_row[-1]]  # Последнее значение - user_key
+
+    @staticmethod
+    def record_request_row(record: dict) -> list:
+        """
+        Возвращает строку для таблицы requests из записи (см. to_record); старые записи дополняются
+        пустым row_token.
+
+        Токены AEAD, записанные текстом, снова становятся BLOB.
+
+        Параметры:
+        record (dict): Запись.
+
+        Возвращает:
+        list: Значения для INSERT_REQUEST_SQL.
+        """
+        request_row = [*map(Crypt.from_text, record['request'])]
+        return [*request_row, None] if len(request_row) == 4 else request_row
+
+    def compact_users(self) -> dict:
+        """
+        Пересчитывает user_key у всех записей пользователей и удаляет дубли.
+
+        Раньше каждая заявка добавляла новую запись пользователя (зашифрованный user_id
+        каждый раз разный), а после смены ключа индекса (или основного ключа, если
+        config['db']['index_key'] не задан) новые заявки получают другой user_key, чем
+        старые записи. Поэтому ключи вычисляются заново для всех записей, и из записей
+        с одинаковым user_id остается последняя (с самыми свежими именем и контактами).
+        Ключи вычисляются вне транзакции записи; если пользователь успел оставить новую
+        заявку, его новая запись сохраняется.
+
+        Возвращает:
+        dict: Словарь со статистикой: users (записей до очистки), removed (удалено дублей),
+        undecryptable (записей, user_id которых не удалось расшифровать).
+        """
+        connection = sqlite3.connect(self.path)
+        try:
+            columns = self.stored_columns(connection, 'users')
+            rows = connection.execute(
+                f"SELECT rowid, user_key, {', '.join(columns)} FROM users ORDER BY rowid").fetchall()
+            latest, current, duplicates, undecryptable = {}, {}, [], 0
+            for rowid, old_key, *values in rows:
+                try:
+                    user_key = Crypt.user_key(self.decrypt_row(columns, values)[0])
+                except Exception:
+                    undecryptable += 1
+                    continue
+                if user_key in latest:
+                    duplicates.append(latest[user_key])
+                latest[user_key] = rowid
+                current[rowid] = old_key
+            changed = [(user_key, rowid) for user_key, rowid in latest.items() if current[rowid] != user_key]
+
+            with metrics.time('db_operation_seconds', operation='compact_users'), connection:
+                connection.executemany("DELETE FROM users WHERE rowid = ?", [(rowid,) for rowid in duplicates])
+                connection.executemany("UPDATE OR IGNORE users SET user_key = ? WHERE rowid = ?", changed)
+                # Ключ уже занят новой записью пользователя: старая запись не нужна
+                replaced = connection.executemany(
+                    "DELETE FROM users WHERE rowid = ? AND user_key IS NOT ?",
+                    [(rowid, user_key) for user_key, rowid in changed])
+            removed = len(duplicates) + max(replaced.rowcount, 0)
+            return {'users': len(rows), 'removed': removed, 'undecryptable': undecryptable}
+        finally:
+            connection.close()
 
 
 if __name__ == "__main__":
     """
     Этот модуль можно запустить напрямую через терминал в формате:
     `python dbscripts.py <путь к базе данных>`, тем самым вручную создав базу данных в указанном месте.
+    С флагом `--compact_users` в существующей базе пересчитываются ключи пользователей и удаляются дубли
+    (см. compact_users).
     """
     parser = argparse.ArgumentParser(description='Create database')
 
     parser.add_argument('path', help='Path to database')
+    parser.add_argument('--compact_users', action='store_true', help='Merge duplicate users rows')
     args = parser.parse_args()
 
     BotDatabase(args.path).create_tables()
+    if args.compact_users:
+        print(BotDatabase(args.path).compact_users())
 
 
 
@@ -1,14 +1,264 @@
 import argparse
+import csv
+import functools
+import gzip
+import hashlib
+import html
+import io
+import itertools
+import json
+import os
 import sqlite3
-import pandas
-from docx import Document
+from abc import ABC, abstractmethod
+from archive import RequestArchive
 from crypt_data import Crypt
+from dbscripts import BotDatabase
+from profiling import Profiler, span
+
+EXCEL_MAX_ROWS = 1048576  # Максимальное количество строк на листе Excel
+DECRYPT_CACHE_SIZE = 4096  # Размер LRU-кэша расшифрованных значений в одном экспорте
+SNAPSHOT_PAGES = 1024  # Страниц, копируемых за один шаг снимка базы данных без WAL
+PROGRESS_ROWS = 1000  # Через сколько строк export_many сообщает о ходе экспорта
+
+
+class ExportCancelled(Exception):
+    """
+    Исключение, которым функция progress прерывает export_many по просьбе пользователя (это не ошибка).
+    """
+
+
+class ExportWriter(ABC):
+    """
+    Базовый класс для записи строк таблицы в файл одного формата.
+
+    Экземпляр получает строки по одной через write_row и сохраняет результат в close.
+    Выходом может быть путь к файлу или открытый бинарный файл.
+    """
+    name = ''
+    extension = ''
+
+    def __init__(self, output, table_name: str, columns: list):
+        """
+        Инициализация записи.
+
+        :param output: Путь к выходному файлу или открытый бинарный файл.
+        :param table_name: Имя таблицы.
+        :param columns: Имена столбцов.
+        """
+        self.output = output
+        self.table_name = table_name
+        self.columns = columns
+
+    @abstractmethod
+    def write_row(self, row: list) -> None:
+        """
+        Записывает одну строку таблицы.
+
+        :param row: Значения ячеек.
+        :return: None
+        """
+        pass
+
+    @abstractmethod
+    def close(self, save: bool = True) -> None:
+        """
+        Завершает запись.
+
+        :param save: Сохранить ли результат (False - только освободить ресурсы после ошибки).
+        :return: None
+        """
+        pass
+
+    def _target(self):
+        """
+        Возвращает, куда записывать результат.
+
+        Путь заменяется временным файлом <путь>.tmp, который становится выходным только в _finish,
+        поэтому прерванный экспорт не оставляет обрезанный файл, похожий на настоящий.
+
+        :return: Путь к временному файлу или переданный бинарный файл.
+        """
+        return f'{self.output}.tmp' if isinstance(self.output, str) else self.output
+
+    def _finish(self, save: bool = True) -> None:
+        """
+        Заменяет выходной файл временным или, если результат не сохраняется, удаляет временный файл.
+
+        :param save: Сохранить ли результат.
+        :return: None
+        """
+        if not isinstance(self.output, str):
+            return
+        if save:
+            os.replace(self._target(), self.output)
+        elif os.path.exists(self._target()):
+            os.remove(self._target())
+
+    def _open_text(self):
+        """
+        Открывает выход (см. _target) как текстовый файл в кодировке UTF-8.
+
+        :return: Текстовый файл.
+        """
+        if isinstance(self.output, str):
+            return open(self._target(), 'w', newline='', encoding='UTF-8')
+        return io.TextIOWrapper(self.output, encoding='UTF-8', newline='')
+
+    def _close_text(self, file, save: bool = True) -> None:
+        """
+        Закрывает текстовый файл, не закрывая переданный снаружи бинарный файл.
+
+        :param file: Текстовый файл, открытый через _open_text.
+        :param save: Сохранить ли результат (см. _finish).
+        :return: None
+        """
+        if isinstance(self.output, str):
+            file.close()
+            self._finish(save)
+        else:
+            file.flush()
+            file.detach()
+
+
+class WordWriter(ExportWriter):
+    """
+    Запись таблицы в формат Word (.docx).
+    """
+    name = 'Word'
+    extension = 'docx'
+
+    def __init__(self, output, table_name: str, columns: list):
+        from docx import Document  # python-docx нужен только для этого формата, поэтому импортируется здесь
+
+        super().__init__(output, table_name, columns)
+        self.document = Document()
+        self.table = self.document.add_table(rows=1, cols=len(columns))
+        self.table.style = 'Table Grid'
+
+        for cell, column_name in zip(self.table.rows[0].cells, columns):
+            cell.text = column_name
+
+    def write_row(self, row: list) -> None:
+        # Строки добавляются по одной: table.cell(i, j) перестраивает всю сетку ячеек при каждом вызове
+        for cell, value in zip(self.table.add_row().cells, row):
+            cell.text = '' if value is None else str(value)
+
+    def close(self, save: bool = True) -> None:
+        if save:
+            self.document.save(self._target())
+        self._finish(save)
+
+
+class ExcelWriter(ExportWriter):
+    """
+    Запись таблицы в формат Excel (.xlsx) через книгу в режиме write-only.
+
+    Если строк больше, чем помещается на лист, данные продолжаются на следующем листе
+    (с повтором заголовка).
+    """
+    name = 'Excel'
+    extension = 'xlsx'
+
+    def __init__(self, output, table_name: str, columns: list, max_rows_per_sheet: int = EXCEL_MAX_ROWS):
+        from openpyxl import Workbook  # openpyxl нужен только для этого формата, поэтому импортируется здесь
+
+        super().__init__(output, table_name, columns)
+        self.workbook = Workbook(write_only=True)
+        self.max_rows_per_sheet = max_rows_per_sheet
+        self.sheet = None
+        self.sheet_rows = max_rows_per_sheet
+
+    def write_row(self, row: list) -> None:
+        if self.sheet_rows >= self.max_rows_per_sheet:  # Лист заполнен, начинаем следующий
+            self._new_sheet()
+        self.sheet.append(row)
+        self.sheet_rows += 1
+
+    def close(self, save: bool = True) -> None:
+        if save:
+            if self.sheet is None:  # Пустая таблица: сохраняем лист только с заголовком
+                self._new_sheet()
+            self.workbook.save(self._target())
+        else:
+            for sheet in self.workbook.worksheets:  # Освобождаем временные файлы листов
+                sheet.close()
+        self._finish(save)
+
+    def _new_sheet(self) -> None:
+        """
+        Создает следующий лист и записывает на него заголовок.
+
+        :return: None
+        """
+        suffix = '' if self.sheet is None else f' ({len(self.workbook.worksheets) + 1})'
+        # Excel ограничивает имя листа 31 символом: обрезается имя таблицы, а номер листа сохраняется
+        self.sheet = self.workbook.create_sheet(f'{self.table_name[:31 - len(suffix)]}{suffix}')
+        self.sheet.append(self.columns)
+        self.sheet_rows = 1
+
+
+class CsvWriter(ExportWriter):
+    """
+    Запись таблицы в формат CSV (.csv).
+    """
+    name = 'CSV'
+    extension = 'csv'
+
+    def __init__(self, output, table_name: str, columns: list):
+        super().__init__(output, table_name, columns)
+        self.file = self._open_text()
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_row(self, row: list) -> None:
+        self.writer.writerow(row)
+
+    def close(self, save: bool = True) -> None:
+        self._close_text(self.file, save)
+
+
+class HtmlWriter(ExportWriter):
+    """
+    Запись таблицы в формат HTML (.html).
+    """
+    name = 'HTML'
+    extension = 'html'
+
+    def __init__(self, output, table_name: str, columns: list):
+        super().__init__(output, table_name, columns)
+        self.file = self._open_text()
+        self.file.write(ExportData.HTML_HEAD.format(title=html.escape(table_name)))  # Добавляем мета-тег кодировки
+        self.file.write(ExportData._html_table_head(columns))
+
+    def write_row(self, row: list) -> None:
+        self.file.write(ExportData._html_table_row(row))
+
+    def close(self, save: bool = True) -> None:
+        if save:
+            self.file.write(ExportData.HTML_TABLE_TAIL)
+            self.file.write(ExportData.HTML_TAIL)
+        self._close_text(self.file, save)
 
 
 class ExportData:
     """
     Класс для экспорта данных из SQLite базы данных в различные форматы.
     """
+    HTML_HEAD = """
+              <!DOCTYPE html>
+              <html lang="en">
+              <head>
+                  <meta charset="UTF-8">
+                  <title>{title}</title>
+              </head>
+              <body>
+                  """
+    HTML_TAIL = """
+              </body>
+              </html>
+              """
+    HTML_TABLE_TAIL = '  </tbody>\n</table>'
+
     @staticmethod
     def export_to_word(database_path: str, table_name: str, output_file: str = None) -> None:
         """
@@ -19,103 +269,444 @@ class ExportData:
         :param output_file: Путь к выходному файлу. Если не указан, используется имя таблицы.
         :return: None
         """
-        connection = sqlite3.connect(database_path)
-        try:
-            dataframe = pandas.read_sql_query(f"SELECT * FROM {table_name}", connection)
-            doc = Document()
-            table = doc.add_table(rows=dataframe.shape[0] + 1, cols=dataframe.shape[1])
-            table.style = 'Table Grid'
+        ExportData.export_many(database_path, table_name, {'word': output_file})
 
-            for i, column_name in enumerate(dataframe.columns):
-                table.cell(0, i).text = column_name
+    @staticmethod
+    def export_to_excel(database_path: str, table_name: str, output_file: str = None,
+                        max_rows_per_sheet: int = EXCEL_MAX_ROWS) -> None:
+        """
+        Экспортирует данные из указанной таблицы базы данных в формат Excel (.xlsx).
 
-            for i, row in enumerate(dataframe.itertuples(), 1):
-                for j, value in enumerate(row[1:]):
-                    table.cell(i, j).text = Crypt.decrypt_data(value)
+        Книга создается в режиме write-only: строки читаются из курсора порциями, расшифровываются
+        и сразу записываются на лист, поэтому вся таблица не держится в памяти. Если строк больше,
+        чем помещается на лист, данные продолжаются на следующем листе (с повтором заголовка).
 
-            doc.save(output_file if output_file else f'{table_name}.docx')
-        except Exception as e:
-            print(f"Ошибка при экспорте в Word: {e}")
-        finally:
-            connection.close()
+        :param database_path: Путь к файлу базы данных SQLite.
+        :param table_name: Имя таблицы, данные из которой нужно экспортировать.
+        :param output_file: Путь к выходному файлу. Если не указан, используется имя таблицы.
+        :param max_rows_per_sheet: Максимальное количество строк на листе, включая заголовок.
+        :return: None
+        """
+        ExportData.export_many(database_path, table_name, {'excel': output_file}, max_rows_per_sheet=max_rows_per_sheet)
 
     @staticmethod
-    def export_to_excel(database_path: str, table_name: str, output_file: str = None) -> None:
+    def export_to_csv(database_path: str, table_name: str, output_file: str = None) -> None:
         """
-        Экспортирует данные из указанной таблицы базы данных в формат Excel (.xlsx).
+        Экспортирует данные из указанной таблицы базы данных в формат CSV (.csv).
 
         :param database_path: Путь к файлу базы данных SQLite.
         :param table_name: Имя таблицы, данные из которой нужно экспортировать.
         :param output_file: Путь к выходному файлу. Если не указан, используется имя таблицы.
         :return: None
         """
-        connection = sqlite3.connect(database_path)
+        ExportData.export_many(database_path, table_name, {'csv': output_file})
+
+    @staticmethod
+    def export_to_html(database_path: str, table_name: str, output_file: str = None, decrypt: bool = True) -> None:
+        """
+        Экспортирует данные из указанной таблицы базы данных в формат HTML (.html).
+
+        :param database_path: Путь к файлу базы данных SQLite.
+        :param table_name: Имя таблицы, данные из которой нужно экспортировать.
+        :param output_file: Путь к выходному файлу. Если не указан, используется имя таблицы.
+        :param decrypt: Флаг, указывающий, нужно ли расшифровывать данные.
+        :return: None
+        """
+        ExportData.export_many(database_path, table_name, {'html': output_file}, decrypt=decrypt)
+
+    @staticmethod
+    def export_many(database_path: str, table_name: str, output_files: dict, decrypt: bool = True,
+                    max_rows_per_sheet: int = EXCEL_MAX_ROWS, cache_size: int = DECRYPT_CACHE_SIZE,
+                    archive_dir: str = None, progress=None) -> bool:
+        """
+        Экспортирует таблицу сразу в несколько форматов за один проход.
+
+        Строки читаются и расшифровываются один раз, после чего каждая строка передается
+        всем выбранным форматам. Повторяющиеся шифротексты расшифровываются один раз
+        благодаря ограниченному LRU-кэшу.
+
+        :param database_path: Путь к файлу базы данных SQLite.
+        :param table_name: Имя таблицы, данные из которой нужно экспортировать.
+        :param output_files: Словарь {формат (word, excel, csv, html): путь к файлу или открытый бинарный файл}.
+        Если путь не указан (None), используется имя таблицы.
+        :param decrypt: Флаг, указывающий, нужно ли расшифровывать данные.
+        :param max_rows_per_sheet: Максимальное количество строк на листе Excel, включая заголовок.
+        :param cache_size: Размер LRU-кэша расшифрованных значений (0 - без кэша).
+        :param archive_dir: Папка архива старых заявок. Если указана, архивные строки тоже экспортируются.
+        :param progress: Функция, которая вызывается с количеством записанных строк через каждые PROGRESS_ROWS
+        строк. Исключение в ней прерывает экспорт (файлы не сохраняются); ExportCancelled - без сообщения об ошибке.
+        :return: True, если экспорт завершен, и False при ошибке или отмене.
+        """
+        unknown = [method for method in output_files if method not in EXPORT_WRITERS]
+        if unknown:
+            print(f"Неизвестный формат экспорта: {', '.join(map(str, unknown))}")
+            return False
+
+        connection = ExportData._snapshot(database_path)
+        writers = []
         try:
-            dataframe = pandas.read_sql_query(f"SELECT * FROM {table_name}", connection)
-            dataframe = dataframe.applymap(Crypt.decrypt_data)
-            dataframe.to_excel(output_file if output_file else f'{table_name}.xlsx', index=False, engine='openpyxl')
+            columns, rows = ExportData._read_rows(connection, table_name, decrypt, cache_size=cache_size,
+                                                  archive_dir=archive_dir)
+            for method, output in output_files.items():
+                writer_class = EXPORT_WRITERS[method]
+                output = output if output is not None else f'{table_name}.{writer_class.extension}'
+                if writer_class is ExcelWriter:
+                    writers.append(ExcelWriter(output, table_name, columns, max_rows_per_sheet))
+                else:
+                    writers.append(writer_class(output, table_name, columns))
+
+            with span('render', table=table_name, formats=','.join(output_files)):
+                for count, row in enumerate(rows, 1):
+                    for writer in writers:
+                        writer.write_row(row)
+                    if progress is not None and count % PROGRESS_ROWS == 0:
+                        progress(count)
+
+            with span('save'):
+                for writer in writers:
+                    writer.close()
+            return True
         except Exception as e:
-            print(f"Ошибка при экспорте в Excel: {e}")
+            for writer in writers:
+                writer.close(save=False)
+            if not isinstance(e, ExportCancelled):
+                print(f"Ошибка при экспорте в {', '.join(EXPORT_WRITERS[method].name for method in output_files)}: {e}")
+            return False
         finally:
             connection.close()
 
     @staticmethod
-    def export_to_csv(database_path: str, table_name: str, output_file: str = None) -> None:
+    def export_to_html_pages(database_path: str, table_name: str, output_file: str = None,
+                             rows_per_page: int = 500, decrypt: bool = True, archive_dir: str = None) -> list:
         """
-        Экспортирует данные из указанной таблицы базы данных в формат CSV (.csv).
+        Экспортирует данные из указанной таблицы в набор HTML-страниц с фиксированным числом строк.
+
+        По пути output_file создается оглавление со ссылками на страницы, а сами страницы
+        сохраняются в одноименную папку рядом с ним (users.html -> users/1.html, users/2.html, ...).
+        Перезаписываются только те страницы, содержимое которых изменилось, а лишние страницы
+        (если строк стало меньше) удаляются.
 
         :param database_path: Путь к файлу базы данных SQLite.
         :param table_name: Имя таблицы, данные из которой нужно экспортировать.
-        :param output_file: Путь к выходному файлу. Если не указан, используется имя таблицы.
-        :return: None
+        :param output_file: Путь к файлу оглавления. Если не указан, используется имя таблицы.
+        :param rows_per_page: Количество строк на одной странице.
+        :param decrypt: Флаг, указывающий, нужно ли расшифровывать данные.
+        :param archive_dir: Папка архива старых заявок. Если указана, архивные строки тоже экспортируются.
+        :return: Список путей к файлам, которые были записаны или удалены.
         """
-        connection = sqlite3.connect(database_path)
+        index_file = output_file if output_file else f'{table_name}.html'
+        pages_dir = os.path.splitext(index_file)[0]
+        pages_dir_name = os.path.basename(pages_dir)
+        changed_files = []
+
+        connection = ExportData._snapshot(database_path)
         try:
-            dataframe = pandas.read_sql_query(f"SELECT * FROM {table_name}", connection)
-            dataframe = dataframe.applymap(Crypt.decrypt_data)
-            dataframe.to_csv(output_file if output_file else f'{table_name}.csv', index=False, encoding='UTF-8')
+            os.makedirs(pages_dir, exist_ok=True)
+            columns, rows = ExportData._read_rows(connection, table_name, decrypt, chunk_size=rows_per_page,
+                                                  archive_dir=archive_dir)
+
+            pages = []  # Диапазоны строк (первая, последняя) для оглавления
+            pending = None  # Страница, для которой еще неизвестно, будет ли следующая
+            first_row = 1
+            while page_rows := list(itertools.islice(rows, rows_per_page)):
+                if pending is not None:
+                    changed_files += ExportData._write_html_page(pages_dir, table_name, *pending, has_next=True)
+                table_html = io.StringIO()
+                with span('render', table=table_name, page=len(pages) + 1):
+                    ExportData._write_html_table(table_html, columns, page_rows)
+                pages.append((first_row, first_row + len(page_rows) - 1))
+                pending = (len(pages), table_html.getvalue())
+                first_row += len(page_rows)
+
+            if pending is None:  # Пустая таблица: публикуем одну пустую страницу
+                pages.append((0, 0))
+                pending = (1, '<p>Нет данных</p>')
+            changed_files += ExportData._write_html_page(pages_dir, table_name, *pending, has_next=False)
+
+            # Удаляем страницы, которые остались от предыдущего экспорта
+            for file_name in os.listdir(pages_dir):
+                page_number = os.path.splitext(file_name)[0]
+                if file_name.endswith('.html') and page_number.isdigit() and int(page_number) > len(pages):
+                    os.remove(os.path.join(pages_dir, file_name))
+                    changed_files.append(os.path.join(pages_dir, file_name))
+
+            links = ''.join(
+                f'<li><a href="{pages_dir_name}/{number}.html">Страница {number}</a> (строки {first}–{last})</li>'
+                for number, (first, last) in enumerate(pages, 1))
+            if ExportData._write_if_changed(index_file, ExportData._html_document(table_name, f'<ul>{links}</ul>')):
+                changed_files.append(index_file)
         except Exception as e:
-            print(f"Ошибка при экспорте в CSV: {e}")
+            print(f"Ошибка при экспорте в HTML: {e}")
         finally:
             connection.close()
 
+        return changed_files
+
     @staticmethod
-    def export_to_html(database_path: str, table_name: str, output_file: str = None, decrypt: bool = True) -> None:
+    def export_to_feed(database_path: str, table_name: str, output_dir: str = None,
+                       segment_rows: int = 1000, decrypt: bool = False, archive_dir: str = None) -> list:
         """
-        Экспортирует данные из указанной таблицы базы данных в формат HTML (.html).
+        Экспортирует данные таблицы в машиночитаемый фид: сегменты JSON Lines, сжатые gzip, и манифест.
+
+        Каждый сегмент содержит не более segment_rows строк (каждая строка - JSON-массив значений
+        в порядке столбцов из манифеста). В manifest.json перечислены сегменты с диапазонами строк
+        и SHA-256 сжатого файла, поэтому потребитель может скачивать только новые сегменты.
+        Сегменты сжимаются детерминированно, и неизменившиеся файлы не перезаписываются.
 
         :param database_path: Путь к файлу базы данных SQLite.
         :param table_name: Имя таблицы, данные из которой нужно экспортировать.
-        :param output_file: Путь к выходному файлу. Если не указан, используется имя таблицы.
+        :param output_dir: Папка для фида. Если не указана, используется имя таблицы с суффиксом .feed.
+        :param segment_rows: Максимальное количество строк в одном сегменте.
         :param decrypt: Флаг, указывающий, нужно ли расшифровывать данные.
-        :return: None
+        :param archive_dir: Папка архива старых заявок. Если указана, архивные строки тоже экспортируются.
+        :return: Список путей к файлам, которые были записаны или удалены.
         """
-        connection = sqlite3.connect(database_path)
+        feed_dir = output_dir if output_dir else f'{table_name}.feed'
+        changed_files = []
+
+        connection = ExportData._snapshot(database_path)
         try:
-            dataframe = pandas.read_sql_query(f"SELECT * FROM {table_name}", connection)
-            dataframe = dataframe.applymap(Crypt.decrypt_data) if decrypt else dataframe
-            html_content = dataframe.to_html(index=False, border=1)
+            os.makedirs(feed_dir, exist_ok=True)
+            columns, all_rows = ExportData._read_rows(connection, table_name, decrypt, chunk_size=segment_rows,
+                                                      archive_dir=archive_dir)
 
-            # Добавляем мета-тег кодировки
-            html_file = f"""
-              <!DOCTYPE html>
-              <html lang="en">
-              <head>
-                  <meta charset="UTF-8">
-                  <title>{table_name}</title>
-              </head>
-              <body>
-                  {html_content}
-              </body>
-              </html>
-              """
-            with open(output_file if output_file else f'{table_name}.html', 'w', encoding='UTF-8') as file:
-                file.write(html_file)
+            segments = []
+            first_row = 1
+            while rows := list(itertools.islice(all_rows, segment_rows)):
+                with span('render', table=table_name, segment=len(segments) + 1):
+                    lines = ''.join(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n' for row in rows)
+                    data = gzip.compress(lines.encode('UTF-8'), compresslevel=9, mtime=0)
+
+                file_name = f'{len(segments) + 1:06d}.jsonl.gz'
+                segments.append({
+                    'file': file_name,
+                    'first_row': first_row,
+                    'last_row': first_row + len(rows) - 1,
+                    'rows': len(rows),
+                    'sha256': hashlib.sha256(data).hexdigest()
+                })
+                first_row += len(rows)
+
+                if ExportData._write_if_changed(os.path.join(feed_dir, file_name), data):
+                    changed_files.append(os.path.join(feed_dir, file_name))
+
+            # Удаляем сегменты, которые остались от предыдущего экспорта
+            actual_files = {segment['file'] for segment in segments}
+            for file_name in os.listdir(feed_dir):
+                if file_name.endswith('.jsonl.gz') and file_name not in actual_files:
+                    os.remove(os.path.join(feed_dir, file_name))
+                    changed_files.append(os.path.join(feed_dir, file_name))
+
+            manifest = json.dumps({
+                'table': table_name,
+                'columns': columns,
+                'encrypted': not decrypt,
+                'segment_rows': segment_rows,
+                'rows': first_row - 1,
+                'segments': segments
+            }, ensure_ascii=False, indent=1)
+            manifest_file = os.path.join(feed_dir, 'manifest.json')
+            if ExportData._write_if_changed(manifest_file, manifest):
+                changed_files.append(manifest_file)
         except Exception as e:
-            print(f"Ошибка при экспорте в HTML: {e}")
+            print(f"Ошибка при экспорте фида: {e}")
         finally:
             connection.close()
 
+        return changed_files
+
+    @staticmethod
+    def _snapshot(database_path: str) -> sqlite3.Connection:
+        """
+        Открывает согласованный снимок базы данных для экспорта, не блокирующий запись.
+
+        В режиме WAL (см. BotDatabase.create_tables) открывается транзакция чтения: экспорт видит
+        базу на момент начала и не мешает боту записывать новые заявки. Если база не в режиме WAL,
+        она копируется через online backup API порциями по SNAPSHOT_PAGES страниц, между которыми
+        запись не блокируется, и экспорт читает копию. Копия - временная база SQLite на диске
+        (имя файла ''): в памяти остается только кэш страниц, а файл удаляется при закрытии соединения.
+
+        :param database_path: Путь к файлу базы данных SQLite.
+        :return: Соединение со снимком базы данных.
+        """
+        connection = sqlite3.connect(database_path)
+        if connection.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+            connection.execute("BEGIN")
+            connection.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # Снимок фиксируется первым чтением
+            return connection
+
+        snapshot = sqlite3.connect('')
+        try:
+            with span('snapshot'):
+                connection.backup(snapshot, pages=SNAPSHOT_PAGES, sleep=0.005)
+        finally:
+            connection.close()
+        return snapshot
+
+    @staticmethod
+    def _read_rows(connection: sqlite3.Connection, table_name: str, decrypt: bool, chunk_size: int = 1000,
+                   cache_size: int = 0, archive_dir: str = None) -> tuple:
+        """
+        Читает строки таблицы курсором порциями, не загружая всю таблицу в память.
+
+        Строки, записанные в таблицу integrity_errors (см. scan.py), пропускаются. Если указана папка
+        архива (см. archive.py), перед строками базы данных выдаются архивные строки таблицы.
+        Строки с токеном всей строки (row_token) при расшифровке раскрываются в обычные столбцы;
+        без расшифровки столбец row_token выдается, только если в таблице есть такие строки.
+
+        :param connection: Соединение с базой данных.
+        :param table_name: Имя таблицы.
+        :param decrypt: Флаг, указывающий, нужно ли расшифровывать данные.
+        :param chunk_size: Количество строк, которое читается из курсора за один раз.
+        :param cache_size: Размер LRU-кэша расшифрованных значений (0 - без кэша).
+        :param archive_dir: Папка архива. Если не указана, архивные строки не читаются.
+        :return: Кортеж (список имен столбцов, генератор строк в виде списков значений).
+        """
+        # Служебные открытые столбцы (например, created_at) не экспортируются и не расшифровываются
+        if table_name in BotDatabase.ENCRYPTED_COLUMNS:
+            column_list = ', '.join(BotDatabase.stored_columns(connection, table_name))
+        else:
+            column_list = '*'
+
+        # Строки, которые scan.py пометил как поврежденные, пропускаются, чтобы экспорт не прерывался
+        known_bad = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'integrity_errors'").fetchone()
+        if known_bad:
+            cursor = connection.execute(f"""
+                SELECT {column_list} FROM {table_name}
+                WHERE rowid NOT IN (SELECT row_id FROM integrity_errors WHERE table_name = ?)
+                ORDER BY rowid""", (table_name,))
+        else:
+            cursor = connection.execute(f"SELECT {column_list} FROM {table_name} ORDER BY rowid")
+        columns = [description[0] for description in cursor.description]
+        decrypt_value = functools.lru_cache(maxsize=cache_size)(Crypt.decrypt_data) if cache_size else Crypt.decrypt_data
+
+        # Архивные строки старше строк базы данных, поэтому идут первыми
+        archived = RequestArchive.read(archive_dir, table_name, columns) if archive_dir else iter(())
+
+        stored_columns = tuple(columns)
+        envelope = columns[-1] == BotDatabase.ROW_TOKEN_COLUMN
+        if envelope and (decrypt or not connection.execute(
+                f"SELECT 1 FROM {table_name} WHERE {BotDatabase.ROW_TOKEN_COLUMN} IS NOT NULL LIMIT 1").fetchone()):
+            columns = columns[:-1]  # Столбец row_token не выдается
+        width = len(columns)
+        chunks = itertools.chain(iter(lambda: list(itertools.islice(archived, chunk_size)), []),
+                                 iter(lambda: cursor.fetchmany(chunk_size), []))
+
+        def rows():
+            while True:
+                with span('read'):
+                    chunk = next(chunks, [])
+                if not chunk:
+                    return
+                if decrypt:
+                    with span('decrypt', rows=len(chunk)):
+                        chunk = [BotDatabase.decrypt_row(stored_columns, row, decrypt_value) for row in chunk]
+                    yield from chunk
+                else:
+                    # Токены AEAD (BLOB) выводятся в base64, чтобы их можно было опубликовать
+                    yield from ([Crypt.to_text(value) for value in row[:width]] for row in chunk)
+
+        return columns, rows()
+
+    @staticmethod
+    def _write_html_table(file, columns: list, rows) -> None:
+        """
+        Построчно записывает HTML-таблицу в файл (в той же разметке, что и pandas.DataFrame.to_html).
+
+        :param file: Открытый текстовый файл или другой объект с методом write.
+        :param columns: Имена столбцов.
+        :param rows: Итерируемый объект со строками таблицы.
+        :return: None
+        """
+        file.write(ExportData._html_table_head(columns))
+        for row in rows:
+            file.write(ExportData._html_table_row(row))
+        file.write(ExportData.HTML_TABLE_TAIL)
+
+    @staticmethod
+    def _html_table_head(columns: list) -> str:
+        """
+        Возвращает начало HTML-таблицы с заголовком.
+
+        :param columns: Имена столбцов.
+        :return: HTML-код.
+        """
+        header = ''.join(f'      <th>{html.escape(str(column))}</th>\n' for column in columns)
+        return f'<table border="1" class="dataframe">\n  <thead>\n    <tr style="text-align: right;">\n' \
+               f'{header}    </tr>\n  </thead>\n  <tbody>\n'
+
+    @staticmethod
+    def _html_table_row(row: list) -> str:
+        """
+        Возвращает строку HTML-таблицы.
+
+        :param row: Значения ячеек.
+        :return: HTML-код.
+        """
+        escape = html.escape
+        cells = ''.join(f'      <td>{"" if value is None else escape(str(value), quote=False)}</td>\n' for value in row)
+        return f'    <tr>\n{cells}    </tr>\n'
+
+    @staticmethod
+    def _write_html_page(pages_dir: str, table_name: str, number: int, table_html: str, has_next: bool) -> list:
+        """
+        Записывает одну страницу постраничного экспорта вместе с навигацией.
+
+        :param pages_dir: Папка со страницами.
+        :param table_name: Имя таблицы (используется в заголовке).
+        :param number: Номер страницы, начиная с 1.
+        :param table_html: HTML-код таблицы со строками страницы.
+        :param has_next: Есть ли после этой страницы следующая.
+        :return: Список из пути к странице, если она была перезаписана, иначе пустой список.
+        """
+        navigation = [f'<a href="{number - 1}.html">&laquo; Назад</a>'] if number > 1 else []
+        navigation.append(f'<a href="../{os.path.basename(pages_dir)}.html">Оглавление</a>')
+        if has_next:
+            navigation.append(f'<a href="{number + 1}.html">Вперед &raquo;</a>')
+        nav_html = f'<nav>{" | ".join(navigation)}</nav>'
+
+        page_file = os.path.join(pages_dir, f'{number}.html')
+        content = ExportData._html_document(f'{table_name} — {number}', f'{nav_html}\n{table_html}\n{nav_html}')
+        return [page_file] if ExportData._write_if_changed(page_file, content) else []
+
+    @staticmethod
+    def _html_document(title: str, body: str) -> str:
+        """
+        Оборачивает содержимое в HTML-документ с мета-тегом кодировки.
+
+        :param title: Заголовок страницы (текст, экранируется здесь).
+        :param body: HTML-код содержимого страницы.
+        :return: Готовый HTML-документ.
+        """
+        return f'{ExportData.HTML_HEAD.format(title=html.escape(title))}{body}{ExportData.HTML_TAIL}'
+
+    @staticmethod
+    def _write_if_changed(path: str, content) -> bool:
+        """
+        Записывает файл, только если его содержимое отличается от нового.
+
+        :param path: Путь к файлу.
+        :param content: Новое содержимое файла (str записывается в UTF-8, bytes - как есть).
+        :return: True, если файл был записан, иначе False.
+        """
+        data = content.encode('UTF-8') if isinstance(content, str) else content
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                if file.read() == data:
+                    return False
+        with open(path, 'wb') as file:
+            file.write(data)
+        return True
+
+
+EXPORT_WRITERS = {
+    'word': WordWriter,
+    'excel': ExcelWriter,
+    'csv': CsvWriter,
+    'html': HtmlWriter
+}
+
 
 def main() -> None:
     """
@@ -125,28 +716,50 @@ def main() -> None:
     """
     parser = argparse.ArgumentParser(description='Export data from SQLite database to various formats.')
 
-    parser.add_argument('method', choices=['word', 'excel', 'csv', 'html'], help='Export method')
+    parser.add_argument('method', nargs='+', choices=['word', 'excel', 'csv', 'html', 'feed'],
+                        help='Export method (several table formats are exported in one pass)')
     parser.add_argument('database_path', help='Path to the SQLite database file')
     parser.add_argument('table_name', help='Name of the table to export')
-    parser.add_argument('-o', '--output_file', help='Path to the output file')
+    parser.add_argument('-o', '--output_file', help='Path to the output file (base name for several formats)')
+    parser.add_argument('-p', '--rows_per_page', type=int, help='Split html output into pages of this many rows')
+    parser.add_argument('-a', '--archive_dir', help='Also export archived rows from this archive directory')
+    parser.add_argument('--profile', help='Directory for cProfile stats and span trace of this run')
 
     args = parser.parse_args()
+    methods = list(dict.fromkeys(args.method))
+    if 'feed' in methods and len(methods) > 1:
+        parser.error('feed cannot be combined with other formats')
+    if 'html' in methods and args.rows_per_page and len(methods) > 1:
+        parser.error('paginated html cannot be combined with other formats')
 
-    export_methods = {
-        'word': ExportData.export_to_word,
-        'excel': ExportData.export_to_excel,
-        'csv': ExportData.export_to_csv,
-        'html': ExportData.export_to_html
-    }
-
-    if args.method in export_methods:
-        export_methods[args.method](args.database_path, args.table_name, args.output_file)
+    # Профилирование включается флагом --profile или переменной окружения BSMDB_PROFILE
+    with Profiler.from_env(f"export-{'-'.join(methods)}-{args.table_name}", args.profile):
+        if methods == ['feed']:
+            ExportData.export_to_feed(args.database_path, args.table_name, args.output_file,
+                                      archive_dir=args.archive_dir)
+        elif methods == ['html'] and args.rows_per_page:
+            ExportData.export_to_html_pages(args.database_path, args.table_name, args.output_file, args.rows_per_page,
+                                            archive_dir=args.archive_dir)
+        elif len(methods) == 1:
+            ExportData.export_many(args.database_path, args.table_name, {methods[0]: args.output_file},
+                                   archive_dir=args.archive_dir)
+        else:
+            base_name = os.path.splitext(args.output_file)[0] if args.output_file else args.table_name
+            ExportData.export_many(args.database_path, args.table_name,
+                                   {method: f'{base_name}.{EXPORT_WRITERS[method].extension}' for method in methods},
+                                   archive_dir=args.archive_dir)
 
 
 if __name__ == '__main__':
     """
     Этот модуль можно запустить напрямую через терминал в формате:
-    `python expdata.py <формат файла (word, excel, csv, html)> <путь к базе данных> <имя таблицы> <путь, по которому сохранить файл (опционально)>`,
+    `python expdata.py <формат файла (word, excel, csv, html, feed)> <путь к базе данных> <имя таблицы> <путь, по которому сохранить файл (опционально)>`,
     тем самым вручную экспортировав данные в эту же папку, либо в другое указанное место.
+    Можно указать несколько форматов сразу (например, `python expdata.py word excel csv html ...`): таблица
+    читается и расшифровывается один раз, а путь из `-o` используется как базовое имя файлов.
+    С флагом `-a <папка архива>` в экспорт попадают и заявки, перенесенные в архив (см. archive.py).
+    Для html можно указать `-p <число строк на странице>`, чтобы получить постраничный вывод с оглавлением.
+    С флагом `--profile <папка>` (или переменной окружения BSMDB_PROFILE) в папку сохраняются
+    статистика cProfile и трасса этапов экспорта.
     """
     main()
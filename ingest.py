@@ -0,0 +1,165 @@
+import argparse
+import csv
+import itertools
+import logging
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('user_id', 'user_name', 'request_id', 'problem_description', 'contact_info', 'contact_time')
+# Импортируются исторические заявки, поэтому created_at берется из необязательного столбца CSV (unix time),
+# а не из текущего времени. Заявки без него, как и созданные до появления столбца, не переносятся в архив
+# и учитываются в статистике только в общем количестве
+INSERT_REQUEST_SQL = """
+    INSERT INTO requests (request_id, user_id, problem_description, contact_time, row_token, created_at)
+    VALUES(?,?,?,?,?,?)"""
+
+
+def encrypt_batch(rows: list) -> tuple:
+    """
+    Шифрует пачку заявок (выполняется в отдельном процессе).
+
+    Параметры:
+    rows (list): Список словарей с полями заявки (FIELDS и, возможно, created_at).
+
+    Возвращает:
+    tuple: Кортеж (строки для таблицы users, строки для таблицы requests).
+    """
+    users, requests = [], []
+    for row in rows:
+        users.append((*Crypt.encrypt_row_values(row['user_id'], row['user_name'], row['contact_info']),
+                      Crypt.user_key(row['user_id'])))
+        requests.append((*Crypt.encrypt_row_values(
+            row['request_id'], row['user_id'], row['problem_description'], row['contact_time']),
+            int(row['created_at']) if row.get('created_at') else None))
+    return users, requests
+
+
+class BulkIngest:
+    """
+    Класс для массового импорта заявок из CSV в зашифрованную базу данных.
+
+    Файл читается потоково, пачки шифруются параллельно в нескольких процессах, а строки
+    вставляются через executemany в крупных транзакциях. Вместе с каждой транзакцией в таблицу
+    ingest_checkpoints записывается количество импортированных строк файла, поэтому прерванный
+    импорт продолжается с места последнего коммита без дублей.
+    """
+    def __init__(self, database_path: str, batch_size: int = 1000, batches_per_commit: int = 20,
+                 workers: int = None):
+        """
+        Инициализирует импорт.
+
+        Параметры:
+        database_path (str): Путь к файлу базы данных.
+        batch_size (int): Количество строк в пачке, которая шифруется одним процессом.
+        batches_per_commit (int): Количество пачек в одной транзакции.
+        workers (int): Количество процессов шифрования. По умолчанию - число ядер.
+        """
+        self.database_path = database_path
+        self.batch_size = batch_size
+        self.batches_per_commit = batches_per_commit
+        self.workers = workers or os.cpu_count()
+
+    def run(self, csv_path: str) -> int:
+        """
+        Импортирует заявки из CSV файла.
+
+        Файл должен содержать заголовок со столбцами user_id, user_name, request_id,
+        problem_description, contact_info, contact_time. Необязательный столбец created_at задает
+        время приема заявки (unix time); без него created_at остается пустым.
+
+        Параметры:
+        csv_path (str): Путь к CSV файлу.
+
+        Возвращает:
+        int: Количество строк, импортированных за этот запуск.
+        """
+        BotDatabase(self.database_path).create_tables()
+        source = os.path.abspath(csv_path)
+
+        connection = sqlite3.connect(self.database_path)
+        try:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_checkpoints (source TEXT PRIMARY KEY, rows_done INTEGER)""")
+            checkpoint = connection.execute(
+                "SELECT rows_done FROM ingest_checkpoints WHERE source = ?", (source,)).fetchone()
+            rows_done = checkpoint[0] if checkpoint else 0
+
+            with open(csv_path, newline='', encoding='UTF-8') as file:
+                reader = csv.DictReader(file)
+                missing = set(FIELDS) - set(reader.fieldnames or ())
+                if missing:
+                    raise ValueError(f"В CSV нет столбцов: {', '.join(sorted(missing))}")
+
+                rows = itertools.islice(reader, rows_done, None)  # Пропускаем уже импортированные строки
+                batches = iter(lambda: list(itertools.islice(rows, self.batch_size)), [])
+                ingested = 0
+
+                # Пачки на транзакцию, но не меньше двух на процесс, чтобы процессы не простаивали
+                prefetch = max(self.batches_per_commit, self.workers * 2)
+                with ProcessPoolExecutor(self.workers) as executor:
+                    pending = deque()  # Не больше prefetch пачек в памяти одновременно
+                    for batch in batches:
+                        pending.append((len(batch), executor.submit(encrypt_batch, batch)))
+                        if len(pending) >= prefetch:
+                            ingested += self._write(connection, source, rows_done + ingested, pending)
+                    while pending:
+                        ingested += self._write(connection, source, rows_done + ingested, pending)
+        finally:
+            connection.close()
+
+        return ingested
+
+    def _write(self, connection: sqlite3.Connection, source: str, rows_done: int, pending: deque) -> int:
+        """
+        Записывает готовые пачки одной транзакцией вместе с контрольной точкой.
+
+        Параметры:
+        connection (sqlite3.Connection): Соединение с базой данных.
+        source (str): Абсолютный путь к CSV файлу (ключ контрольной точки).
+        rows_done (int): Количество строк файла, импортированных до этой транзакции.
+        pending (deque): Очередь пар (размер пачки, future с результатом шифрования).
+
+        Возвращает:
+        int: Количество строк, записанных этой транзакцией.
+        """
+        written = 0
+        with connection:  # Одна транзакция: строки и контрольная точка фиксируются вместе
+            for _ in range(min(self.batches_per_commit, len(pending))):
+                size, future = pending.popleft()
+                users, requests = future.result()
+                connection.executemany(BotDatabase.INSERT_USER_SQL, users)
+                connection.executemany(INSERT_REQUEST_SQL, requests)
+                written += size
+            connection.execute(
+                "INSERT OR REPLACE INTO ingest_checkpoints (source, rows_done) VALUES (?, ?)",
+                (source, rows_done + written))
+        logger.info(f"Импортировано строк: {rows_done + written}")
+        return written
+
+
+if __name__ == "__main__":
+    """
+    Этот модуль можно запустить напрямую через терминал в формате:
+    `python ingest.py <путь к базе данных> <путь к CSV файлу> -b <строк в пачке> -c <пачек в транзакции>
+    -w <число процессов>`, тем самым импортировав исторические заявки. При повторном запуске с тем же
+    файлом импорт продолжается с последней сохраненной контрольной точки.
+    """
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Bulk import requests from CSV into the encrypted database')
+
+    parser.add_argument('database_path', help='Path to database')
+    parser.add_argument('csv_path', help='Path to CSV file with requests')
+    parser.add_argument('-b', '--batch_size', type=int, default=1000, help='Rows per encryption batch')
+    parser.add_argument('-c', '--batches_per_commit', type=int, default=20, help='Batches per transaction')
+    parser.add_argument('-w', '--workers', type=int, help='Number of encryption processes')
+    args = parser.parse_args()
+
+    BulkIngest(args.database_path, args.batch_size, args.batches_per_commit, args.workers).run(args.csv_path)
@@ -0,0 +1,269 @@
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм в секундах
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Описания метрик для строк # HELP в текстовом формате Prometheus
+DESCRIPTIONS = {
+    'bot_handler_seconds': 'Time spent in a bot command handler.',
+    'bot_send_message_seconds': 'Time spent in Bot.send_message calls made by handlers.',
+    'bot_update_queue_size': 'Number of updates waiting in the application update queue.',
+    'db_operation_seconds': 'Time spent in a SQLite operation.',
+    'outbox_pending_records': 'Number of outbox records not yet applied to the database.',
+    'crypto_seconds': 'Time spent in a Crypt call.',
+    'scheduler_job_seconds': 'Duration of a scheduled publishing job.',
+    'writer_queue_size': 'Number of requests waiting for the database writer.',
+    'publish_pending_writes': 'Number of written requests not yet published.',
+}
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами (в формате Prometheus).
+    """
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        """
+        Инициализация гистограммы.
+
+        :param buckets: Верхние границы корзин по возрастанию.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина - +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """
+        Добавляет наблюдение в гистограмму.
+
+        :param value: Наблюдаемое значение (обычно длительность в секундах).
+        :return: None
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценивает квантиль по корзинам (возвращает верхнюю границу корзины, в которую попадает квантиль).
+
+        :param q: Квантиль от 0 до 1.
+        :return: Оценка квантиля или 0.0, если наблюдений не было.
+        """
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """
+    Реестр метрик бота: гистограммы длительностей и гейджи, вычисляемые при чтении.
+
+    Метрика идентифицируется именем и набором меток. Запись наблюдения стоит одного
+    вызова perf_counter и bisect, поэтому метрики можно оставлять включенными в продакшене.
+    """
+    def __init__(self):
+        """
+        Инициализация пустого реестра.
+        """
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """
+        Возвращает гистограмму с указанным именем и метками, создавая ее при первом обращении.
+
+        :param name: Имя метрики.
+        :param labels: Метки метрики.
+        :return: Экземпляр Histogram.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def gauge(self, name: str, func, **labels) -> None:
+        """
+        Регистрирует гейдж, значение которого вычисляется функцией при каждом чтении метрик.
+
+        :param name: Имя метрики.
+        :param func: Функция без аргументов, возвращающая текущее значение.
+        :param labels: Метки метрики.
+        :return: None
+        """
+        self.gauges[(name, tuple(sorted(labels.items())))] = func
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        """
+        Контекстный менеджер, измеряющий длительность блока и записывающий ее в гистограмму.
+
+        :param name: Имя метрики.
+        :param labels: Метки метрики.
+        """
+        histogram = self.histogram(name, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def timed(self, name: str, **labels):
+        """
+        Декоратор, измеряющий длительность вызова функции (обычной или асинхронной).
+
+        :param name: Имя метрики.
+        :param labels: Метки метрики.
+        :return: Декоратор.
+        """
+        def decorator(func):
+            histogram = self.histogram(name, **labels)
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        histogram.observe(time.perf_counter() - start)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def render(self) -> str:
+        """
+        Формирует текущие значения всех метрик в текстовом формате Prometheus.
+
+        :return: Текст для ответа на запрос /metrics.
+        """
+        lines, described = [], set()
+
+        def header(name: str, metric_type: str) -> None:
+            if name not in described:
+                described.add(name)
+                if name in DESCRIPTIONS:
+                    lines.append(f'# HELP {name} {DESCRIPTIONS[name]}')
+                lines.append(f'# TYPE {name} {metric_type}')
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+
+        for (name, labels), func in sorted(self.gauges.items(), key=lambda item: item[0]):
+            try:
+                value = func()
+            except Exception as e:
+                logger.warning(f'Не удалось получить значение метрики {name}: {e}')
+                continue
+            header(name, 'gauge')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> str:
+        """
+        Формирует краткую сводку по гистограммам для записи в лог.
+
+        :return: Строка вида "имя{метки}: count=.. avg=..ms p50<=..ms p95<=..ms" для каждой гистограммы.
+        """
+        return '; '.join(
+            f'{name}{_format_labels(labels)}: count={histogram.count} '
+            f'avg={histogram.sum / histogram.count * 1000:.2f}ms '
+            f'p50<={histogram.quantile(0.5) * 1000:g}ms p95<={histogram.quantile(0.95) * 1000:g}ms'
+            for (name, labels), histogram in sorted(self.histograms.items()) if histogram.count)
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """
+        Запускает в фоновом потоке HTTP-сервер, отдающий метрики по пути /metrics.
+
+        :param port: Порт сервера (0 - выбрать свободный порт).
+        :param host: Адрес, на котором слушает сервер. По умолчанию только локальный.
+        :return: Экземпляр сервера (server.server_address содержит фактический адрес).
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('UTF-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Не засоряем лог бота запросами сборщика метрик
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        return server
+
+    def log_periodically(self, interval: float) -> threading.Event:
+        """
+        Запускает фоновый поток, который раз в interval секунд пишет сводку метрик в лог.
+
+        :param interval: Интервал между записями в секундах.
+        :return: Событие, установка которого останавливает поток.
+        """
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                summary = self.snapshot()
+                if summary:
+                    logger.info(f'Метрики: {summary}')
+
+        threading.Thread(target=run, name='metrics-logger', daemon=True).start()
+        return stop
+
+
+def _format_labels(labels: tuple) -> str:
+    """
+    Форматирует метки в виде {key="value",...}.
+
+    :param labels: Кортеж пар (ключ, значение).
+    :return: Строка меток или пустая строка, если меток нет.
+    """
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+metrics = Metrics()  # Общий реестр метрик процесса
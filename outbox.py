@@ -0,0 +1,317 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    """
+    Надежный журнал принятых заявок, из которого они переносятся в базу данных в фоне.
+
+    Заявка шифруется, дописывается в файл журнала одной строкой JSON с порядковым номером
+    (seq) и сбрасывается на диск (fsync), после чего пользователю можно сразу отвечать.
+    Фоновый поток переносит записи журнала в SQLite пачками; номер последней перенесенной
+    записи сохраняется в таблице outbox_state той же транзакцией, поэтому запись не
+    применяется дважды. Если база данных заблокирована (например, экспортом), перенос
+    повторяется через retry_interval секунд. Если пачка не применяется по другой причине
+    (например, поврежденная запись или нарушение ограничения), записи применяются по одной, а
+    неприменимые переносятся в файл недоставленных записей (<журнал>.dead) с записью в лог, чтобы
+    одна плохая запись не задерживала все следующие. При запуске непримененные записи журнала
+    переносятся заново, а недописанная при сбое последняя строка отбрасывается.
+    Когда все записи перенесены, файл журнала очищается.
+
+    В журнале хранятся только зашифрованные значения.
+    """
+    def __init__(self, path: str, database_path: str, retry_interval: float = 1.0, poll_interval: float = 5.0):
+        """
+        Открывает журнал и восстанавливает его состояние.
+
+        Параметры:
+        path (str): Путь к файлу журнала.
+        database_path (str): Путь к файлу базы данных.
+        retry_interval (float): Пауза в секундах перед повтором, если база данных недоступна.
+        poll_interval (float): Как часто в секундах поток проверяет журнал без новых записей.
+        """
+        self.path = path
+        self.dead_letter_path = f'{path}.dead'
+        self.database_path = database_path
+        self.retry_interval = retry_interval
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()  # Запись в журнал и его очистка
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._position = 0  # Позиция в файле, до которой записи уже прочитаны
+
+        BotDatabase(database_path).create_tables()
+        connection = sqlite3.connect(database_path)
+        try:
+            with connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS outbox_state (name TEXT PRIMARY KEY, last_seq INTEGER)")
+            state = connection.execute(
+                "SELECT last_seq FROM outbox_state WHERE name = ?", (os.path.abspath(path),)).fetchone()
+        finally:
+            connection.close()
+        self._applied_seq = state[0] if state else 0
+
+        created = not os.path.exists(path)
+        self._file = open(path, 'a+b')
+        if created:  # Иначе после сбоя питания файл с уже подтвержденными записями мог бы пропасть
+            self._fsync_directory()
+        self._file.seek(0)
+        content = self._file.read()
+        complete = content[:content.rfind(b'\n') + 1]
+        if len(complete) < len(content):  # Строка, недописанная при сбое, отбрасывается
+            logger.warning(f'Журнал {path}: отброшена недописанная запись ({len(content) - len(complete)} байт)')
+            os.ftruncate(self._file.fileno(), len(complete))
+            os.fsync(self._file.fileno())
+        seqs = [record['seq'] for record in map(self._parse, complete.splitlines()) if record is not None]
+        self._seq = max(seqs[-1] if seqs else 0, self._applied_seq)
+
+        metrics.gauge('outbox_pending_records', lambda: self._seq - self._applied_seq)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def open(path: str, database_path: str) -> 'Outbox':
+        """
+        Возвращает общий для процесса журнал с запущенным фоновым переносом.
+
+        Параметры:
+        path (str): Путь к файлу журнала.
+        database_path (str): Путь к файлу базы данных.
+
+        Возвращает:
+        Outbox: Журнал (один экземпляр на пару путей).
+        """
+        outbox = Outbox(path, database_path)
+        outbox.start()
+        return outbox
+
+    async def save_user_data(self,
+            user_id: str,
+            user_name: str,
+            request_id: str,
+            problem_description: str,
+            contact_info: str,
+            contact_time: str
+    ) -> int:
+        """
+        Шифрует заявку и надежно записывает ее в журнал (аналог BotDatabase.save_user_data).
+
+        Параметры:
+        user_id (str): Идентификатор пользователя.
+        user_name (str): Имя пользователя.
+        request_id (str): Идентификатор заявки.
+        problem_description (str): Описание проблемы.
+        contact_info (str): Контактная информация пользователя.
+        contact_time (str): Предпочтительное время для связи.
+
+        Возвращает:
+        int: Порядковый номер записи в журнале.
+        """
+        # Обе строки шифруются за один переход в пул потоков
+        user_row, request_row = await Crypt.encrypt_rows(
+            [(user_id, user_name, contact_info), (request_id, user_id, problem_description, contact_time)])
+        user_row = (*user_row, Crypt.user_key(user_id))
+        return await asyncio.to_thread(self.append, user_row, request_row)  # fsync не блокирует цикл событий
+
+    def append(self, user_row: tuple, request_row: tuple) -> int:
+        """
+        Дописывает зашифрованную заявку в журнал и сбрасывает его на диск.
+
+        Параметры:
+        user_row (tuple): Зашифрованные значения и user_key для таблицы users.
+        request_row (tuple): Зашифрованные значения для таблицы requests.
+
+        Возвращает:
+        int: Порядковый номер записи в журнале.
+        """
+        with metrics.time('db_operation_seconds', operation='outbox_append'), self._lock:
+            seq = self._seq + 1
+            record = json.dumps({'seq': seq, **BotDatabase.to_record(user_row, request_row)})
+            self._file.write(record.encode() + b'\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._seq = seq
+        self._wakeup.set()
+        return seq
+
+    def drain(self) -> int:
+        """
+        Переносит в базу данных все записи журнала, которые еще не были перенесены.
+
+        Возвращает:
+        int: Количество перенесенных записей (вместе с перенесенными в файл недоставленных).
+
+        Исключения:
+        sqlite3.OperationalError: Если база данных недоступна (например, заблокирована).
+        """
+        with open(self.path, 'rb') as file:
+            file.seek(self._position)
+            content = file.read()
+        content = content[:content.rfind(b'\n') + 1]  # Только полностью записанные строки
+        lines = content.splitlines()
+        records = [record for record in map(self._parse, lines)
+                   if record is not None and record['seq'] > self._applied_seq]
+
+        if records:
+            try:
+                self._apply(records)
+            except sqlite3.OperationalError:
+                raise
+            except Exception as e:
+                logger.warning(f'Журнал {self.path}: пачка не применена ({e}), записи применяются по одной')
+                for record in records:
+                    try:
+                        self._apply([record])
+                    except sqlite3.OperationalError:
+                        raise
+                    except Exception as e:
+                        self._dead_letter(json.dumps(record).encode(), e)
+                        self._apply([record], skip=True)
+
+        # Строки, которые не удалось разобрать, переносятся, когда все записи до них применены
+        for line in lines:
+            if self._parse(line) is None:
+                self._dead_letter(line, ValueError('запись не разобрана'))
+        self._position += len(content)
+
+        with self._lock:  # Все записи перенесены: очищаем журнал, пока в него никто не пишет
+            if self._applied_seq == self._seq and self._position:
+                os.ftruncate(self._file.fileno(), 0)
+                os.fsync(self._file.fileno())
+                self._position = 0
+        return len(records)
+
+    def _apply(self, records: list, skip: bool = False) -> None:
+        """
+        Записывает записи журнала в базу данных одной транзакцией вместе с номером последней из них.
+
+        Параметры:
+        records (list): Записи журнала по возрастанию seq.
+        skip (bool): Только сдвинуть номер последней перенесенной записи, не записывая заявки.
+        """
+        connection = sqlite3.connect(self.database_path, timeout=self.retry_interval)
+        try:
+            # Одна транзакция: записи и номер последней перенесенной записи фиксируются вместе
+            with metrics.time('db_operation_seconds', operation='outbox_apply'), connection:
+                if not skip:
+                    connection.executemany(
+                        BotDatabase.INSERT_USER_SQL, [BotDatabase.record_user_row(record) for record in records])
+                    connection.executemany(
+                        BotDatabase.INSERT_REQUEST_SQL, [BotDatabase.record_request_row(record) for record in records])
+                connection.execute("INSERT OR REPLACE INTO outbox_state (name, last_seq) VALUES (?, ?)",
+                                   (os.path.abspath(self.path), records[-1]['seq']))
+        finally:
+            connection.close()
+        self._applied_seq = records[-1]['seq']
+        if not skip:
+            BotDatabase.notify_write(len(records))
+
+    def _dead_letter(self, line: bytes, error: Exception) -> None:
+        """
+        Дописывает неприменимую запись журнала в файл недоставленных записей и сбрасывает его на диск.
+
+        Параметры:
+        line (bytes): Строка журнала.
+        error (Exception): Ошибка, из-за которой запись не применена.
+        """
+        logger.error(f'Журнал {self.path}: запись перенесена в {self.dead_letter_path}: {error}')
+        created = not os.path.exists(self.dead_letter_path)
+        with open(self.dead_letter_path, 'ab') as file:
+            file.write(line + b'\n')
+            file.flush()
+            os.fsync(file.fileno())
+        if created:
+            self._fsync_directory()
+
+    def _fsync_directory(self) -> None:
+        """
+        Фиксирует на диске создание файла в папке журнала (на Windows не поддерживается).
+        """
+        if hasattr(os, 'O_DIRECTORY'):
+            directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    @staticmethod
+    def _parse(line: bytes):
+        """
+        Разбирает строку журнала.
+
+        Параметры:
+        line (bytes): Строка журнала.
+
+        Возвращает:
+        dict | None: Запись журнала или None, если строка повреждена.
+        """
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) and isinstance(record.get('seq'), int) else None
+
+    def start(self) -> None:
+        """
+        Запускает фоновый поток переноса записей в базу данных.
+        """
+        self._thread = threading.Thread(target=self._run, name='outbox', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Останавливает фоновый поток и закрывает журнал. Непримененные записи остаются в журнале.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._file.close()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Ожидает, пока все записанные в журнал заявки будут перенесены в базу данных.
+
+        Параметры:
+        timeout (float): Максимальное время ожидания в секундах.
+
+        Возвращает:
+        bool: True, если все записи перенесены.
+        """
+        target = self._seq
+        waited = 0.0
+        while self._applied_seq < target and (timeout is None or waited < timeout):
+            self._wakeup.set()
+            self._stopped.wait(0.01)
+            waited += 0.01
+        return self._applied_seq >= target
+
+    def _run(self) -> None:
+        """
+        Цикл фонового потока: переносит записи при появлении новых и повторяет при ошибках.
+        """
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                if self.drain():
+                    continue
+            except sqlite3.OperationalError as e:
+                logger.warning(f'Журнал {self.path}: база данных недоступна, повтор через {self.retry_interval} с: {e}')
+                self._stopped.wait(self.retry_interval)
+                continue
+            except Exception as e:
+                logger.error(f'Журнал {self.path}: ошибка переноса записей: {e}')
+                self._stopped.wait(self.retry_interval)
+                continue
+            self._wakeup.wait(self.poll_interval)
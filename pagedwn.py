@@ -1,13 +1,18 @@
 import argparse
+import gzip
+import hashlib
+import json
+import os
+from urllib.parse import urljoin
+
 import requests
-from bs4 import BeautifulSoup
 try:
     from config import config
 except ImportError:
     from test_config import test_config
     config = test_config
 
-from crypt_data import Crypt
+from dbscripts import BotDatabase
 
 
 def github_page_downloader(table_name: str, output_file: str, decrypt: bool) -> None:
@@ -23,13 +28,96 @@ def github_page_downloader(table_name: str, output_file: str, decrypt: bool) ->
     response = requests.get(default_url)
     html_data = response.text
 
+    with open(output_file if output_file else f'{table_name}.html', 'w', encoding='UTF-8') as file:
+        file.write(parse_table_page(html_data, decrypt))
+
+
+def parse_table_page(html_data: str, decrypt: bool) -> str:
+    """
+    Разбирает html-страницу с таблицей и, при необходимости, расшифровывает ячейки.
+
+    Если в таблице есть столбец row_token (строки, зашифрованные одним токеном), при расшифровке
+    он раскрывается в обычные столбцы и удаляется.
+
+    :param html_data: Содержимое html-страницы.
+    :param decrypt: Флаг, указывающий, нужно ли расшифровывать данные.
+    :return: Отформатированная html-страница.
+    """
+    from bs4 import BeautifulSoup  # Парсер нужен только для режима страницы, поэтому импортируется здесь
+
     soup = BeautifulSoup(html_data, 'html.parser')
 
-    for td in soup.find_all('td'):
-        td.string = Crypt.decrypt_data(td.string) if decrypt else td.string
+    if not decrypt:
+        return soup.prettify()
 
-    with open(output_file if output_file else f'{table_name}.html', 'w', encoding='UTF-8') as file:
-        file.write(soup.prettify())
+    headers = soup.find_all('th')
+    columns = tuple(th.string for th in headers)
+    envelope = bool(columns) and columns[-1] == BotDatabase.ROW_TOKEN_COLUMN
+    for tr in soup.find_all('tr'):
+        cells = tr.find_all('td')
+        if cells:
+            for td, value in zip(cells, BotDatabase.decrypt_row(columns, [td.string for td in cells])):
+                td.string = value
+            if envelope:
+                cells[-1].decompose()
+    if envelope:
+        headers[-1].decompose()
+
+    return soup.prettify()
+
+
+def github_feed_downloader(table_name: str, output_file: str, decrypt: bool, cache_dir: str = None) -> int:
+    """
+    Инкрементально скачивает фид таблицы (манифест и сжатые сегменты JSON Lines).
+
+    Сегменты сохраняются в папку кэша под именем своего SHA-256, поэтому при повторном запуске
+    скачиваются только новые или изменившиеся сегменты. Из всех сегментов собирается файл
+    JSON Lines, где каждая строка - объект {столбец: значение}.
+
+    :param table_name: Имя таблицы, фид которой нужно скачать.
+    :param output_file: Путь к выходному файлу. Если не указан, используется имя таблицы.
+    :param decrypt: Флаг, указывающий, нужно ли расшифровывать данные.
+    :param cache_dir: Папка для кэша сегментов. Если не указана, используется имя таблицы с суффиксом .cache.
+    :return: Количество скачанных сегментов.
+    """
+    manifest_url = config['pagedwn']['feeds_urls'][table_name]
+    cache_dir = cache_dir if cache_dir else f'{table_name}.cache'
+    os.makedirs(cache_dir, exist_ok=True)
+
+    response = requests.get(manifest_url)
+    response.raise_for_status()
+    manifest = response.json()
+
+    columns = tuple(manifest['columns'])
+    downloaded = 0
+    with open(output_file if output_file else f'{table_name}.jsonl', 'w', encoding='UTF-8') as file:
+        for segment in manifest['segments']:
+            segment_path = os.path.join(cache_dir, f"{segment['sha256']}.jsonl.gz")
+
+            if not os.path.exists(segment_path):
+                segment_response = requests.get(urljoin(manifest_url, segment['file']))
+                segment_response.raise_for_status()
+                data = segment_response.content
+                if hashlib.sha256(data).hexdigest() != segment['sha256']:
+                    raise ValueError(f"Контрольная сумма сегмента {segment['file']} не совпадает с манифестом")
+                with open(segment_path, 'wb') as segment_file:
+                    segment_file.write(data)
+                downloaded += 1
+
+            with gzip.open(segment_path, 'rt', encoding='UTF-8') as segment_file:
+                for line in segment_file:
+                    values = json.loads(line)
+                    if decrypt and manifest.get('encrypted', True):
+                        values = BotDatabase.decrypt_row(columns, values)  # Столбец row_token раскрывается
+                    file.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + '\n')
+
+    # Удаляем из кэша сегменты, которых больше нет в манифесте
+    actual_files = {f"{segment['sha256']}.jsonl.gz" for segment in manifest['segments']}
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith('.jsonl.gz') and file_name not in actual_files:
+            os.remove(os.path.join(cache_dir, file_name))
+
+    return downloaded
 
 
 def main() -> None:
@@ -43,6 +131,8 @@ def main() -> None:
     parser.add_argument('table_name', help='Name of the table to download')
     parser.add_argument('-o', '--output_file', help='Path to the output file')
     parser.add_argument('-d', '--decrypt', help='Decryption flag')
+    parser.add_argument('-f', '--feed', action='store_true', help='Download the JSON Lines feed instead of the html page')
+    parser.add_argument('-c', '--cache_dir', help='Directory for cached feed segments')
 
     args = parser.parse_args()
 
@@ -55,7 +145,10 @@ def main() -> None:
         else:
             print('Incorrect flag')
 
-    github_page_downloader(args.table_name, args.output_file, decrypt=decrypt_flag)
+    if args.feed:
+        github_feed_downloader(args.table_name, args.output_file, decrypt=decrypt_flag, cache_dir=args.cache_dir)
+    else:
+        github_page_downloader(args.table_name, args.output_file, decrypt=decrypt_flag)
 
 
 if __name__ == '__main__':
@@ -66,5 +159,6 @@ if __name__ == '__main__':
     : True или False (опционально, по умолчанию стоит флаг True)>`,
 
     тем самым вручную скачав таблицу в эту же папку, либо в другое указанное место.
+    С флагом `-f` вместо страницы скачивается фид таблицы (только новые сегменты, кэш в `-c <папка>`).
     """
     main()
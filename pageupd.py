@@ -1,19 +1,28 @@
-import git
-from apscheduler.schedulers.background import BackgroundScheduler
+import os
+import threading
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING
 from expdata import ExportData
+from metrics import metrics
+from profiling import Profiler, span
 try:
     from config import config
 except ImportError:
     from test_config import test_config
     config = test_config
 
+if TYPE_CHECKING:
+    from apscheduler.schedulers.background import BackgroundScheduler
+
 
 class GithubPageUpdater:
     """
     Класс для обновления страницы на GitHub с помощью автоматического экспорта данных
     и коммита изменений в репозиторий.
     """
-    def __init__(self, local_repo: str, database_path: str, html_files: dict, commit_message: str):
+    def __init__(self, local_repo: str, database_path: str, html_files: dict, commit_message: str,
+                 rows_per_page: int = None, feed_segment_rows: int = None, archive_dir: str = None):
         """
         Инициализация класса GithubPageUpdater.
 
@@ -21,19 +30,60 @@ class GithubPageUpdater:
         :param database_path: Путь к базе данных для экспорта данных.
         :param html_files: Словарь, где ключи - имена таблиц, а значения - пути к выходным HTML файлам.
         :param commit_message: Сообщение для коммита в Git.
+        :param rows_per_page: Количество строк на одной странице. Если указано, каждая таблица публикуется
+        постранично: HTML файл становится оглавлением, а страницы сохраняются в одноименную папку.
+        :param feed_segment_rows: Количество строк в одном сегменте фида. Если указано, рядом с каждым
+        HTML файлом публикуется сжатый JSON Lines фид с манифестом (users.html -> users.feed/).
+        :param archive_dir: Папка архива старых заявок (см. archive.py). Если указана, архивные строки
+        публикуются вместе со строками базы данных.
         """
         self.local_repo = local_repo
         self.database_path = database_path
         self.html_files = html_files
         self.commit_message = commit_message
+        self.rows_per_page = rows_per_page
+        self.feed_segment_rows = feed_segment_rows
+        self.archive_dir = archive_dir
+        self._publish_lock = threading.Lock()  # Публикация по расписанию и по записи не выполняются одновременно
+
+    @staticmethod
+    def feed_dir(output_file: str) -> str:
+        """
+        Возвращает путь к папке фида для указанного HTML файла.
+
+        :param output_file: Путь к HTML файлу таблицы.
+        :return: Путь к папке фида.
+        """
+        return f'{os.path.splitext(output_file)[0]}.feed'
+
+    def published_paths(self) -> list:
+        """
+        Возвращает пути, которые нужно добавить в индекс Git при публикации.
 
-    def push_to_github(self) -> None:
+        :return: Список HTML файлов и, при постраничной публикации, папок со страницами.
+        """
+        paths = list(self.html_files.values())
+        if self.rows_per_page:
+            paths += [os.path.splitext(output_file)[0] for output_file in self.html_files.values()]
+        if self.feed_segment_rows:
+            paths += [self.feed_dir(output_file) for output_file in self.html_files.values()]
+        return paths
+
+    @metrics.timed('scheduler_job_seconds', job='push_to_github')
+    def push_to_github(self) -> bool:
         """
         Коммитит изменения в локальном репозитории и отправляет их на GitHub.
+
+        :return: False, если опубликованные файлы не изменились (коммит и push не выполняются).
         """
+        import git  # GitPython нужен только при публикации, поэтому импортируется здесь
+
         repo = git.Repo(self.local_repo)  # Инициализация репозитория
-        repo.git.add(list(self.html_files.values()))  # Добавление HTML файлов в индекс
-        repo.index.commit(self.commit_message)  # Коммит изменений
+        with span('commit'):
+            repo.git.add('--all', '--', *self.published_paths())  # Добавление HTML файлов (и удаленных страниц) в индекс
+            if repo.head.is_valid() and not repo.is_dirty(index=True, working_tree=False, untracked_files=False):
+                return False  # Данные не изменились: пустой коммит и push не нужны
+            repo.index.commit(self.commit_message)  # Коммит изменений
 
         current_branch = repo.active_branch  # Получение текущей ветки
         tracking_branch = current_branch.tracking_branch()  # Получение отслеживаемой ветки
@@ -42,9 +92,24 @@ class GithubPageUpdater:
         if tracking_branch is None:
             repo.git.branch('--set-upstream-to=origin/main', current_branch.name)
 
-        repo.remotes.origin.push()  # Отправка изменений на GitHub
+        with span('push'):
+            repo.remotes.origin.push()  # Отправка изменений на GitHub
+        return True
+
+    def publish(self) -> bool:
+        """
+        Создает HTML файлы и отправляет изменения на GitHub.
+
+        Если задана переменная окружения BSMDB_PROFILE, запуск профилируется, а статистика
+        cProfile и трасса этапов (export, decrypt, render, commit, push) сохраняются в указанную папку.
+
+        :return: False, если опубликованные файлы не изменились.
+        """
+        with self._publish_lock, Profiler.from_env('publish'):
+            self.htmls_creator()  # Создание HTML файлов
+            return self.push_to_github()  # Отправка изменений на GitHub
 
-    def _add_job(self, at_hour: int, at_minutes: int) -> BackgroundScheduler:
+    def _add_job(self, at_hour: int, at_minutes: int) -> 'BackgroundScheduler':
         """
         Добавляет задачу в планировщик для автоматического обновления GitHub.
 
@@ -52,15 +117,17 @@ class GithubPageUpdater:
         :param at_minutes: Минуты, в которые будет выполняться задача.
         :return: Экземпляр планировщика.
         """
+        from apscheduler.schedulers.background import BackgroundScheduler  # Нужен только для работы по расписанию
+
         scheduler = BackgroundScheduler()
         scheduler.add_job(
-            self.push_to_github, 'cron',
+            self.publish, 'cron',
             hour=at_hour, minute=at_minutes
         )
         scheduler.start()  # Запуск планировщика
         return scheduler
 
-    def run_on_schedule(self, hour: int, minutes: int) -> BackgroundScheduler:
+    def run_on_schedule(self, hour: int, minutes: int) -> 'BackgroundScheduler':
         """
         Запускает создание HTML файлов и добавляет задачу в планировщик.
 
@@ -76,15 +143,89 @@ class GithubPageUpdater:
         """
         Выполняет создание HTML файлов и немедленно отправляет изменения на GitHub.
         """
-        self.htmls_creator()  # Создание HTML файлов
-        self.push_to_github()  # Отправка изменений на GitHub
+        self.publish()
 
+    @metrics.timed('scheduler_job_seconds', job='htmls_creator')
     def htmls_creator(self) -> None:
         """
-        Создает HTML файлы из данных базы данных.
+        Создает HTML файлы (и, если настроено, фиды) из данных базы данных.
         """
         for table_name, output_file in self.html_files.items():
-            ExportData.export_to_html(self.database_path, table_name, output_file, decrypt=False)  # Экспорт данных в HTML
+            with span('export', table=table_name):
+                if self.rows_per_page:
+                    ExportData.export_to_html_pages(
+                        self.database_path, table_name, output_file, self.rows_per_page, decrypt=False,
+                        archive_dir=self.archive_dir)
+                else:
+                    ExportData.export_many(self.database_path, table_name, {'html': output_file}, decrypt=False,
+                                           archive_dir=self.archive_dir)  # Экспорт данных в HTML
+                if self.feed_segment_rows:
+                    ExportData.export_to_feed(
+                        self.database_path, table_name, self.feed_dir(output_file), self.feed_segment_rows,
+                        decrypt=False, archive_dir=self.archive_dir)
+
+
+class PublishTrigger:
+    """
+    Класс для публикации страницы по записи новых заявок вместо ежедневного запуска.
+
+    Подписывается на запись заявок (BotDatabase.add_write_listener) и планирует публикацию
+    в планировщике: через quiet_seconds секунд после последней записи или сразу, как только
+    накопилось max_writes заявок. Каждая новая запись переносит отложенную публикацию (одна
+    задача с постоянным id), а между публикациями проходит не меньше min_interval секунд.
+    """
+    JOB_ID = 'publish_on_write'
+
+    def __init__(self, publish, scheduler: 'BackgroundScheduler', max_writes: int = 50,
+                 quiet_seconds: float = 300, min_interval: float = 900):
+        """
+        Инициализация триггера публикации.
+
+        :param publish: Функция публикации (например, GithubPageUpdater.publish).
+        :param scheduler: Запущенный планировщик, в котором выполняется публикация.
+        :param max_writes: Количество новых заявок, после которого публикация выполняется без ожидания.
+        :param quiet_seconds: Пауза в секундах после последней записи, после которой выполняется публикация.
+        :param min_interval: Минимальный интервал в секундах между публикациями.
+        """
+        self.publish = publish
+        self.scheduler = scheduler
+        self.max_writes = max_writes
+        self.quiet_seconds = quiet_seconds
+        self.min_interval = min_interval
+        self.pending = 0  # Заявки, записанные после последней публикации
+        self.last_publish = 0.0
+        self._lock = threading.Lock()
+        metrics.gauge('publish_pending_writes', lambda: self.pending)
+
+    def on_write(self, count: int = 1) -> None:
+        """
+        Учитывает записанные заявки и переносит время публикации.
+
+        :param count: Количество записанных заявок.
+        """
+        with self._lock:
+            self.pending += count
+            now = time.time()
+            due = now if self.pending >= self.max_writes else now + self.quiet_seconds
+            due = max(due, self.last_publish + self.min_interval)
+            self.scheduler.add_job(self.run, 'date', run_date=datetime.fromtimestamp(due),
+                                   id=self.JOB_ID, replace_existing=True)
+
+    def run(self) -> None:
+        """
+        Публикует страницу, если после прошлой публикации были записаны заявки.
+        """
+        with self._lock:
+            count, self.pending = self.pending, 0
+            self.last_publish = time.time()
+        if not count:
+            return
+        try:
+            self.publish()
+        except Exception:
+            # Заявки возвращаются в очередь, и публикация повторяется не раньше min_interval
+            self.on_write(count)
+            raise
 
 
 if __name__ == '__main__':
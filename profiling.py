@@ -0,0 +1,129 @@
+import cProfile
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+PROFILE_ENV = 'BSMDB_PROFILE'  # Переменная окружения с папкой для профилей
+
+_active_profiler = contextvars.ContextVar('active_profiler', default=None)
+
+
+class Profiler:
+    """
+    Необязательное профилирование одного запуска (экспорта или публикации).
+
+    Внутри запуска код размечается именованными интервалами (span). По завершении в папку
+    профилей сохраняются два файла: статистика cProfile (<имя>-<время>.pstats, открывается
+    через pstats или snakeviz) и трасса интервалов в формате Chrome Trace Event
+    (<имя>-<время>.trace.json, открывается в chrome://tracing, Perfetto или speedscope).
+    Если папка не указана, профилировщик выключен и ничего не замедляет.
+    """
+    def __init__(self, name: str, output_dir: str = None):
+        """
+        Инициализация профилировщика.
+
+        :param name: Имя запуска, используется в именах файлов.
+        :param output_dir: Папка для файлов профиля. Если не указана, профилирование выключено.
+        """
+        self.name = name
+        self.output_dir = output_dir
+        self.events = []
+        self.files = []
+        self._profile = None
+        self._token = None
+        self._start = None
+
+    @classmethod
+    def from_env(cls, name: str, output_dir: str = None) -> 'Profiler':
+        """
+        Создает профилировщик, включенный явно переданной папкой или переменной окружения BSMDB_PROFILE.
+
+        :param name: Имя запуска.
+        :param output_dir: Папка для файлов профиля (например, из флага командной строки).
+        :return: Экземпляр Profiler.
+        """
+        return cls(name, output_dir or os.environ.get(PROFILE_ENV))
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Включен ли профилировщик.
+        """
+        return bool(self.output_dir)
+
+    def __enter__(self) -> 'Profiler':
+        if self.enabled:
+            self._token = _active_profiler.set(self)
+            self._start = time.perf_counter()
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.enabled:
+            self._profile.disable()
+            _active_profiler.reset(self._token)
+            self.events.append(self._event(self.name, self._start, time.perf_counter()))
+            self.dump()
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """
+        Контекстный менеджер, записывающий именованный интервал в трассу.
+
+        :param name: Имя интервала (export, decrypt, render, commit, push...).
+        :param args: Дополнительные сведения, которые попадут в трассу (например, имя таблицы).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.events.append(self._event(name, start, time.perf_counter(), args))
+
+    def dump(self) -> list:
+        """
+        Сохраняет статистику cProfile и трассу интервалов в папку профилей.
+
+        :return: Список путей к сохраненным файлам.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        base_name = os.path.join(self.output_dir, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}")
+
+        self._profile.dump_stats(f'{base_name}.pstats')
+        with open(f'{base_name}.trace.json', 'w', encoding='UTF-8') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+
+        self.files = [f'{base_name}.pstats', f'{base_name}.trace.json']
+        return self.files
+
+    def _event(self, name: str, start: float, end: float, args: dict = None) -> dict:
+        """
+        Формирует событие "complete" в формате Chrome Trace Event.
+
+        :param name: Имя интервала.
+        :param start: Время начала (perf_counter).
+        :param end: Время окончания (perf_counter).
+        :param args: Дополнительные сведения.
+        :return: Словарь события.
+        """
+        return {
+            'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+            'ts': (start - self._start) * 1e6, 'dur': (end - start) * 1e6, 'args': args or {}
+        }
+
+
+def span(name: str, **args):
+    """
+    Размечает интервал в активном профилировщике текущего запуска.
+
+    Если профилирование не включено, возвращает пустой контекстный менеджер.
+
+    :param name: Имя интервала.
+    :param args: Дополнительные сведения для трассы.
+    :return: Контекстный менеджер.
+    """
+    profiler = _active_profiler.get()
+    return profiler.span(name, **args) if profiler is not None else nullcontext()
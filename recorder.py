@@ -0,0 +1,150 @@
+import json
+import logging
+import time
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from crypt_data import Crypt
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateRecorder:
+    """
+    Класс для записи обезличенных обновлений бота в файл, чтобы воспроизвести нагрузку локально
+    (см. benchmarks/replay.py).
+
+    Файл состоит из строк JSON {"time": время получения, "update": обновление}. Из обновления
+    остаются только поля, которые нужны обработчикам команд: идентификаторы пользователей и
+    чатов заменяются псевдонимами (Crypt.pseudonym: HMAC на ключе индекса, одинаковые между
+    запусками бота и не связанные с user_key в базе данных), имена удаляются, а в тексте буквы
+    и цифры заменяются так, что длина, команды и результат проверок диалога /request (имя из
+    букв, номер телефона) не меняются.
+    """
+    def __init__(self, path: str):
+        """
+        Открывает файл записи (новые обновления дописываются в конец).
+
+        Параметры:
+        path (str): Путь к файлу записи.
+        """
+        self.path = path
+        self._file = open(path, 'a', encoding='UTF-8', buffering=1)
+
+    def setup(self, application) -> None:
+        """
+        Подключает запись ко всем обновлениям приложения (до обработчиков и пересылки процессам).
+
+        Параметры:
+        application: Приложение telegram.ext.
+        """
+        application.add_handler(TypeHandler(Update, self.record), group=-2)
+
+    async def record(self, update: Update, context) -> None:
+        """
+        Записывает обезличенное обновление (обновления без сообщения пропускаются).
+
+        Параметры:
+        update (Update): Объект обновления.
+        context: Контекст, содержащий информацию о состоянии бота.
+        """
+        data = self.anonymize(update.to_dict())
+        if data is not None:
+            self._file.write(json.dumps({'time': round(time.time(), 3), 'update': data}, ensure_ascii=False) + '\n')
+
+    def close(self) -> None:
+        """
+        Закрывает файл записи.
+        """
+        self._file.close()
+
+    @staticmethod
+    def anonymize(data: dict) -> dict:
+        """
+        Возвращает обезличенную копию обновления.
+
+        Параметры:
+        data (dict): Обновление в формате Bot API.
+
+        Возвращает:
+        dict: Обновление только с полями сообщения, нужными обработчикам, или None, если сообщения нет.
+        """
+        message = data.get('message')
+        if not message:
+            return None
+
+        chat_id = UpdateRecorder.pseudonym(message['chat']['id'])
+        result = {
+            'message_id': message['message_id'],
+            'date': message['date'],
+            'chat': {'id': chat_id, 'type': message['chat']['type']},
+        }
+        if 'from' in message:
+            user = message['from']
+            result['from'] = {'id': UpdateRecorder.pseudonym(user['id']), 'is_bot': user['is_bot'], 'first_name': 'User'}
+        if 'text' in message:
+            result['text'] = UpdateRecorder.mask_text(message['text'])
+            if 'entities' in message:  # Длина текста не меняется, поэтому смещения команд остаются верными
+                result['entities'] = [{key: entity[key] for key in ('type', 'offset', 'length')}
+                                      for entity in message['entities']]
+        return {'update_id': data['update_id'], 'message': result}
+
+    @staticmethod
+    def pseudonym(identifier: int) -> int:
+        """
+        Возвращает псевдоним идентификатора пользователя или чата (знак сохраняется: у групп он отрицательный).
+
+        Параметры:
+        identifier (int): Идентификатор.
+
+        Возвращает:
+        int: Положительное 48-битное число со знаком исходного идентификатора.
+        """
+        value = Crypt.pseudonym(abs(identifier))
+        return value if identifier >= 0 else -value
+
+    @staticmethod
+    def mask_text(text: str) -> str:
+        """
+        Заменяет буквы и цифры текста. Команда (первое слово, начинающееся с /) остается как есть.
+
+        Буквы заменяются на "а" (кириллица) или "x" с сохранением регистра, в каждой группе цифр
+        остается первая цифра, а остальные заменяются на 0 (так "+79991234567" остается номером телефона).
+
+        Параметры:
+        text (str): Текст сообщения.
+
+        Возвращает:
+        str: Текст той же длины.
+        """
+        command = ''
+        if text.startswith('/'):
+            command, _, text = text.partition(' ')
+            command += ' ' if text else ''
+
+        masked = []
+        for i, char in enumerate(text):
+            if char.isdigit():
+                masked.append(char if i == 0 or not text[i - 1].isdigit() else '0')
+            elif char.isalpha():
+                letter = 'а' if 'а' <= char.lower() <= 'я' or char.lower() == 'ё' else 'x'
+                masked.append(letter.upper() if char.isupper() else letter)
+            else:
+                masked.append(char)
+        return command + ''.join(masked)
+
+    @staticmethod
+    def load(path: str) -> list:
+        """
+        Читает файл записи.
+
+        Параметры:
+        path (str): Путь к файлу записи.
+
+        Возвращает:
+        list: Кортежи (время получения, обновление) в порядке записи.
+        """
+        with open(path, encoding='UTF-8') as file:
+            records = [json.loads(line) for line in file if line.strip()]
+        return [(record['time'], record['update']) for record in records]
@@ -0,0 +1,207 @@
+import argparse
+import hashlib
+import logging
+import sqlite3
+import time
+
+from archive import RequestArchive
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+from metrics import metrics
+from search import SearchIndex
+try:
+    from config import config
+except ImportError:
+    from test_config import test_config
+    config = test_config
+
+logger = logging.getLogger(__name__)
+
+
+class KeyRotator:
+    """
+    Класс для перешифрования базы данных новым ключом или алгоритмом без остановки бота.
+
+    Таблицы обходятся пачками по rowid, каждое значение перешифровывается через
+    Crypt.rotate_value (расшифровка любым из ключей и алгоритмов, шифрование основным ключом
+    алгоритмом из config['db']['cipher']), и каждая пачка фиксируется отдельной короткой
+    транзакцией вместе с позицией в таблице rotation_state.
+    Между пачками делается пауза, пропорциональная времени пачки, чтобы запись бота не ждала
+    блокировку. Прерванное перешифрование продолжается с последней позиции; позиция
+    привязана к отпечатку основного ключа и алгоритма, поэтому их смена начинает обход заново.
+
+    Если config['db']['index_key'] не задан, ключ индекса выводится из основного ключа, и после
+    его смены новые заявки получают другой user_key и другие токены поискового индекса. Поэтому
+    в конце перешифрования ключи пользователей пересчитываются, дубли, появившиеся после
+    перезапуска бота, удаляются (BotDatabase.compact_users), а включенный поисковый индекс
+    (config['db']['search_index']) строится заново (SearchIndex.rebuild).
+
+    Если задана папка архива (config['archive']['archive_dir']), файлы архива тоже перешифровываются
+    (RequestArchive.rotate), иначе после удаления старого ключа архивные заявки нельзя было бы прочитать.
+    """
+    def __init__(self, database_path: str, batch_size: int = 500, duty_cycle: float = 0.2):
+        """
+        Инициализирует перешифрование.
+
+        Параметры:
+        database_path (str): Путь к файлу базы данных.
+        batch_size (int): Количество строк в одной транзакции.
+        duty_cycle (float): Доля времени, которую перешифрование занимает базу данных (больше 0, не больше 1).
+
+        Исключения:
+        ValueError: Если duty_cycle вне допустимого диапазона.
+        """
+        if not 0 < duty_cycle <= 1:
+            raise ValueError(f'duty_cycle должен быть больше 0 и не больше 1, получено {duty_cycle}')
+        self.database_path = database_path
+        self.batch_size = batch_size
+        self.duty_cycle = duty_cycle
+
+    @staticmethod
+    def key_id() -> str:
+        """
+        Возвращает отпечаток основного ключа и алгоритма (сам ключ в базе данных не хранится).
+
+        Возвращает:
+        str: Первые 16 символов SHA-256 от основного ключа (и имени алгоритма, если это не Fernet).
+        """
+        key = config['db']['key']
+        key = key if isinstance(key, bytes) else key.encode()
+        cipher = config['db'].get('cipher', 'fernet')
+        return hashlib.sha256(key if cipher == 'fernet' else key + cipher.encode()).hexdigest()[:16]
+
+    def run(self) -> dict:
+        """
+        Перешифровывает все зашифрованные таблицы и архив и, если ключ индекса выводится из основного,
+        пересчитывает ключи пользователей и перестраивает включенный поисковый индекс.
+
+        Возвращает:
+        dict: Словарь {имя таблицы: количество перешифрованных за этот запуск строк}; если задана
+        папка архива, под ключом 'archive' - количество перешифрованных записей архива.
+        """
+        connection = sqlite3.connect(self.database_path)
+        try:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS rotation_state (
+                table_name TEXT PRIMARY KEY,
+                key_id TEXT,
+                last_rowid INTEGER,
+                rows_done INTEGER)""")
+            rotated = {table_name: self._rotate_table(connection, table_name,
+                                                      BotDatabase.stored_columns(connection, table_name))
+                       for table_name in BotDatabase.ENCRYPTED_COLUMNS}
+        finally:
+            connection.close()
+
+        archive_dir = config.get('archive', {}).get('archive_dir')
+        if archive_dir:
+            rotated['archive'] = RequestArchive(self.database_path, archive_dir).rotate()
+
+        if not config['db'].get('index_key'):
+            logger.info(f'Пересчет ключей пользователей: {BotDatabase(self.database_path).compact_users()}')
+            if config['db'].get('search_index'):
+                logger.info(f'Поисковый индекс перестроен: {SearchIndex(self.database_path).rebuild()} заявок')
+        return rotated
+
+    def status(self) -> dict:
+        """
+        Возвращает прогресс перешифрования по таблицам.
+
+        Возвращает:
+        dict: Словарь {имя таблицы: (строк перешифровано, всего строк, относится ли к текущему ключу)}.
+        """
+        connection = sqlite3.connect(self.database_path)
+        try:
+            result = {}
+            for table_name in BotDatabase.ENCRYPTED_COLUMNS:
+                total = connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                try:
+                    state = connection.execute(
+                        "SELECT key_id, rows_done FROM rotation_state WHERE table_name = ?", (table_name,)).fetchone()
+                except sqlite3.OperationalError:  # Перешифрование еще ни разу не запускалось
+                    state = None
+                result[table_name] = (state[1] if state else 0, total, bool(state) and state[0] == self.key_id())
+            return result
+        finally:
+            connection.close()
+
+    def _rotate_table(self, connection: sqlite3.Connection, table_name: str, columns: tuple) -> int:
+        """
+        Перешифровывает одну таблицу пачками.
+
+        Параметры:
+        connection (sqlite3.Connection): Соединение с базой данных.
+        table_name (str): Имя таблицы.
+        columns (tuple): Зашифрованные столбцы таблицы (вместе с row_token, если он есть).
+
+        Возвращает:
+        int: Количество строк, перешифрованных за этот запуск.
+        """
+        key_id = self.key_id()
+        state = connection.execute(
+            "SELECT key_id, last_rowid, rows_done FROM rotation_state WHERE table_name = ?", (table_name,)).fetchone()
+        last_rowid, rows_done = (state[1], state[2]) if state and state[0] == key_id else (0, 0)
+
+        column_list = ', '.join(columns)
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        rotated = 0
+
+        while True:
+            start = time.perf_counter()
+            with metrics.time('db_operation_seconds', operation='rotate_batch'), connection:
+                # Блокировка записи до чтения пачки: иначе UPDATE перезаписал бы устаревшими значениями
+                # изменения, сделанные ботом между чтением и записью (например, новое имя пользователя)
+                connection.execute("BEGIN IMMEDIATE")
+                rows = connection.execute(
+                    f"SELECT rowid, {column_list} FROM {table_name} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, self.batch_size)).fetchall()
+                if not rows:
+                    break
+
+                connection.executemany(
+                    f"UPDATE {table_name} SET {assignments} WHERE rowid = ?",
+                    [(*(None if value is None else Crypt.rotate_value(value) for value in row[1:]),
+                      row[0]) for row in rows])
+
+                last_rowid, rows_done = rows[-1][0], rows_done + len(rows)
+                connection.execute(
+                    "INSERT OR REPLACE INTO rotation_state (table_name, key_id, last_rowid, rows_done) "
+                    "VALUES (?, ?, ?, ?)", (table_name, key_id, last_rowid, rows_done))
+            rotated += len(rows)
+            logger.info(f'Перешифрование {table_name}: {rows_done} строк (rowid до {last_rowid})')
+
+            # Пауза, чтобы перешифрование занимало базу не больше duty_cycle времени
+            elapsed = time.perf_counter() - start
+            time.sleep(elapsed * (1 / self.duty_cycle - 1))
+
+        return rotated
+
+
+if __name__ == "__main__":
+    """
+    Этот модуль можно запустить напрямую через терминал в формате:
+    `python rotate.py <путь к базе данных> -b <строк в транзакции> -d <доля времени>`, тем самым
+    перешифровав данные основным ключом. Порядок смены ключа: новый ключ указывается в
+    config['db']['key'], старый переносится в config['db']['old_keys'], бот перезапускается,
+    затем запускается этот скрипт (его можно прерывать и запускать снова). Если архив хранится не
+    в config['archive']['archive_dir'], его нужно перешифровать отдельно. После завершения старый ключ
+    можно удалить из old_keys. С флагом `--status` выводится только прогресс.
+    """
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Re-encrypt the database with the current key')
+
+    parser.add_argument('database_path', help='Path to database')
+    parser.add_argument('-b', '--batch_size', type=int, default=500, help='Rows per transaction')
+    parser.add_argument('-d', '--duty_cycle', type=float, default=0.2, help='Share of time spent holding the database')
+    parser.add_argument('--status', action='store_true', help='Only print rotation progress')
+    args = parser.parse_args()
+    if not 0 < args.duty_cycle <= 1:
+        parser.error('duty_cycle must be greater than 0 and at most 1')
+
+    rotator = KeyRotator(args.database_path, args.batch_size, args.duty_cycle)
+    if args.status:
+        for table, (done, total, current) in rotator.status().items():
+            print(f"{table}: {done}/{total}{'' if current else ' (не начато для текущего ключа)'}")
+    else:
+        print(rotator.run())
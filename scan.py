@@ -0,0 +1,185 @@
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+
+
+def scan_range(database_path: str, table_name: str, columns: tuple, first_rowid: int, last_rowid: int) -> list:
+    """
+    Проверяет токены в диапазоне строк таблицы (выполняется в отдельном процессе).
+
+    Каждое значение расшифровывается, что проверяет и HMAC токена, и то, что он выпущен одним из
+    известных ключей. В строках с токеном всей строки (row_token) проверяется только он.
+    База данных открывается только для чтения.
+
+    Параметры:
+    database_path (str): Путь к файлу базы данных.
+    table_name (str): Имя таблицы.
+    columns (tuple): Зашифрованные столбцы таблицы (последним может быть row_token).
+    first_rowid (int): Первый rowid диапазона (включительно).
+    last_rowid (int): Последний rowid диапазона (включительно).
+
+    Возвращает:
+    list: Список кортежей (rowid, имя столбца, описание ошибки) для поврежденных значений.
+    """
+    connection = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
+    try:
+        rows = connection.execute(
+            f"SELECT rowid, {', '.join(columns)} FROM {table_name} WHERE rowid BETWEEN ? AND ?",
+            (first_rowid, last_rowid))
+        errors = []
+        for rowid, *values in rows:
+            checks = dict(zip(columns, values))
+            row_token = checks.pop(BotDatabase.ROW_TOKEN_COLUMN, None)
+            for column, value in ([(BotDatabase.ROW_TOKEN_COLUMN, row_token)] if row_token else checks.items()):
+                if value is None:
+                    errors.append((rowid, column, 'NULL'))
+                    continue
+                try:
+                    if row_token:
+                        Crypt.open_values(value)
+                    else:
+                        Crypt.decrypt_bytes(value)
+                except Exception as e:
+                    errors.append((rowid, column, f'{type(e).__name__}: {e}'.rstrip(': ')))
+        return errors
+    finally:
+        connection.close()
+
+
+class IntegrityScanner:
+    """
+    Класс для проверки целостности зашифрованных данных.
+
+    Таблицы делятся на диапазоны rowid, которые проверяются параллельно в нескольких процессах.
+    Найденные поврежденные строки записываются в таблицу integrity_errors (их пропускают
+    экспорты) и, по желанию, переносятся в таблицы quarantine_<имя таблицы>.
+    """
+    def __init__(self, database_path: str, chunk_rows: int = 5000, workers: int = None):
+        """
+        Инициализирует проверку.
+
+        Параметры:
+        database_path (str): Путь к файлу базы данных.
+        chunk_rows (int): Размер диапазона rowid, который проверяется одним процессом за раз.
+        workers (int): Количество процессов. По умолчанию - число ядер.
+        """
+        self.database_path = database_path
+        self.chunk_rows = chunk_rows
+        self.workers = workers or os.cpu_count()
+
+    def run(self, quarantine: bool = False) -> dict:
+        """
+        Проверяет все зашифрованные таблицы и сохраняет результат.
+
+        Параметры:
+        quarantine (bool): Переносить ли поврежденные строки в карантинные таблицы.
+
+        Возвращает:
+        dict: Словарь {имя таблицы: список кортежей (rowid, имя столбца, описание ошибки)}.
+        """
+        connection = sqlite3.connect(self.database_path)
+        try:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS integrity_errors (
+                table_name TEXT,
+                row_id INTEGER,
+                column_name TEXT,
+                error TEXT,
+                PRIMARY KEY (table_name, row_id, column_name))""")
+
+            ranges = []
+            for table_name in BotDatabase.ENCRYPTED_COLUMNS:
+                columns = BotDatabase.stored_columns(connection, table_name)
+                first, last = connection.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table_name}").fetchone()
+                if first is not None:
+                    ranges += [(self.database_path, table_name, columns, start, start + self.chunk_rows - 1)
+                               for start in range(first, last + 1, self.chunk_rows)]
+
+            errors = {table_name: [] for table_name in BotDatabase.ENCRYPTED_COLUMNS}
+            if ranges:
+                with ProcessPoolExecutor(self.workers) as executor:
+                    for task, task_errors in zip(ranges, executor.map(scan_range, *zip(*ranges))):
+                        errors[task[1]] += task_errors
+
+            with connection:  # Результат полной проверки заменяет предыдущий
+                connection.execute("DELETE FROM integrity_errors")
+                connection.executemany(
+                    "INSERT INTO integrity_errors (table_name, row_id, column_name, error) VALUES (?, ?, ?, ?)",
+                    [(table_name, *error) for table_name, table_errors in errors.items() for error in table_errors])
+
+            if quarantine:
+                self.quarantine(connection)
+            return errors
+        finally:
+            connection.close()
+
+    @staticmethod
+    def quarantine(connection: sqlite3.Connection) -> int:
+        """
+        Переносит строки из integrity_errors в таблицы quarantine_<имя таблицы>.
+
+        В карантинной таблице сохраняется исходный rowid (столбец source_rowid). Столбцы
+        переносятся по именам; если в исходную таблицу добавлены новые столбцы (например,
+        user_key или row_token), они добавляются и в карантинную. Статистика для /stats
+        (BotDatabase.STATS_SQL) уменьшается в той же транзакции: счетчик пользователей - триггером
+        на удаление, заявки по часам - здесь (архивация их не уменьшает, поэтому триггера нет).
+
+        Параметры:
+        connection (sqlite3.Connection): Соединение с базой данных.
+
+        Возвращает:
+        int: Количество перенесенных строк.
+        """
+        moved = 0
+        with connection:
+            for table_name in BotDatabase.ENCRYPTED_COLUMNS:
+                bad_rows = "SELECT row_id FROM integrity_errors WHERE table_name = ?"
+                connection.execute(f"""
+                    CREATE TABLE IF NOT EXISTS quarantine_{table_name} AS
+                    SELECT rowid AS source_rowid, * FROM {table_name} WHERE 0""")
+                columns = [column[1] for column in connection.execute(f"PRAGMA table_info({table_name})")]
+                existing = {column[1] for column in connection.execute(f"PRAGMA table_info(quarantine_{table_name})")}
+                for column in columns:
+                    if column not in existing:
+                        connection.execute(f"ALTER TABLE quarantine_{table_name} ADD COLUMN {column}")
+                column_list = ', '.join(columns)
+                connection.execute(f"""
+                    INSERT INTO quarantine_{table_name} (source_rowid, {column_list})
+                    SELECT rowid, {column_list} FROM {table_name} WHERE rowid IN ({bad_rows})""", (table_name,))
+                if table_name == 'requests':
+                    hours = connection.execute(f"""
+                        SELECT COALESCE(created_at, 0) / 3600, COUNT(*) FROM requests
+                        WHERE rowid IN ({bad_rows}) GROUP BY 1""", (table_name,)).fetchall()
+                    connection.executemany(
+                        "UPDATE request_stats SET requests = requests - ? WHERE hour = ?",
+                        [(count, hour) for hour, count in hours])
+                moved += connection.execute(
+                    f"DELETE FROM {table_name} WHERE rowid IN ({bad_rows})", (table_name,)).rowcount
+            connection.execute("DELETE FROM integrity_errors")
+        return moved
+
+
+if __name__ == "__main__":
+    """
+    Этот модуль можно запустить напрямую через терминал в формате:
+    `python scan.py <путь к базе данных> -c <строк в диапазоне> -w <число процессов> --quarantine`,
+    тем самым проверив все зашифрованные значения. Поврежденные строки выводятся по rowid и
+    пропускаются экспортами, а с флагом `--quarantine` переносятся в карантинные таблицы.
+    """
+    parser = argparse.ArgumentParser(description='Verify every encrypted value in the database')
+
+    parser.add_argument('database_path', help='Path to database')
+    parser.add_argument('-c', '--chunk_rows', type=int, default=5000, help='Rowid range scanned by one task')
+    parser.add_argument('-w', '--workers', type=int, help='Number of scanning processes')
+    parser.add_argument('--quarantine', action='store_true', help='Move bad rows into quarantine tables')
+    args = parser.parse_args()
+
+    result = IntegrityScanner(args.database_path, args.chunk_rows, args.workers).run(args.quarantine)
+    for table, table_errors in result.items():
+        print(f'{table}: {len({error[0] for error in table_errors})} поврежденных строк')
+        for rowid, column, error in table_errors:
+            print(f'    rowid {rowid}, {column}: {error}')
@@ -0,0 +1,330 @@
+import argparse
+import logging
+import re
+import sqlite3
+import threading
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import InvalidToken
+
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SearchIndex:
+    """
+    Класс для поиска заявок по словам описания проблемы без расшифровки всей таблицы.
+
+    Индекс (таблица search_index, см. BotDatabase.SEARCH_SQL) хранит не слова, а их токены:
+    первые байты HMAC-SHA256 на ключе Crypt._index_key (Crypt.search_token), поэтому по индексу
+    нельзя восстановить текст, не зная ключа. Для каждого слова индексируются его начала длиной
+    от MIN_PREFIX до MAX_PREFIX символов, поэтому запрос "котл" находит "котла" и "котлом".
+    Заявка подходит, если в ней есть все слова запроса. Слова запроса длиннее MAX_PREFIX ищутся
+    в индексе по началу, поэтому найденные заявки после расшифровки проверяются по полным словам.
+
+    Пока индекс включен (enable), новые заявки ставятся в очередь search_pending триггером при
+    любом способе записи; update расшифровывает только их. Если включен config['db']['search_index'],
+    бот выполняет update в фоновом потоке (start), который будится после каждой записи (notify), чтобы
+    расшифровка и ожидание блокировки базы не задерживали цикл событий. Иначе бот выключает индекс
+    (disable), чтобы очередь не росла. После смены ключа
+    индекса или MIN_PREFIX/MAX_PREFIX индекс нужно перестроить (rebuild).
+    """
+    TABLE_NAME = 'requests'
+    TEXT_COLUMN = 'problem_description'
+    WORD_PATTERN = re.compile(r'\w+')
+    MIN_WORD = 3  # Более короткие слова (предлоги, союзы) не индексируются
+    MIN_PREFIX = 3  # Не больше MIN_WORD: иначе короткое слово запроса не нашлось бы в начале длинного
+    MAX_PREFIX = 8
+
+    def __init__(self, database_path: str, batch_size: int = 500, retry_interval: float = 1.0):
+        """
+        Инициализирует поисковый индекс.
+
+        Параметры:
+        database_path (str): Путь к файлу базы данных.
+        batch_size (int): Количество заявок, индексируемых одной транзакцией.
+        retry_interval (float): Пауза в секундах перед повтором, если фоновое обновление не удалось.
+        """
+        self.database_path = database_path
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def enable(self) -> None:
+        """
+        Включает индексацию новых заявок. Если индекс был выключен, все заявки ставятся в очередь.
+        """
+        connection = sqlite3.connect(self.database_path, timeout=30)
+        try:
+            with connection:
+                if not connection.execute(
+                        "SELECT 1 FROM sqlite_master WHERE name = 'search_pending_insert'").fetchone():
+                    connection.execute(BotDatabase.SEARCH_PENDING_SQL)
+                    connection.execute(
+                        f"INSERT OR IGNORE INTO search_pending (request_rowid) SELECT rowid FROM {self.TABLE_NAME}")
+        finally:
+            connection.close()
+
+    @staticmethod
+    def disable(database_path: str) -> None:
+        """
+        Выключает индексацию: удаляет триггер очереди, очередь и индекс (без триггера индекс устаревал бы).
+
+        Параметры:
+        database_path (str): Путь к файлу базы данных.
+        """
+        connection = sqlite3.connect(database_path, timeout=30)
+        try:
+            with connection:
+                connection.execute("DROP TRIGGER IF EXISTS search_pending_insert")
+                connection.execute("DELETE FROM search_pending")
+                connection.execute("DELETE FROM search_index")
+        finally:
+            connection.close()
+
+    def start(self) -> None:
+        """
+        Включает индекс и запускает фоновый поток обновления (сначала индексируются накопившиеся заявки).
+        """
+        self.enable()
+        self._wakeup.set()
+        self._thread = threading.Thread(target=self._run, name='search-index', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Останавливает фоновый поток. Неиндексированные заявки остаются в очереди search_pending.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def notify(self, count: int = 1) -> None:
+        """
+        Будит фоновый поток после записи заявок (слушатель BotDatabase.add_write_listener).
+        Сам не обращается к базе данных, поэтому его можно вызывать из цикла событий.
+
+        Параметры:
+        count (int): Количество записанных заявок.
+        """
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        """
+        Цикл фонового потока: индексирует новые заявки после каждого пробуждения и повторяет при ошибках.
+        """
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                return
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f'Поисковый индекс: ошибка обновления, повтор через {self.retry_interval} с: {e}')
+                self._stopped.wait(self.retry_interval)
+                self._wakeup.set()
+
+    @staticmethod
+    def words(text: str) -> list:
+        """
+        Разбивает текст на слова в нижнем регистре (ё заменяется на е).
+
+        Параметры:
+        text (str): Текст.
+
+        Возвращает:
+        list: Слова не короче MIN_WORD символов.
+        """
+        return [word for word in SearchIndex.WORD_PATTERN.findall(text.lower().replace('ё', 'е'))
+                if len(word) >= SearchIndex.MIN_WORD]
+
+    @staticmethod
+    def terms(text: str) -> set:
+        """
+        Возвращает индексируемые части текста: начала слов длиной от MIN_PREFIX до MAX_PREFIX символов.
+
+        Параметры:
+        text (str): Текст описания проблемы.
+
+        Возвращает:
+        set: Множество начал слов.
+        """
+        terms = set()
+        for word in SearchIndex.words(text):
+            terms.update(word[:length] for length in range(
+                SearchIndex.MIN_PREFIX, min(len(word), SearchIndex.MAX_PREFIX) + 1))
+        return terms
+
+    @staticmethod
+    def query_terms(query: str) -> set:
+        """
+        Возвращает части запроса, которые ищутся в индексе (слова длиннее MAX_PREFIX обрезаются).
+
+        Параметры:
+        query (str): Поисковый запрос.
+
+        Возвращает:
+        set: Множество слов и начал слов.
+        """
+        return {word[:SearchIndex.MAX_PREFIX] for word in SearchIndex.words(query)}
+
+    @staticmethod
+    def matches(query: str, text: str) -> bool:
+        """
+        Проверяет, что в тексте есть все слова запроса (целиком или как начало слова).
+
+        Параметры:
+        query (str): Поисковый запрос.
+        text (str): Расшифрованный текст описания проблемы.
+
+        Возвращает:
+        bool: True, если текст подходит под запрос.
+        """
+        words = SearchIndex.words(text or '')
+        return all(any(word.startswith(query_word) for word in words) for query_word in SearchIndex.words(query))
+
+    @metrics.timed('db_operation_seconds', operation='search_update')
+    def update(self) -> int:
+        """
+        Индексирует заявки из очереди search_pending.
+
+        Заявки расшифровываются вне транзакции записи; токены добавляются через INSERT OR IGNORE,
+        поэтому одновременный запуск из нескольких потоков не создает дублей.
+
+        Возвращает:
+        int: Количество проиндексированных заявок.
+        """
+        connection = sqlite3.connect(self.database_path, timeout=30)
+        try:
+            columns = BotDatabase.stored_columns(connection, self.TABLE_NAME)
+            text_index = columns.index(self.TEXT_COLUMN)
+            indexed = 0
+            while True:
+                rowids = [row[0] for row in connection.execute(
+                    "SELECT request_rowid FROM search_pending ORDER BY request_rowid LIMIT ?", (self.batch_size,))]
+                if not rowids:
+                    return indexed
+
+                tokens = []
+                for row in connection.execute(
+                        f"SELECT rowid, {', '.join(columns)} FROM {self.TABLE_NAME} "
+                        f"WHERE rowid IN ({', '.join('?' * len(rowids))})", rowids):
+                    try:
+                        text = BotDatabase.decrypt_row(columns, row[1:])[text_index]
+                    except (InvalidToken, InvalidTag, ValueError) as e:
+                        logger.warning(f'Поисковый индекс: заявка {row[0]} не расшифрована: {e}')
+                        continue
+                    tokens.extend((Crypt.search_token(term), row[0]) for term in self.terms(text or ''))
+
+                with connection:
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO search_index (token, request_rowid) VALUES (?, ?)", tokens)
+                    connection.executemany(
+                        "DELETE FROM search_pending WHERE request_rowid = ?", [(rowid,) for rowid in rowids])
+                indexed += len(rowids)
+        finally:
+            connection.close()
+
+    def rebuild(self) -> int:
+        """
+        Включает индекс и строит его заново (например, после смены ключа индекса).
+
+        Возвращает:
+        int: Количество проиндексированных заявок.
+        """
+        self.enable()
+        connection = sqlite3.connect(self.database_path, timeout=30)
+        try:
+            with connection:
+                connection.execute("DELETE FROM search_index")
+                connection.execute(
+                    f"INSERT OR IGNORE INTO search_pending (request_rowid) SELECT rowid FROM {self.TABLE_NAME}")
+        finally:
+            connection.close()
+        return self.update()
+
+    @metrics.timed('db_operation_seconds', operation='search')
+    def search(self, query: str, limit: int = 20) -> list:
+        """
+        Находит заявки, в описании которых есть все слова запроса (или слова, начинающиеся с них).
+
+        Кандидаты из индекса расшифровываются порциями по limit заявок и проверяются по полным словам
+        запроса (matches); заявки, которые не удалось расшифровать, пропускаются.
+
+        Параметры:
+        query (str): Поисковый запрос.
+        limit (int): Максимальное количество заявок.
+
+        Возвращает:
+        list: Расшифрованные заявки (словари {столбец: значение}), сначала новые.
+        """
+        tokens = sorted({Crypt.search_token(term) for term in self.query_terms(query)})
+        if not tokens or limit <= 0:
+            return []
+
+        names = BotDatabase.ENCRYPTED_COLUMNS[self.TABLE_NAME]
+        text_index = names.index(self.TEXT_COLUMN)
+        found = []
+        connection = sqlite3.connect(self.database_path)
+        try:
+            rowids = [row[0] for row in connection.execute(
+                f"SELECT request_rowid FROM search_index WHERE token IN ({', '.join('?' * len(tokens))}) "
+                f"GROUP BY request_rowid HAVING COUNT(*) = ? ORDER BY request_rowid DESC",
+                (*tokens, len(tokens)))]
+            columns = BotDatabase.stored_columns(connection, self.TABLE_NAME)
+
+            for start in range(0, len(rowids), limit):
+                batch = rowids[start:start + limit]
+                for row in connection.execute(
+                        f"SELECT rowid, {', '.join(columns)} FROM {self.TABLE_NAME} "
+                        f"WHERE rowid IN ({', '.join('?' * len(batch))}) ORDER BY rowid DESC", batch):
+                    try:
+                        values = BotDatabase.decrypt_row(columns, row[1:])
+                    except (InvalidToken, InvalidTag, ValueError) as e:
+                        logger.warning(f'Поиск: заявка {row[0]} не расшифрована: {e}')
+                        continue
+                    if self.matches(query, values[text_index]):
+                        found.append(dict(zip(names, values)))
+                        if len(found) >= limit:
+                            return found
+        finally:
+            connection.close()
+        return found
+
+
+if __name__ == "__main__":
+    """
+    Этот модуль можно запустить напрямую через терминал в формате:
+    `python search.py <путь к базе данных> <запрос>`, тем самым найдя заявки по словам описания.
+    С флагом `--update` перед поиском индексируются новые заявки, с флагом `--rebuild` индекс
+    строится заново (запрос в этих случаях можно не указывать).
+    """
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Search requests by words of the problem description')
+
+    parser.add_argument('database_path', help='Path to database')
+    parser.add_argument('query', nargs='*', help='Words to search for')
+    parser.add_argument('-l', '--limit', type=int, default=20, help='Maximum number of requests')
+    parser.add_argument('--update', action='store_true', help='Index new requests first')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the whole index first')
+    args = parser.parse_args()
+
+    BotDatabase(args.database_path).create_tables()
+    search_index = SearchIndex(args.database_path)
+    if args.rebuild:
+        print(f'Проиндексировано заявок: {search_index.rebuild()}')
+    elif args.update:
+        search_index.enable()
+        print(f'Проиндексировано заявок: {search_index.update()}')
+
+    if args.query:
+        for request in search_index.search(' '.join(args.query), args.limit):
+            print(' | '.join(map(str, request.values())))
@@ -5,10 +5,21 @@ temp_dir = tempfile.mkdtemp()  # Создаем временную директ
 test_config = {
     'bot': {
         'telegram_token': 'test_token',
+        'workers': None,
+        'admin_ids': [],
+        'record_updates': None,  # Путь к файлу записи обновлений (см. recorder.py)
     },
     'db': {
         'database_path': os.path.join(temp_dir, 'test.db'),
         'key': b'EGTkidMX5S8nAnTuqfGCU/FpaCzo4xs88Y3vfQsPxwM=',
+        'old_keys': [],
+        'outbox_path': None,
+        'index_key': None,
+        'row_envelope': False,
+        'cipher': 'fernet',
+        'crypto_workers': None,
+        'writer_socket': None,
+        'search_index': False,
     },
     'pageupd': {
         'local_repo': temp_dir,
@@ -23,8 +34,23 @@ test_config = {
         'tables_urls': {
             'users': 'https://statevdev.github.io/bsmdb_page/users.html',
             'requests': 'https://statevdev.github.io/bsmdb_page/requests.html'
+        },
+        'feeds_urls': {
+            'users': 'https://statevdev.github.io/bsmdb_page/users.feed/manifest.json',
+            'requests': 'https://statevdev.github.io/bsmdb_page/requests.feed/manifest.json'
         }
     },
+    'archive': {
+        'archive_dir': None,
+        'max_age_days': 365,
+        'hour': 3,
+        'minutes': 0
+    },
+    'publish_trigger': None,  # Например, {'max_writes': 50, 'quiet_seconds': 300, 'min_interval': 900}
+    'metrics': {
+        'port': None,
+        'log_interval': None
+    },
     'update_time': {
         'hour': 18,
         'minutes': 0
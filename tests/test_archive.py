@@ -0,0 +1,80 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from archive import RequestArchive
+from dbscripts import BotDatabase
+from expdata import ExportData
+
+
+class TestRequestArchive(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+        self.archive_dir = os.path.join(self.temp_dir, 'archive')
+
+        database = BotDatabase(self.db_path)
+        database.create_tables()
+        for i in range(4):
+            asyncio.run(database.save_user_data(
+                f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+                "test_problem_description", "test_contact_info", "test_contact_time"))
+
+        # Две заявки за январь 2020 года и одна за февраль, последняя - свежая
+        connection = sqlite3.connect(self.db_path)
+        with connection:
+            connection.executemany("UPDATE requests SET created_at = ? WHERE rowid = ?",
+                                   [(1578000000, 1), (1578100000, 2), (1581000000, 3)])
+        connection.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def export_request_ids(self, archive_dir: str = None) -> list:
+        csv_path = os.path.join(self.temp_dir, 'requests.csv')
+        ExportData.export_many(self.db_path, 'requests', {'csv': csv_path}, archive_dir=archive_dir)
+        with open(csv_path, encoding='UTF-8') as file:
+            return [line.split(',')[0] for line in file.read().splitlines()[1:]]
+
+    def test_run(self):
+        archived = RequestArchive(self.db_path, self.archive_dir, max_age_days=30).run()
+
+        self.assertEqual(archived, {'2020-01': 2, '2020-02': 1})
+        self.assertEqual(sorted(os.listdir(self.archive_dir)), ['requests-2020-01.jsonl.gz', 'requests-2020-02.jsonl.gz'])
+
+        # Без архива экспортируется только свежая заявка, с архивом - все в исходном порядке
+        self.assertEqual(self.export_request_ids(), ['test_request_id_3'])
+        self.assertEqual(self.export_request_ids(self.archive_dir), [f'test_request_id_{i}' for i in range(4)])
+
+    def test_run_is_idempotent(self):
+        request_archive = RequestArchive(self.db_path, self.archive_dir, max_age_days=30)
+        columns = ('request_id', 'user_id', 'problem_description', 'contact_time', 'created_at')
+        connection = sqlite3.connect(self.db_path)
+        rows = connection.execute(f"SELECT {', '.join(columns)} FROM requests WHERE rowid <= 2").fetchall()
+        connection.close()
+
+        # Имитируем сбой после записи архива: строки остались в базе
+        os.makedirs(self.archive_dir)
+        request_archive._merge('2020-01', [dict(zip(columns, row)) for row in rows])
+        request_archive.run()
+
+        columns = BotDatabase.ENCRYPTED_COLUMNS['requests']
+        self.assertEqual(len(list(RequestArchive.read(self.archive_dir, 'requests', columns))), 3)
+
+    def test_vacuum(self):
+        connection = sqlite3.connect(self.db_path)
+        self.assertEqual(connection.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        with connection:
+            connection.execute("CREATE TABLE filler (data)")
+            connection.executemany("INSERT INTO filler VALUES (?)", [('x' * 1000,)] * 200)
+            connection.execute("DROP TABLE filler")
+        connection.close()
+
+        self.assertGreater(RequestArchive.vacuum(self.db_path), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,11 @@
 import os
 import shutil
+import subprocess
+import sys
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
-from bot import Bot
+from bot import Bot, main
 from commands import CommandsFactory, Commands
 from dbscripts import BotDatabase
 from pageupd import GithubPageUpdater
@@ -45,8 +47,26 @@ class TestMain(unittest.TestCase):
         self.assertTrue(os.path.exists(test_config['pageupd']['html_files']['users']))
         self.assertTrue(os.path.exists(test_config['pageupd']['html_files']['requests']))
 
+    def test_main_rejects_writer_with_outbox(self):
+        # Сервис записи не пишет через журнал Outbox, поэтому такая конфигурация отклоняется до запуска
+        with patch.dict(test_config['db'], {'writer_socket': os.path.join(temp_dir, 'writer.sock'),
+                                            'outbox_path': os.path.join(temp_dir, 'outbox.log')}), \
+                patch('bot.BotDatabase') as bot_database, self.assertRaises(ValueError):
+            main()
+        bot_database.assert_not_called()
+
     def tearDown(self):
-        shutil.rmtree(temp_dir)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+# Тест времени запуска: тяжелые библиотеки экспорта не должны загружаться при старте бота
+class TestStartup(unittest.TestCase):
+    def test_lazy_imports(self):
+        code = "import sys, bot; print(sorted({'pandas', 'docx', 'openpyxl', 'git'} & set(sys.modules)))"
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+        self.assertEqual(result.stdout.strip(), '[]')
 
 
 if __name__ == '__main__':
@@ -7,8 +7,10 @@ import tempfile
 import unittest
 from unittest.mock import Mock, AsyncMock, patch
 
-from commands import StartCommand, HelpCommand, SettingsCommand, RequestCommand, UnknownCommand
+from commands import StartCommand, HelpCommand, SettingsCommand, RequestCommand, StatsCommand, ExportCommand, \
+    SearchCommand, UnknownCommand
 from dbscripts import BotDatabase
+from expdata import ExportData
 from test_config import test_config, temp_dir
 
 
@@ -187,6 +189,135 @@ class TestRequestCommand(unittest.TestCase):
         except ImportError:
             run()
 
+class TestStatsCommand(unittest.TestCase):
+    def setUp(self):
+        self.bot = Mock()
+        self.command = StatsCommand()
+        with patch.dict(test_config['bot'], {'admin_ids': [1]}):
+            self.command.setup(self.bot)
+
+    def test_setup(self):
+        handler = self.bot.add_handler.call_args.args[0]
+        self.assertEqual(handler.filters.user_ids, frozenset({1}))  # Команда доступна только администраторам
+
+    def test_run(self):
+        update = Mock()
+        context = Mock()
+        context.bot.send_message = AsyncMock()
+        stats = {'today': 2, 'week': 5, 'total': 7, 'users': 3, 'hours': [(0, 0), (13, 2)]}
+
+        with patch('commands.BotDatabase.request_stats', return_value=stats):
+            asyncio.run(self.command.run(update, context))
+
+        context.bot.send_message.assert_called_once_with(
+            chat_id=update.effective_chat.id,
+            text=StatsCommand.STATS_TEXT.format(**stats) + StatsCommand.HOURS_TEXT.format('13:00 - 2'))
+
+
+class TestExportCommand(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+        database = BotDatabase(self.db_path)
+        database.create_tables()
+        for i in range(3):
+            asyncio.run(database.save_user_data(
+                f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+                "test_problem_description", "test_contact_info", "test_contact_time"))
+
+        self.command = ExportCommand()
+        self.update = Mock()
+        self.message = Mock(edit_text=AsyncMock())
+        self.documents = {}
+        self.tasks = []
+        self.context = Mock()
+        self.context.bot.send_message = AsyncMock(return_value=self.message)
+        self.context.bot.send_document = AsyncMock(
+            side_effect=lambda chat_id, document, filename: self.documents.update({filename: document.read()}))
+        self.context.application.create_task = Mock(side_effect=lambda coroutine, update: self.tasks.append(coroutine))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_command(self, *commands_args):
+        async def run():
+            for args in commands_args:
+                self.context.args = args
+                await self.command.run(self.update, self.context)
+            for task in self.tasks:  # Выгрузка выполняется в фоне, после обработчика
+                await task
+
+        with patch.dict(test_config['db'], {'database_path': self.db_path}):
+            asyncio.run(run())
+
+    def test_export(self):
+        self.run_command(['requests', 'csv'])
+
+        self.assertEqual(list(self.documents), ['requests.csv'])
+        content = self.documents['requests.csv'].decode()
+        self.assertTrue(all(f'test_request_id_{i}' in content for i in range(3)))
+        self.message.edit_text.assert_called_with(ExportCommand.DONE_TEXT.format('requests'))
+        self.assertEqual(self.command.exports, {})
+
+    @patch('expdata.PROGRESS_ROWS', 1)
+    def test_cancel(self):
+        with patch('builtins.print') as print_error:
+            self.run_command(['requests'], ['cancel'])
+
+        print_error.assert_not_called()  # Отмена - не ошибка экспорта
+        self.context.bot.send_document.assert_not_called()
+        self.message.edit_text.assert_called_with(ExportCommand.CANCEL_TEXT)
+        self.assertEqual(self.command.exports, {})
+
+    def test_cancel_after_export(self):
+        export_many = ExportData.export_many
+
+        def export_then_cancel(*args, **kwargs):
+            result = export_many(*args, **kwargs)
+            for cancelled in self.command.exports.values():  # /export cancel пришел после завершения выгрузки
+                cancelled.set()
+            return result
+
+        with patch('commands.ExportData.export_many', side_effect=export_then_cancel):
+            self.run_command(['requests', 'csv'])
+
+        self.assertEqual(list(self.documents), ['requests.csv'])
+        self.message.edit_text.assert_called_with(ExportCommand.DONE_TEXT.format('requests'))
+
+    def test_usage(self):
+        self.run_command(['secrets'])
+
+        self.assertEqual(self.tasks, [])
+        self.context.bot.send_message.assert_called_once_with(
+            chat_id=self.update.effective_chat.id, text=ExportCommand.USAGE_TEXT)
+
+
+class TestSearchCommand(unittest.TestCase):
+    def setUp(self):
+        self.command = SearchCommand()
+        self.update = Mock()
+        self.context = Mock()
+        self.context.bot.send_message = AsyncMock()
+
+    def test_run(self):
+        requests = [{'request_id': '1', 'user_id': '2', 'problem_description': 'Сломался котел' * 50,
+                     'contact_time': 'утром'}]
+        self.context.args = ['котел']
+        with patch('commands.SearchIndex.search', return_value=requests) as search:
+            asyncio.run(self.command.run(self.update, self.context))
+
+        search.assert_called_once_with('котел', SearchCommand.MAX_RESULTS)
+        self.context.bot.send_message.assert_called_once_with(
+            chat_id=self.update.effective_chat.id,
+            text=f"1 (утром): {requests[0]['problem_description'][:SearchCommand.MAX_DESCRIPTION]}")
+
+    def test_usage(self):
+        self.context.args = ['в']
+        asyncio.run(self.command.run(self.update, self.context))
+        self.context.bot.send_message.assert_called_once_with(
+            chat_id=self.update.effective_chat.id, text=SearchCommand.USAGE_TEXT)
+
+
 class TestUnknownCommand(unittest.TestCase):
     def setUp(self):
         self.bot = Mock()
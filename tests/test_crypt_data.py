@@ -1,6 +1,12 @@
 import asyncio
+import threading
 import unittest
+from unittest.mock import patch
+
+from cryptography.fernet import Fernet, InvalidToken
+
 from crypt_data import Crypt
+from test_config import test_config
 
 
 class TestCrypt(unittest.TestCase):
@@ -10,6 +16,66 @@ class TestCrypt(unittest.TestCase):
 
         self.assertEqual(decrypt_tuple, "test")
 
+    def test_encrypt_row(self):
+        values = ("test_id", "Имя", "test_contact_info")
+        per_field = asyncio.run(Crypt.encrypt_row(*values))
+        with patch.dict(test_config['db'], {'row_envelope': True}):
+            sealed = asyncio.run(Crypt.encrypt_row(*values))
+
+        self.assertIsNone(per_field[-1])
+        self.assertEqual([Crypt.decrypt_data(value) for value in per_field[:-1]], list(values))
+        self.assertEqual(sealed[:-1], (None, None, None))
+        self.assertEqual(Crypt.open_values(sealed[-1]), list(values))
+        # Один токен строки короче трех токенов столбцов
+        self.assertLess(len(sealed[-1]), sum(map(len, per_field[:-1])))
+
+    def test_open_values_unknown_version(self):
+        token = Crypt.fernet().encrypt(b'\x09[]').decode()
+        with self.assertRaises(ValueError):
+            Crypt.open_values(token)
+
+    def test_aead_ciphers(self):
+        fernet_token = Crypt.encrypt_bytes(b'test')
+        for cipher in ('aes-gcm', 'chacha20'):
+            with patch.dict(test_config['db'], {'cipher': cipher}):
+                token = Crypt.encrypt_bytes(b'test')
+                self.assertIsInstance(token, bytes)
+                self.assertLess(len(token), len(fernet_token))
+                self.assertEqual(Crypt.decrypt_bytes(token), b'test')
+                self.assertEqual(Crypt.decrypt_bytes(Crypt.to_text(token)), b'test')  # Опубликованный токен
+                # Данные, зашифрованные до смены алгоритма, читаются
+                self.assertEqual(Crypt.decrypt_bytes(fernet_token), b'test')
+                self.assertEqual(Crypt.decrypt_bytes(Crypt.rotate_value(fernet_token)), b'test')
+            self.assertEqual(Crypt.decrypt_bytes(token), b'test')
+
+    def test_aead_unknown_key(self):
+        with patch.dict(test_config['db'], {'cipher': 'aes-gcm', 'key': Fernet.generate_key()}):
+            token = Crypt.encrypt_bytes(b'test')
+        with self.assertRaises(InvalidToken):
+            Crypt.decrypt_bytes(token)
+
+    def test_encrypt_offloaded(self):
+        threads = []
+        encrypt_values = Crypt.encrypt_values
+
+        def record_thread(*args):
+            threads.append(threading.current_thread())
+            return encrypt_values(*args)
+
+        with patch.object(Crypt, 'encrypt_values', side_effect=record_thread):
+            tokens = asyncio.run(Crypt.encrypt_data("test"))
+
+        # Шифрование выполняется не в потоке цикла событий
+        self.assertNotEqual(threads, [threading.current_thread()])
+        self.assertEqual(Crypt.decrypt_data(tokens[0]), "test")
+
+    def test_batch(self):
+        rows = [("test_id", "Имя"), ("test_id_2", "Имя 2")]
+        encrypted = asyncio.run(Crypt.encrypt_rows(rows))
+        decrypted = asyncio.run(Crypt.decrypt_many([token for row in encrypted for token in row]))
+
+        self.assertEqual(decrypted, ["test_id", "Имя", None, "test_id_2", "Имя 2", None])
+
 
 if __name__ == "__main__":
     unittest.main()
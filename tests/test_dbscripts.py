@@ -0,0 +1,92 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+
+
+class TestBotDatabase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+        self.database = BotDatabase(self.db_path)
+        self.database.create_tables()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def users(self) -> list:
+        connection = sqlite3.connect(self.db_path)
+        try:
+            return [tuple(map(Crypt.decrypt_data, row)) for row in connection.execute(
+                "SELECT user_id, user_name FROM users ORDER BY rowid")]
+        finally:
+            connection.close()
+
+    def test_save_user_data_updates_user(self):
+        for i, user_name in enumerate(['Old Name', 'New Name']):
+            asyncio.run(self.database.save_user_data(
+                "test_id", user_name, f"test_request_id_{i}",
+                "test_problem_description", "test_contact_info", "test_contact_time"))
+
+        # Вторая заявка того же пользователя обновляет запись, а не добавляет новую
+        self.assertEqual(self.users(), [('test_id', 'New Name')])
+
+    def test_compact_users(self):
+        # Записи, сохраненные до появления user_key: по одной на каждую заявку
+        connection = sqlite3.connect(self.db_path)
+        with connection:
+            connection.executemany(
+                "INSERT INTO users (user_id, user_name, contact_info) VALUES (?, ?, ?)",
+                [Crypt.encrypt_values(user_id, user_name, 'test_contact_info') for user_id, user_name in [
+                    ('test_id_1', 'First'), ('test_id_2', 'Second'), ('test_id_1', 'First Renamed')]])
+            connection.execute("INSERT INTO users (user_id) VALUES ('broken token')")
+        connection.close()
+
+        # Пользователь test_id_2 уже оставил заявку после обновления
+        asyncio.run(self.database.save_user_data(
+            "test_id_2", "Second Renamed", "test_request_id",
+            "test_problem_description", "test_contact_info", "test_contact_time"))
+
+        # Записи пересчитываются все, включая сохраненную с user_key
+        self.assertEqual(self.database.compact_users(), {'users': 5, 'removed': 2, 'undecryptable': 1})
+
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("DELETE FROM users WHERE user_id = 'broken token'")
+        connection.commit()
+        connection.close()
+        self.assertEqual(sorted(self.users()), [('test_id_1', 'First Renamed'), ('test_id_2', 'Second Renamed')])
+
+    def test_request_stats(self):
+        connection = sqlite3.connect(self.db_path)
+        with connection:  # Заявка, записанная до появления created_at
+            connection.execute("INSERT INTO requests (request_id) VALUES ('legacy')")
+        connection.close()
+        for i in range(3):
+            asyncio.run(self.database.save_user_data(
+                f"test_id_{i % 2}", "test_user_name", f"test_request_id_{i}",
+                "test_problem_description", "test_contact_info", "test_contact_time"))
+
+        stats = self.database.request_stats()
+        self.assertEqual({key: stats[key] for key in ('today', 'week', 'total', 'users')},
+                         {'today': 3, 'week': 3, 'total': 4, 'users': 2})
+        self.assertEqual(stats['hours'][-1][1], 3)
+
+        # Через неделю заявки учитываются только в общем количестве
+        self.assertEqual(self.database.request_stats(int(time.time()) + 8 * 24 * 60 * 60)['week'], 0)
+
+        # Статистика старой базы заполняется по записанным заявкам
+        connection = sqlite3.connect(self.db_path)
+        connection.executescript("DROP TABLE request_stats; DROP TABLE counters;")
+        connection.close()
+        self.database.create_tables()
+        self.assertEqual(self.database.request_stats(), stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,23 @@
 import asyncio
+import gzip
+import json
 import os
 import shutil
+import sqlite3
+import subprocess
+import sys
 import tempfile
 import unittest
+from unittest import mock
+from unittest.mock import patch
 
 import pandas
 from docx import Document
 
+from crypt_data import Crypt
 from dbscripts import BotDatabase
 from expdata import ExportData
+from test_config import test_config
 
 
 class TestExportData(unittest.TestCase):
@@ -58,6 +67,29 @@ class TestExportData(unittest.TestCase):
 
         self.assertEqual(['test_id', 'test_user_name', 'test_contact_info'], data)
 
+    def test_export_to_excel_split_sheets(self):
+        for i in range(2):
+            asyncio.run(self.database.save_user_data(
+                f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+                "test_problem_description", "test_contact_info", "test_contact_time"))
+
+        xlsx_path = os.path.join(os.path.dirname(self.db_path), 'test.xlsx')
+        ExportData.export_to_excel(self.db_path, 'requests', output_file=xlsx_path, max_rows_per_sheet=3)
+
+        # 3 строки при ограничении в 3 строки на лист (включая заголовок) занимают 2 листа
+        sheets = pandas.read_excel(xlsx_path, sheet_name=None)
+        self.assertEqual(list(sheets), ['requests', 'requests (2)'])
+        self.assertEqual([len(sheet) for sheet in sheets.values()], [2, 1])
+        self.assertEqual(sheets['requests (2)'].iloc[0].tolist()[0], 'test_request_id_1')
+
+        # Длинное имя таблицы обрезается с конца, номер листа сохраняется
+        connection = sqlite3.connect(self.db_path)
+        with connection:
+            connection.execute(f"CREATE TABLE {'x' * 40} AS SELECT request_id, user_id FROM requests")
+        connection.close()
+        ExportData.export_to_excel(self.db_path, 'x' * 40, output_file=xlsx_path, max_rows_per_sheet=3)
+        self.assertEqual(list(pandas.read_excel(xlsx_path, sheet_name=None)), ['x' * 31, 'x' * 27 + ' (2)'])
+
     def test_export_to_csv(self):
         csv_path = os.path.join(os.path.dirname(self.db_path), 'test.csv')
         ExportData.export_to_csv(self.db_path, 'users', output_file=csv_path)
@@ -80,5 +112,168 @@ class TestExportData(unittest.TestCase):
 
         self.assertEqual(['test_id', 'test_user_name', 'test_contact_info'], data.iloc[0].tolist())
 
+    def test_html_title_escaped(self):
+        document = ExportData._html_document('<script>alert(1)</script> — 1', '')
+        self.assertIn('<title>&lt;script&gt;alert(1)&lt;/script&gt; — 1</title>', document)
+
+    def test_export_to_html_without_pandas(self):
+        html_path = os.path.join(os.path.dirname(self.db_path), 'test.html')
+        code = (f"import sys; from expdata import ExportData; "
+                f"ExportData.export_to_html({self.db_path!r}, 'users', {html_path!r}, decrypt=False); "
+                f"print('pandas' in sys.modules)")
+
+        # Публикация шифротекста не должна импортировать pandas
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(result.stdout.strip(), 'False')
+        self.assertEqual(len(pandas.read_html(html_path)[0].columns), 3)
+
+    def test_export_many(self):
+        temp_dir = os.path.dirname(self.db_path)
+        output_files = {method: os.path.join(temp_dir, f'many.{extension}')
+                        for method, extension in [('word', 'docx'), ('excel', 'xlsx'), ('csv', 'csv'), ('html', 'html')]}
+
+        with mock.patch('expdata.Crypt.decrypt_data', side_effect=lambda value: value) as decrypt_data:
+            ExportData.export_many(self.db_path, 'users', output_files)
+
+        # Три ячейки строки расшифровываются один раз на все четыре формата
+        self.assertEqual(decrypt_data.call_count, 3)
+
+        expected = ['test_id', 'test_user_name', 'test_contact_info']
+        ExportData.export_many(self.db_path, 'users', output_files)
+        self.assertEqual([cell.text for cell in Document(output_files['word']).tables[0].rows[1].cells], expected)
+        self.assertEqual(pandas.read_excel(output_files['excel']).iloc[0].to_list(), expected)
+        self.assertEqual(pandas.read_csv(output_files['csv']).iloc[0].to_list(), expected)
+        self.assertEqual(pandas.read_html(output_files['html'])[0].iloc[0].to_list(), expected)
+
+        # Неизвестный формат - ошибка экспорта, а не исключение; файлы не создаются
+        pdf_file = os.path.join(temp_dir, 'many.pdf')
+        self.assertFalse(ExportData.export_many(self.db_path, 'users', {'csv': output_files['csv'], 'pdf': pdf_file}))
+        self.assertFalse(os.path.exists(pdf_file))
+
+    def test_export_many_error_keeps_no_partial_file(self):
+        temp_dir = os.path.dirname(self.db_path)
+        asyncio.run(self.database.save_user_data(
+            "broken_id", "test_user_name", "test_request_id_2", "test_problem_description", "test_contact_info",
+            "test_contact_time"))
+        output_files = {method: os.path.join(temp_dir, f'partial.{extension}')
+                        for method, extension in [('word', 'docx'), ('excel', 'xlsx'), ('csv', 'csv'), ('html', 'html')]}
+
+        # Ошибка расшифровки на второй строке: первая уже записана, но файлы не должны появиться
+        decrypt_data = Crypt.decrypt_data
+
+        def fail_on_second_user(value):
+            result = decrypt_data(value)
+            if result == 'broken_id':
+                raise ValueError('broken row')
+            return result
+
+        with mock.patch('expdata.Crypt.decrypt_data', side_effect=fail_on_second_user):
+            self.assertFalse(ExportData.export_many(self.db_path, 'users', output_files, cache_size=0))
+        for path in output_files.values():
+            self.assertFalse(os.path.exists(path))
+            self.assertFalse(os.path.exists(f'{path}.tmp'))
+
+        # Ошибка при сохранении: файл, который успел сохраниться частично, тоже не остается
+        def fail_during_save(path):
+            with open(path, 'wb') as file:
+                file.write(b'PK')
+            raise OSError('disk full')
+
+        with patch('openpyxl.Workbook.save', side_effect=fail_during_save):
+            self.assertFalse(ExportData.export_many(self.db_path, 'requests', {'excel': output_files['excel']}))
+        self.assertFalse(os.path.exists(output_files['excel']))
+        self.assertFalse(os.path.exists(f"{output_files['excel']}.tmp"))
+
+    def test_read_rows_decrypt_cache(self):
+        connection = sqlite3.connect(self.db_path)
+        # Копия строки с теми же шифротекстами под другим rowid
+        connection.execute("""
+            CREATE TABLE copies AS SELECT user_id, user_name, contact_info FROM users
+            UNION ALL SELECT user_id, user_name, contact_info FROM users""")
+        try:
+            with mock.patch('expdata.Crypt.decrypt_data', side_effect=lambda value: value) as decrypt_data:
+                rows = list(ExportData._read_rows(connection, 'copies', True, cache_size=16)[1])
+        finally:
+            connection.close()
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(decrypt_data.call_count, 3)
+
+    def test_snapshot(self):
+        for journal_mode in ('wal', 'delete'):
+            with self.subTest(journal_mode=journal_mode):
+                writer = sqlite3.connect(self.db_path, timeout=0)
+                writer.execute(f"PRAGMA journal_mode = {journal_mode}")
+
+                snapshot = ExportData._snapshot(self.db_path)
+                try:
+                    count = snapshot.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+                    # Открытый снимок не блокирует запись, а запись не меняет снимок
+                    with writer:
+                        writer.execute("INSERT INTO users (user_id) VALUES (?)", (f'new_{journal_mode}',))
+                    self.assertEqual(snapshot.execute("SELECT COUNT(*) FROM users").fetchone()[0], count)
+                finally:
+                    snapshot.close()
+                    writer.close()
+
+    def test_export_row_envelope(self):
+        with patch.dict(test_config['db'], {'row_envelope': True}):
+            asyncio.run(self.database.save_user_data(
+                "sealed_id", "test_user_name", "sealed_request_id",
+                "test_problem_description", "test_contact_info", "test_contact_time"))
+
+        csv_path = os.path.join(os.path.dirname(self.db_path), 'test.csv')
+        ExportData.export_to_csv(self.db_path, 'requests', output_file=csv_path)
+        table = pandas.read_csv(csv_path)
+        self.assertEqual(table.columns.tolist(), ['request_id', 'user_id', 'problem_description', 'contact_time'])
+        self.assertEqual(table['request_id'].tolist(), ['test_request_id', 'sealed_request_id'])
+
+        # Без расшифровки публикуется и столбец с токеном строки
+        html_path = os.path.join(os.path.dirname(self.db_path), 'test.html')
+        ExportData.export_to_html(self.db_path, 'requests', html_path, decrypt=False)
+        self.assertEqual(pandas.read_html(html_path)[0].columns[-1], BotDatabase.ROW_TOKEN_COLUMN)
+
+    def test_export_to_html_pages(self):
+        for i in range(4):
+            asyncio.run(self.database.save_user_data(
+                f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+                "test_problem_description", "test_contact_info", "test_contact_time"))
+
+        index_path = os.path.join(os.path.dirname(self.db_path), 'requests.html')
+        pages_dir = os.path.join(os.path.dirname(self.db_path), 'requests')
+
+        changed = ExportData.export_to_html_pages(self.db_path, 'requests', index_path, rows_per_page=2)
+
+        # 5 строк по 2 на странице: 3 страницы и оглавление
+        self.assertEqual(sorted(os.listdir(pages_dir)), ['1.html', '2.html', '3.html'])
+        self.assertEqual(len(changed), 4)
+        self.assertEqual(['test_request_id', 'test_id'], pandas.read_html(
+            os.path.join(pages_dir, '1.html'))[0].iloc[0].tolist()[:2])
+
+        # Повторный экспорт без изменений ничего не перезаписывает
+        self.assertEqual(ExportData.export_to_html_pages(self.db_path, 'requests', index_path, rows_per_page=2), [])
+
+        # Новая строка меняет только последнюю страницу и оглавление
+        asyncio.run(self.database.save_user_data(
+            "test_id_5", "test_user_name", "test_request_id_5",
+            "test_problem_description", "test_contact_info", "test_contact_time"))
+        changed = ExportData.export_to_html_pages(self.db_path, 'requests', index_path, rows_per_page=2)
+        self.assertEqual(sorted(changed), sorted([os.path.join(pages_dir, '3.html'), index_path]))
+
+    def test_export_to_feed(self):
+        feed_dir = os.path.join(os.path.dirname(self.db_path), 'users.feed')
+
+        changed = ExportData.export_to_feed(self.db_path, 'users', feed_dir, segment_rows=2, decrypt=True)
+        self.assertEqual(len(changed), 2)  # Один сегмент и манифест
+
+        with open(os.path.join(feed_dir, 'manifest.json'), encoding='UTF-8') as file:
+            manifest = json.load(file)
+        self.assertEqual(manifest['columns'], ['user_id', 'user_name', 'contact_info'])
+        self.assertEqual(manifest['rows'], 1)
 
+        with gzip.open(os.path.join(feed_dir, manifest['segments'][0]['file']), 'rt', encoding='UTF-8') as file:
+            self.assertEqual(json.loads(file.readline()), ['test_id', 'test_user_name', 'test_contact_info'])
 
+        # Повторный экспорт без изменений ничего не перезаписывает
+        self.assertEqual(ExportData.export_to_feed(self.db_path, 'users', feed_dir, segment_rows=2, decrypt=True), [])
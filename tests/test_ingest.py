@@ -0,0 +1,94 @@
+import csv
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+from ingest import BulkIngest, FIELDS
+
+
+class TestBulkIngest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+        self.csv_path = os.path.join(self.temp_dir, 'requests.csv')
+
+        with open(self.csv_path, 'w', newline='', encoding='UTF-8') as file:
+            writer = csv.DictWriter(file, fieldnames=FIELDS)
+            writer.writeheader()
+            for i in range(25):
+                writer.writerow({
+                    'user_id': f'test_id_{i}', 'user_name': 'test_user_name', 'request_id': f'test_request_id_{i}',
+                    'problem_description': 'test_problem_description', 'contact_info': 'test_contact_info',
+                    'contact_time': 'test_contact_time'})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def count_requests(self):
+        connection = sqlite3.connect(self.db_path)
+        rows = connection.execute("SELECT request_id FROM requests ORDER BY rowid").fetchall()
+        connection.close()
+        return [Crypt.decrypt_data(row[0]) for row in rows]
+
+    def test_run(self):
+        ingested = BulkIngest(self.db_path, batch_size=10, batches_per_commit=1, workers=2).run(self.csv_path)
+
+        self.assertEqual(ingested, 25)
+        self.assertEqual(self.count_requests(), [f'test_request_id_{i}' for i in range(25)])
+
+        # Повторный запуск с тем же файлом ничего не дублирует
+        self.assertEqual(BulkIngest(self.db_path, batch_size=10, workers=2).run(self.csv_path), 0)
+        self.assertEqual(len(self.count_requests()), 25)
+
+    def test_created_at(self):
+        # Импортированные заявки не считаются принятыми сейчас: created_at берется из CSV или остается пустым
+        with open(self.csv_path, newline='', encoding='UTF-8') as file:
+            rows = list(csv.DictReader(file))
+        with open(self.csv_path, 'w', newline='', encoding='UTF-8') as file:
+            writer = csv.DictWriter(file, fieldnames=(*FIELDS, 'created_at'))
+            writer.writeheader()
+            for i, row in enumerate(rows):
+                writer.writerow({**row, 'created_at': 1578000000 if i < 5 else ''})
+
+        BulkIngest(self.db_path, batch_size=10, workers=1).run(self.csv_path)
+
+        connection = sqlite3.connect(self.db_path)
+        created_at = [row[0] for row in connection.execute("SELECT created_at FROM requests ORDER BY rowid")]
+        connection.close()
+        self.assertEqual(created_at, [1578000000] * 5 + [None] * 20)
+
+        stats = BotDatabase(self.db_path).request_stats()
+        self.assertEqual((stats['today'], stats['week'], stats['total']), (0, 0, 25))
+
+    def test_batches_per_commit(self):
+        # Транзакция содержит batches_per_commit пачек, даже если процессов мало
+        with patch.object(BulkIngest, '_write', autospec=True, side_effect=BulkIngest._write) as write:
+            ingested = BulkIngest(self.db_path, batch_size=5, batches_per_commit=5, workers=1).run(self.csv_path)
+        self.assertEqual(ingested, 25)
+        self.assertEqual(write.call_count, 1)
+
+        other_db_path = os.path.join(self.temp_dir, 'other.db')
+        with patch.object(BulkIngest, '_write', autospec=True, side_effect=BulkIngest._write) as write:
+            BulkIngest(other_db_path, batch_size=5, batches_per_commit=2, workers=1).run(self.csv_path)
+        self.assertEqual(write.call_count, 3)  # Пачки 2 + 2 + 1
+
+    def test_resume(self):
+        # Имитируем прерванный импорт: первые 20 строк уже зафиксированы
+        BulkIngest(self.db_path, batch_size=10, workers=1).run(self.csv_path)
+        connection = sqlite3.connect(self.db_path)
+        with connection:
+            connection.execute("DELETE FROM requests WHERE rowid > 20")
+            connection.execute("UPDATE ingest_checkpoints SET rows_done = 20")
+        connection.close()
+
+        self.assertEqual(BulkIngest(self.db_path, batch_size=10, workers=1).run(self.csv_path), 5)
+        self.assertEqual(self.count_requests(), [f'test_request_id_{i}' for i in range(25)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+import urllib.request
+
+from metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_histogram_render(self):
+        histogram = self.metrics.histogram('db_operation_seconds', operation='commit')
+        histogram.observe(0.003)
+        histogram.observe(0.2)
+
+        text = self.metrics.render()
+
+        # Корзины накопительные, последняя (+Inf) равна количеству наблюдений
+        self.assertIn('# TYPE db_operation_seconds histogram', text)
+        self.assertIn('db_operation_seconds_bucket{operation="commit",le="0.005"} 1', text)
+        self.assertIn('db_operation_seconds_bucket{operation="commit",le="+Inf"} 2', text)
+        self.assertIn('db_operation_seconds_count{operation="commit"} 2', text)
+        self.assertEqual(histogram.quantile(0.5), 0.005)
+
+    def test_timed_async(self):
+        @self.metrics.timed('bot_handler_seconds', handler='test')
+        async def handler():
+            return 'test_response'
+
+        self.assertEqual(asyncio.run(handler()), 'test_response')
+        self.assertEqual(self.metrics.histogram('bot_handler_seconds', handler='test').count, 1)
+
+    def test_serve(self):
+        self.metrics.gauge('bot_update_queue_size', lambda: 3)
+        server = self.metrics.serve(0)
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+            with urllib.request.urlopen(url) as response:
+                self.assertIn('bot_update_queue_size 3', response.read().decode())
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from crypt_data import Crypt
+from outbox import Outbox
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+        self.outbox_path = os.path.join(self.temp_dir, 'outbox.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def save(self, outbox: Outbox, i: int) -> int:
+        return asyncio.run(outbox.save_user_data(
+            f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+            "test_problem_description", "test_contact_info", "test_contact_time"))
+
+    def request_ids(self) -> list:
+        connection = sqlite3.connect(self.db_path)
+        try:
+            return [Crypt.decrypt_data(row[0]) for row in connection.execute(
+                "SELECT request_id FROM requests ORDER BY rowid")]
+        finally:
+            connection.close()
+
+    def test_save_user_data(self):
+        outbox = Outbox(self.outbox_path, self.db_path, retry_interval=0.05)
+        outbox.start()
+        try:
+            for i in range(3):
+                self.save(outbox, i)
+            self.assertTrue(outbox.wait(timeout=5))
+        finally:
+            outbox.stop()
+
+        self.assertEqual(self.request_ids(), [f'test_request_id_{i}' for i in range(3)])
+        self.assertEqual(os.path.getsize(self.outbox_path), 0)  # Перенесенные записи удалены из журнала
+
+    def test_locked_database(self):
+        outbox = Outbox(self.outbox_path, self.db_path, retry_interval=0.05)
+        outbox.start()
+        locker = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            locker.execute("BEGIN EXCLUSIVE")
+            self.assertEqual(self.save(outbox, 0), 1)  # Запись в журнал не ждет базу данных
+            self.assertFalse(outbox.wait(timeout=0.3))
+
+            locker.execute("COMMIT")
+            self.assertTrue(outbox.wait(timeout=5))
+        finally:
+            locker.close()
+            outbox.stop()
+
+        self.assertEqual(self.request_ids(), ['test_request_id_0'])
+
+    def test_replay_on_startup(self):
+        outbox = Outbox(self.outbox_path, self.db_path)  # Фоновый перенос не запущен: имитация сбоя
+        for i in range(2):
+            self.save(outbox, i)
+        outbox.stop()
+        with open(self.outbox_path, 'ab') as file:
+            file.write(b'{"seq": 3, "user": ')  # Запись, недописанная при сбое
+
+        outbox = Outbox(self.outbox_path, self.db_path)
+        try:
+            self.assertEqual(outbox.drain(), 2)
+            self.assertEqual(outbox.drain(), 0)  # Повторно записи не применяются
+            self.assertEqual(self.save(outbox, 2), 3)
+            self.assertEqual(outbox.drain(), 1)
+        finally:
+            outbox.stop()
+
+        self.assertEqual(self.request_ids(), [f'test_request_id_{i}' for i in range(3)])
+
+    def test_dead_letter(self):
+        outbox = Outbox(self.outbox_path, self.db_path)  # Фоновый перенос не запущен
+        try:
+            self.save(outbox, 0)
+            outbox.append(('broken',), ())  # Запись, которую нельзя применить
+            with open(self.outbox_path, 'ab') as file:
+                file.write(b'not json\n')  # Поврежденная строка
+            self.save(outbox, 3)
+
+            with self.assertLogs('outbox', level='ERROR'):
+                self.assertEqual(outbox.drain(), 3)
+            self.assertEqual(outbox.drain(), 0)
+        finally:
+            outbox.stop()
+
+        # Плохие записи не задерживают следующие и сохраняются отдельно
+        self.assertEqual(self.request_ids(), ['test_request_id_0', 'test_request_id_3'])
+        with open(f'{self.outbox_path}.dead', 'rb') as file:
+            dead = file.read().splitlines()
+        self.assertEqual(len(dead), 2)
+        self.assertEqual(dead[1], b'not json')
+        self.assertEqual(os.path.getsize(self.outbox_path), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,14 @@
+import asyncio
+import json
 import os
 import shutil
 import tempfile
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
-from pagedwn import github_page_downloader
+from dbscripts import BotDatabase
+from expdata import ExportData
+from pagedwn import github_page_downloader, github_feed_downloader, parse_table_page
 from test_config import test_config
 
 
@@ -26,5 +30,89 @@ class TestGithubPageDownloader(unittest.TestCase):
             run()
 
 
+class TestParseTablePage(unittest.TestCase):
+    def test_parse_table_page(self):
+        temp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(temp_dir, 'test.db')
+        html_path = os.path.join(temp_dir, 'users.html')
+
+        database = BotDatabase(db_path)
+        database.create_tables()
+        asyncio.run(database.save_user_data(
+            "test_id", "test_user_name", "test_request_id",
+            "test_problem_description", "test_contact_info", "test_contact_time"))
+        ExportData.export_to_html(db_path, 'users', html_path, decrypt=False)
+
+        with open(html_path, encoding='UTF-8') as file:
+            html_data = parse_table_page(file.read(), decrypt=True)
+
+        self.assertIn('test_user_name', html_data)
+        shutil.rmtree(temp_dir)
+
+    def test_parse_table_page_row_envelope(self):
+        temp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(temp_dir, 'test.db')
+        html_path = os.path.join(temp_dir, 'requests.html')
+
+        database = BotDatabase(db_path)
+        database.create_tables()
+        for i, row_envelope in enumerate([False, True]):
+            with patch.dict(test_config['db'], {'row_envelope': row_envelope}):
+                asyncio.run(database.save_user_data(
+                    f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+                    "test_problem_description", "test_contact_info", "test_contact_time"))
+        ExportData.export_to_html(db_path, 'requests', html_path, decrypt=False)
+
+        with open(html_path, encoding='UTF-8') as file:
+            html_data = parse_table_page(file.read(), decrypt=True)
+
+        self.assertIn('test_request_id_0', html_data)
+        self.assertIn('test_request_id_1', html_data)
+        self.assertNotIn(BotDatabase.ROW_TOKEN_COLUMN, html_data)
+        shutil.rmtree(temp_dir)
+
+
+class TestGithubFeedDownloader(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+        self.feed_dir = os.path.join(self.temp_dir, 'users.feed')
+
+        database = BotDatabase(self.db_path)
+        database.create_tables()
+        for i in range(3):
+            asyncio.run(database.save_user_data(
+                f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+                "test_problem_description", "test_contact_info", "test_contact_time"))
+        ExportData.export_to_feed(self.db_path, 'users', self.feed_dir, segment_rows=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def fake_get(self, url):
+        # Отдаем файлы фида из локальной папки вместо GitHub Pages
+        with open(os.path.join(self.feed_dir, os.path.basename(url)), 'rb') as file:
+            data = file.read()
+        return Mock(content=data, json=lambda: json.loads(data), raise_for_status=Mock())
+
+    def test_github_feed_downloader(self):
+        output_path = os.path.join(self.temp_dir, 'users.jsonl')
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+
+        with patch('pagedwn.requests.get', side_effect=self.fake_get) as mock_get:
+            downloaded = github_feed_downloader('users', output_path, decrypt=True, cache_dir=cache_dir)
+            self.assertEqual(downloaded, 2)
+
+            with open(output_path, encoding='UTF-8') as file:
+                rows = [json.loads(line) for line in file]
+            self.assertEqual(len(rows), 3)
+            self.assertEqual(rows[0]['user_id'], 'test_id_0')
+
+            # Повторный запуск скачивает только манифест
+            mock_get.reset_mock()
+            self.assertEqual(github_feed_downloader('users', output_path, decrypt=True, cache_dir=cache_dir), 0)
+            mock_get.assert_called_once()
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
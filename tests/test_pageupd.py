@@ -0,0 +1,106 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+from dbscripts import BotDatabase
+from pageupd import GithubPageUpdater, PublishTrigger
+
+
+class TestPublishTrigger(unittest.TestCase):
+    def setUp(self):
+        self.publish = Mock()
+        self.scheduler = Mock()
+        self.trigger = PublishTrigger(self.publish, self.scheduler, max_writes=3, quiet_seconds=60, min_interval=600)
+
+    def run_date(self) -> float:
+        return self.scheduler.add_job.call_args.kwargs['run_date'].timestamp()
+
+    @patch('pageupd.time.time', return_value=10000.0)
+    def test_debounce(self, _):
+        self.trigger.on_write()
+        self.assertEqual(self.run_date(), 10060.0)  # Через quiet_seconds после записи
+        self.trigger.on_write()
+        self.trigger.on_write()
+        self.assertEqual(self.run_date(), 10000.0)  # Накопилось max_writes: без ожидания
+        # Одна задача, которая переносится каждой записью
+        self.assertEqual({call.kwargs['id'] for call in self.scheduler.add_job.call_args_list}, {PublishTrigger.JOB_ID})
+
+        self.trigger.run()
+        self.publish.assert_called_once()
+        self.trigger.on_write()
+        self.assertEqual(self.run_date(), 10600.0)  # Не раньше min_interval после публикации
+
+    def test_run_without_writes(self):
+        self.trigger.run()
+        self.publish.assert_not_called()
+
+    @patch('pageupd.time.time', return_value=10000.0)
+    def test_publish_error(self, _):
+        self.publish.side_effect = RuntimeError('push failed')
+        self.trigger.on_write(2)
+        with self.assertRaises(RuntimeError):
+            self.trigger.run()
+        self.assertEqual(self.trigger.pending, 2)  # Заявки будут опубликованы при следующем запуске
+        self.assertEqual(self.run_date(), 10600.0)  # Повтор запланирован, но не раньше min_interval
+
+    def test_write_listener(self):
+        temp_dir = tempfile.mkdtemp()
+        BotDatabase.add_write_listener(self.trigger.on_write)
+        try:
+            database = BotDatabase(os.path.join(temp_dir, 'test.db'))
+            database.create_tables()
+            with patch('pageupd.time.time', return_value=10000.0):
+                asyncio.run(database.save_user_data(
+                    "test_id", "test_user_name", "test_request_id",
+                    "test_problem_description", "test_contact_info", "test_contact_time"))
+        finally:
+            BotDatabase.write_listeners.remove(self.trigger.on_write)
+            shutil.rmtree(temp_dir)
+
+        self.assertEqual(self.trigger.pending, 1)
+        self.assertEqual(self.scheduler.add_job.call_args.kwargs['run_date'], datetime.fromtimestamp(10060.0))
+
+
+class TestGithubPageUpdater(unittest.TestCase):
+    def setUp(self):
+        import git
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.remote = git.Repo.init(os.path.join(self.temp_dir, 'remote.git'), bare=True)
+        self.repo = git.Repo.init(os.path.join(self.temp_dir, 'repo'))
+        self.repo.create_remote('origin', self.remote.working_dir)
+        with self.repo.config_writer() as writer:
+            writer.set_value('user', 'name', 'test')
+            writer.set_value('user', 'email', 'test@example.com')
+
+        self.html_file = os.path.join(self.repo.working_dir, 'requests.html')
+        self.updater = GithubPageUpdater(self.repo.working_dir, None, {'requests': self.html_file}, 'Test')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_page(self, content: str) -> None:
+        with open(self.html_file, 'w', encoding='UTF-8') as file:
+            file.write(content)
+
+    def test_push_skips_unchanged(self):
+        self.write_page('<table></table>')
+        self.repo.git.add('--all')
+        self.repo.index.commit('Initial')
+        self.repo.git.push('--set-upstream', 'origin', self.repo.active_branch.name)
+
+        self.assertFalse(self.updater.push_to_github())  # Страница не изменилась
+        self.assertEqual(len(list(self.repo.iter_commits())), 1)
+
+        self.write_page('<table><tr><td>1</td></tr></table>')
+        self.assertTrue(self.updater.push_to_github())
+        self.assertEqual(len(list(self.repo.iter_commits())), 2)
+        self.assertEqual(self.remote.head.commit, self.repo.head.commit)
+
+
+if __name__ == '__main__':
+    unittest.main()
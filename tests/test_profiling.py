@@ -0,0 +1,51 @@
+import asyncio
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from dbscripts import BotDatabase
+from expdata import ExportData
+from profiling import Profiler, span
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+
+        database = BotDatabase(self.db_path)
+        database.create_tables()
+        asyncio.run(database.save_user_data(
+            "test_id", "test_user_name", "test_request_id",
+            "test_problem_description", "test_contact_info", "test_contact_time"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_profile_export(self):
+        profile_dir = os.path.join(self.temp_dir, 'profiles')
+
+        with Profiler('export', profile_dir) as profiler:
+            ExportData.export_to_html(self.db_path, 'users', os.path.join(self.temp_dir, 'users.html'))
+
+        pstats_file, trace_file = profiler.files
+        self.assertTrue(pstats.Stats(pstats_file).total_calls > 0)
+
+        with open(trace_file, encoding='UTF-8') as file:
+            names = {event['name'] for event in json.load(file)['traceEvents']}
+        self.assertTrue({'export', 'read', 'decrypt', 'render'} <= names)
+
+    def test_disabled(self):
+        # Без папки профилирование выключено, а span ничего не записывает
+        with Profiler('export') as profiler, span('render'):
+            pass
+
+        self.assertFalse(profiler.enabled)
+        self.assertEqual(profiler.events, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
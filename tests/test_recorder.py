@@ -0,0 +1,68 @@
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from telegram import Update
+
+from crypt_data import Crypt
+from recorder import UpdateRecorder
+
+
+class TestUpdateRecorder(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'updates.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def message_update(update_id: int, user_id: int, text: str) -> Update:
+        message = {'message_id': update_id, 'date': 0, 'chat': {'id': user_id, 'type': 'private'},
+                   'from': {'id': user_id, 'is_bot': False, 'first_name': 'Иван', 'username': 'ivan'}, 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return Update.de_json({'update_id': update_id, 'message': message}, None)
+
+    def test_mask_text(self):
+        self.assertEqual(UpdateRecorder.mask_text('Иван Ivanov'), 'Аааа Xxxxxx')
+        self.assertEqual(UpdateRecorder.mask_text('/request котел'), '/request ааааа')
+        # Номер телефона остается номером телефона, а время - временем
+        self.assertEqual(UpdateRecorder.mask_text('+79991234567'), '+70000000000')
+        self.assertTrue(re.match(r'^(\+7|8)[0-9]{10}$', UpdateRecorder.mask_text('89991234567')))
+        self.assertEqual(UpdateRecorder.mask_text('после 18:00'), 'ааааа 10:00')
+
+    def test_record_and_load(self):
+        recorder = UpdateRecorder(self.path)
+        updates = [self.message_update(1, 555, '/request'), self.message_update(2, 555, 'Не работает котел'),
+                   self.message_update(3, 777, 'Иван Иванов')]
+        for update in updates:
+            asyncio.run(recorder.record(update, None))
+        asyncio.run(recorder.record(Update.de_json({'update_id': 4}, None), None))  # Без сообщения
+        recorder.close()
+
+        records = UpdateRecorder.load(self.path)
+        self.assertEqual([data['update_id'] for _, data in records], [1, 2, 3])
+        messages = [data['message'] for _, data in records]
+        self.assertEqual([message['text'] for message in messages], ['/request', 'Аа аааааааа ааааа', 'Аааа Аааааа'])
+        self.assertEqual(messages[0]['entities'], [{'type': 'bot_command', 'offset': 0, 'length': 8}])
+
+        # Идентификаторы заменены псевдонимами, одинаковыми для одного пользователя; имен нет
+        self.assertNotIn(555, {messages[0]['from']['id'], messages[0]['chat']['id']})
+        self.assertEqual(messages[0]['from']['id'], messages[1]['from']['id'])
+        self.assertNotEqual(messages[0]['from']['id'], messages[2]['from']['id'])
+        # Псевдоним не выводится из user_key, поэтому запись не связывается с записями пользователей в базе
+        self.assertFalse(Crypt.user_key(555).startswith(f"{messages[0]['from']['id']:012x}"))
+        with open(self.path, encoding='UTF-8') as file:
+            self.assertNotIn('ivan', file.read())
+
+        # Запись читается обратно как обновления Bot API
+        update = Update.de_json(records[0][1], None)
+        self.assertEqual(update.message.text, '/request')
+
+
+if __name__ == '__main__':
+    unittest.main()
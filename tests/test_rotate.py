@@ -0,0 +1,147 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from archive import RequestArchive
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+from expdata import ExportData
+from rotate import KeyRotator
+from search import SearchIndex
+from test_config import test_config
+
+
+class TestKeyRotator(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+        self.old_key = test_config['db']['key']
+        self.new_key = Fernet.generate_key()
+
+        database = BotDatabase(self.db_path)
+        database.create_tables()
+        for i in range(5):
+            asyncio.run(database.save_user_data(
+                f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+                "test_problem_description", "test_contact_info", "test_contact_time"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_column(self, table_name, column):
+        connection = sqlite3.connect(self.db_path)
+        rows = connection.execute(f"SELECT {column} FROM {table_name} ORDER BY rowid").fetchall()
+        connection.close()
+        return [row[0] for row in rows]
+
+    def test_run(self):
+        with patch.dict(test_config['db'], {'key': self.new_key, 'old_keys': [self.old_key]}):
+            # Во время смены ключа читаются оба формата
+            self.assertEqual(Crypt.decrypt_data(self.read_column('requests', 'request_id')[0]), 'test_request_id_0')
+
+            rotator = KeyRotator(self.db_path, batch_size=2, duty_cycle=1)
+            self.assertEqual(rotator.run(), {'users': 5, 'requests': 5})
+            self.assertEqual(rotator.status()['requests'], (5, 5, True))
+
+            # Повторный запуск ничего не делает: позиция сохранена
+            self.assertEqual(rotator.run(), {'users': 0, 'requests': 0})
+
+        # После перешифрования данные читаются только новым ключом
+        fernet = Fernet(self.new_key)
+        self.assertEqual([fernet.decrypt(token.encode()).decode() for token in self.read_column('users', 'user_id')],
+                         [f'test_id_{i}' for i in range(5)])
+        with self.assertRaises(InvalidToken):
+            Crypt.decrypt_data(self.read_column('users', 'user_name')[0])
+
+    def test_run_recomputes_user_keys(self):
+        def save(user_id: str, user_name: str) -> None:
+            asyncio.run(BotDatabase(self.db_path).save_user_data(
+                user_id, user_name, "test_request_id", "test_problem_description", "test_contact_info",
+                "test_contact_time"))
+
+        search_index = SearchIndex(self.db_path)
+        search_index.enable()
+        search_index.update()  # Токены поиска на старом ключе индекса
+
+        with patch.dict(test_config['db'], {'key': self.new_key, 'old_keys': [self.old_key], 'index_key': None,
+                                            'search_index': True}):
+            # Ключ индекса выводится из основного: после перезапуска бота у пользователя новый user_key
+            save('test_id_0', 'Renamed Before')
+            self.assertEqual(len(self.read_column('users', 'rowid')), 6)
+
+            KeyRotator(self.db_path, duty_cycle=1).run()
+            self.assertEqual(len(self.read_column('users', 'rowid')), 5)
+            # Старые заявки снова находятся поиском: индекс перестроен на новом ключе
+            self.assertEqual(len(search_index.search('test_problem_description')), 6)
+
+            # Повторная заявка после перешифрования обновляет запись пользователя
+            save('test_id_1', 'Renamed After')
+            users = {Crypt.decrypt_data(user_id): Crypt.decrypt_data(user_name) for user_id, user_name in zip(
+                self.read_column('users', 'user_id'), self.read_column('users', 'user_name'))}
+        self.assertEqual(len(users), 5)
+        self.assertEqual((users['test_id_0'], users['test_id_1']), ('Renamed Before', 'Renamed After'))
+
+    def test_run_rotates_archive(self):
+        archive_dir = os.path.join(self.temp_dir, 'archive')
+        connection = sqlite3.connect(self.db_path)
+        with connection:
+            connection.execute("UPDATE requests SET created_at = 1578000000 WHERE rowid <= 2")
+        connection.close()
+        RequestArchive(self.db_path, archive_dir, max_age_days=30).run()
+
+        with patch.dict(test_config['db'], {'key': self.new_key, 'old_keys': [self.old_key]}), \
+                patch.dict(test_config['archive'], {'archive_dir': archive_dir}):
+            self.assertEqual(KeyRotator(self.db_path, duty_cycle=1).run(), {'users': 5, 'requests': 3, 'archive': 2})
+
+        # Старый ключ удален: архивные заявки по-прежнему экспортируются
+        csv_path = os.path.join(self.temp_dir, 'requests.csv')
+        with patch.dict(test_config['db'], {'key': self.new_key, 'old_keys': []}):
+            self.assertTrue(ExportData.export_many(self.db_path, 'requests', {'csv': csv_path},
+                                                   archive_dir=archive_dir))
+        with open(csv_path, encoding='UTF-8') as file:
+            self.assertEqual([line.split(',')[0] for line in file.read().splitlines()[1:]],
+                             [f'test_request_id_{i}' for i in range(5)])
+
+    def test_invalid_duty_cycle(self):
+        for duty_cycle in (0, -0.5, 1.5):
+            with self.subTest(duty_cycle=duty_cycle), self.assertRaises(ValueError):
+                KeyRotator(self.db_path, duty_cycle=duty_cycle)
+
+    def test_concurrent_write(self):
+        blocked = []
+        rotate_value = Crypt.rotate_value
+
+        def write_during_batch(value):
+            if not blocked:  # Запись бота между чтением пачки и ее перезаписью ждет конца транзакции
+                connection = sqlite3.connect(self.db_path, timeout=0)
+                try:
+                    with connection:
+                        connection.execute("UPDATE users SET user_name = 'changed'")
+                except sqlite3.OperationalError:
+                    blocked.append(True)
+                finally:
+                    connection.close()
+            return rotate_value(value)
+
+        with patch.dict(test_config['db'], {'key': self.new_key, 'old_keys': [self.old_key]}), \
+                patch('rotate.Crypt.rotate_value', side_effect=write_during_batch):
+            KeyRotator(self.db_path, duty_cycle=1).run()
+        self.assertEqual(blocked, [True])
+
+    def test_run_cipher_migration(self):
+        with patch.dict(test_config['db'], {'cipher': 'aes-gcm'}):
+            self.assertEqual(KeyRotator(self.db_path).run(), {'users': 5, 'requests': 5})
+
+        tokens = self.read_column('requests', 'request_id')
+        self.assertTrue(all(isinstance(token, bytes) for token in tokens))
+        self.assertEqual([Crypt.decrypt_data(token) for token in tokens], [f'test_request_id_{i}' for i in range(5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cryptography.fernet import Fernet
+
+from dbscripts import BotDatabase
+from expdata import ExportData
+from scan import IntegrityScanner
+from test_config import test_config
+
+
+class TestIntegrityScanner(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+
+        database = BotDatabase(self.db_path)
+        database.create_tables()
+        for i in range(5):
+            asyncio.run(database.save_user_data(
+                f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+                "test_problem_description", "test_contact_info", "test_contact_time"))
+
+        # Портим две заявки: обрезанный токен и токен, выпущенный неизвестным ключом
+        connection = sqlite3.connect(self.db_path)
+        with connection:
+            connection.execute("UPDATE requests SET contact_time = substr(contact_time, 1, 20) WHERE rowid = 2")
+            connection.execute("UPDATE requests SET request_id = ? WHERE rowid = 4",
+                               (Fernet(Fernet.generate_key()).encrypt(b'test').decode(),))
+        connection.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_run(self):
+        errors = IntegrityScanner(self.db_path, chunk_rows=2, workers=2).run()
+
+        self.assertEqual(errors['users'], [])
+        self.assertEqual([(rowid, column) for rowid, column, _ in errors['requests']],
+                         [(2, 'contact_time'), (4, 'request_id')])
+
+        # Экспорт пропускает известные поврежденные строки, а не прерывается
+        csv_path = os.path.join(self.temp_dir, 'requests.csv')
+        ExportData.export_to_csv(self.db_path, 'requests', csv_path)
+        with open(csv_path, encoding='UTF-8') as file:
+            self.assertEqual(len(file.readlines()), 4)  # Заголовок и 3 целые строки
+
+    def test_run_row_envelope(self):
+        database = BotDatabase(self.db_path)
+        with patch.dict(test_config['db'], {'row_envelope': True}):
+            for i in range(5, 7):
+                asyncio.run(database.save_user_data(
+                    f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+                    "test_problem_description", "test_contact_info", "test_contact_time"))
+
+        connection = sqlite3.connect(self.db_path)
+        with connection:
+            connection.execute("UPDATE requests SET row_token = substr(row_token, 1, 20) WHERE rowid = 7")
+        connection.close()
+
+        errors = IntegrityScanner(self.db_path, workers=1).run()
+        self.assertEqual([(rowid, column) for rowid, column, _ in errors['requests']],
+                         [(2, 'contact_time'), (4, 'request_id'), (7, 'row_token')])
+
+    def test_quarantine(self):
+        IntegrityScanner(self.db_path, workers=1).run(quarantine=True)
+
+        connection = sqlite3.connect(self.db_path)
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM requests").fetchone()[0], 3)
+        self.assertEqual(connection.execute(
+            "SELECT source_rowid FROM quarantine_requests ORDER BY source_rowid").fetchall(), [(2,), (4,)])
+        connection.close()
+
+        # После переноса в карантин база снова целая
+        self.assertEqual(IntegrityScanner(self.db_path, workers=1).run()['requests'], [])
+
+        # /stats не учитывает перенесенные в карантин заявки
+        stats = BotDatabase(self.db_path).request_stats()
+        self.assertEqual((stats['today'], stats['total']), (3, 3))
+
+    def test_quarantine_old_schema(self):
+        # Карантинная таблица создана до того, как в requests добавились новые столбцы
+        connection = sqlite3.connect(self.db_path)
+        with connection:
+            connection.execute(
+                "CREATE TABLE quarantine_requests (source_rowid, request_id, user_id, problem_description, contact_time)")
+        connection.close()
+
+        IntegrityScanner(self.db_path, workers=1).run(quarantine=True)
+
+        connection = sqlite3.connect(self.db_path)
+        columns = [column[1] for column in connection.execute("PRAGMA table_info(quarantine_requests)")]
+        self.assertIn('row_token', columns)
+        self.assertEqual(connection.execute(
+            "SELECT source_rowid FROM quarantine_requests ORDER BY source_rowid").fetchall(), [(2,), (4,)])
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
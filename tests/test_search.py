@@ -0,0 +1,169 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from dbscripts import BotDatabase
+from search import SearchIndex
+from test_config import test_config
+
+
+class TestSearchIndex(unittest.TestCase):
+    DESCRIPTIONS = ["Сломался котел", "Протекает котёл в подвале", "Не работает розетка"]
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+        self.database = BotDatabase(self.db_path)
+        self.database.create_tables()
+        self.search_index = SearchIndex(self.db_path, batch_size=2)
+        self.search_index.enable()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def save(self, start: int = 0):
+        for i, description in enumerate(self.DESCRIPTIONS, start):
+            asyncio.run(self.database.save_user_data(
+                f"test_id_{i}", "test_user_name", f"test_request_id_{i}",
+                description, "test_contact_info", "test_contact_time"))
+
+    def found(self, query: str) -> list:
+        return [request['request_id'] for request in self.search_index.search(query)]
+
+    def test_search(self):
+        self.save()
+        self.assertEqual(self.search_index.update(), 3)
+        self.assertEqual(self.search_index.update(), 0)  # Заявки индексируются один раз
+
+        self.assertEqual(self.found('котел'), ['test_request_id_1', 'test_request_id_0'])
+        self.assertEqual(self.found('КОТЕ подв'), ['test_request_id_1'])  # Все слова, по началу слова
+        self.assertEqual(self.found('розетки'), [])
+        self.assertEqual(self.found('в'), [])  # Короткие слова не ищутся
+        self.assertEqual(self.search_index.search('розетка')[0]['problem_description'], "Не работает розетка")
+
+    def test_search_checks_full_words(self):
+        self.DESCRIPTIONS = ["Водонагреватель течет", "Водонагревательный бак", "Кот застрял"]
+        self.save()
+        self.search_index.update()
+
+        # Начало из MAX_PREFIX символов у слов общее, но полное слово запроса есть только в одной заявке
+        self.assertEqual(self.found('водонагреватель'), ['test_request_id_1', 'test_request_id_0'])
+        self.assertEqual(self.found('водонагревательный'), ['test_request_id_1'])
+        self.assertEqual(self.found('водопровод'), [])
+        self.assertEqual(self.found('вод'), ['test_request_id_1', 'test_request_id_0'])  # Короткое начало слова
+        self.assertEqual(self.found('кот'), ['test_request_id_2'])
+
+        # limit считается после проверки: неподходящие кандидаты не занимают место в результате
+        self.assertEqual([request['request_id'] for request in self.search_index.search('водонагревательный', 1)],
+                         ['test_request_id_1'])
+
+    def test_search_skips_undecryptable_rows(self):
+        self.save()
+        self.search_index.update()
+        connection = sqlite3.connect(self.db_path)
+        with connection:  # Например, заявка на удаленном ключе
+            connection.execute("UPDATE requests SET problem_description = 'gAAAAAbroken' WHERE rowid = 2")
+        connection.close()
+
+        with self.assertLogs('search', level='WARNING'):
+            self.assertEqual(self.found('котел'), ['test_request_id_0'])
+
+    def test_row_envelope(self):
+        with patch.dict(test_config['db'], {'row_envelope': True}):
+            self.save()
+            self.search_index.update()
+            self.assertEqual(self.found('протекает'), ['test_request_id_1'])
+
+    def test_corrupted_aead_token(self):
+        with patch.dict(test_config['db'], {'cipher': 'aes-gcm'}):
+            self.save()
+            connection = sqlite3.connect(self.db_path)
+            with connection:  # Поврежденный шифротекст: у AEAD это InvalidTag, а не InvalidToken
+                token = connection.execute("SELECT problem_description FROM requests WHERE rowid = 2").fetchone()[0]
+                connection.execute("UPDATE requests SET problem_description = ? WHERE rowid = 2",
+                                   (token[:-1] + bytes([token[-1] ^ 1]),))
+            connection.close()
+
+            # Поврежденная заявка пропускается, остальные индексируются, очередь не застревает
+            self.assertEqual(self.search_index.update(), 3)
+            self.assertEqual(self.search_index.update(), 0)
+            self.assertEqual(self.found('розетка'), ['test_request_id_2'])
+            self.assertEqual(self.found('котел'), ['test_request_id_0'])
+
+    def test_delete_and_rebuild(self):
+        self.save()
+        connection = sqlite3.connect(self.db_path)
+        with connection:  # Например, перенос в архив
+            connection.execute("DELETE FROM requests WHERE rowid = 1")
+        connection.close()
+        self.search_index.update()
+        self.assertEqual(self.found('котел'), ['test_request_id_1'])
+
+        with patch.dict(test_config['db'], {'index_key': b'new index key'}):
+            self.assertEqual(self.found('котел'), [])  # Токены зависят от ключа индекса
+            self.assertEqual(self.search_index.rebuild(), 2)
+            self.assertEqual(self.found('котел'), ['test_request_id_1'])
+
+    def test_background_update(self):
+        threads = []
+        update = self.search_index.update
+
+        def record_thread():
+            threads.append(threading.current_thread().name)
+            return update()
+
+        with patch.object(self.search_index, 'update', side_effect=record_thread):
+            self.search_index.start()
+            BotDatabase.add_write_listener(self.search_index.notify)
+            try:
+                self.save()
+                deadline = time.monotonic() + 5
+                while not self.found('розетка') and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            finally:
+                BotDatabase.write_listeners.remove(self.search_index.notify)
+                self.search_index.stop()
+
+        self.assertEqual(self.found('розетка'), ['test_request_id_2'])
+        # Запись заявки только будит поток: индекс обновляется не в цикле событий
+        self.assertEqual(set(threads), {'search-index'})
+
+    def test_existing_database(self):
+        connection = sqlite3.connect(self.db_path)
+        connection.executescript("""
+            DROP TRIGGER search_pending_insert; DROP TRIGGER search_index_delete;
+            DROP TABLE search_index; DROP TABLE search_pending;""")
+        connection.close()
+        self.save()
+
+        self.database.create_tables()
+        self.search_index.enable()  # Уже записанные заявки ставятся в очередь индекса
+        self.assertEqual(self.search_index.update(), 3)
+        self.assertEqual(self.found('розетка'), ['test_request_id_2'])
+
+    def test_disable(self):
+        self.save()
+        self.search_index.update()
+
+        # Выключенный индекс не копит очередь; при включении заявки индексируются заново
+        SearchIndex.disable(self.db_path)
+        self.save(3)
+        connection = sqlite3.connect(self.db_path)
+        pending = connection.execute("SELECT COUNT(*) FROM search_pending").fetchone()[0]
+        connection.close()
+        self.assertEqual(pending, 0)
+        self.assertEqual(self.found('котел'), [])
+
+        self.search_index.enable()
+        self.assertEqual(self.search_index.update(), 6)
+        self.assertEqual(self.found('розетка'), ['test_request_id_5', 'test_request_id_2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
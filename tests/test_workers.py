@@ -0,0 +1,49 @@
+import asyncio
+import queue
+import unittest
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop
+
+from workers import WorkerPool, _process_updates
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_forward(self):
+        pool = WorkerPool('test_token', 3)
+        pool.queues = [Mock() for _ in range(3)]
+
+        update = Update.de_json({'update_id': 1, 'message': {
+            'message_id': 1, 'date': 0, 'chat': {'id': 5, 'type': 'private'},
+            'from': {'id': 5, 'is_bot': False, 'first_name': 'Test'}, 'text': '/request'}}, None)
+        with self.assertRaises(ApplicationHandlerStop):  # Главный процесс не обрабатывает обновление сам
+            asyncio.run(pool.forward(update, None))
+
+        # Все обновления пользователя попадают в один процесс
+        pool.queues[5 % 3].put.assert_called_once_with(update.to_dict())
+        for i in (0, 1):
+            pool.queues[i].put.assert_not_called()
+
+    @patch('workers.CommandsFactory.create_commands')
+    def test_process_updates(self, create_commands):
+        application = MagicMock()
+        application.__aenter__ = AsyncMock(return_value=application)
+        application.__aexit__ = AsyncMock(return_value=False)
+        application.start = AsyncMock()
+        application.stop = AsyncMock()
+        application.update_queue = asyncio.Queue()
+
+        updates = queue.Queue()
+        for update_id in (1, 2):
+            updates.put({'update_id': update_id})
+        updates.put(None)  # Сигнал остановки
+        asyncio.run(_process_updates(application, updates))
+
+        create_commands.assert_called_once_with(application)
+        self.assertEqual([application.update_queue.get_nowait().update_id for _ in range(2)], [1, 2])
+        application.stop.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+from writer import DatabaseWriter, WriterClient
+
+
+class TestDatabaseWriter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+        self.socket_path = os.path.join(self.temp_dir, 'writer.sock')
+        self.writer = DatabaseWriter(self.db_path, self.socket_path)
+        self.writer.start()
+
+    def tearDown(self):
+        self.writer.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def request_ids(self) -> list:
+        connection = sqlite3.connect(self.db_path)
+        try:
+            return sorted(Crypt.decrypt_data(row[0]) for row in connection.execute("SELECT request_id FROM requests"))
+        finally:
+            connection.close()
+
+    def test_save_user_data(self):
+        client = WriterClient(self.socket_path)
+        listener = Mock()
+        BotDatabase.add_write_listener(listener)
+
+        async def save_all():
+            await asyncio.gather(*(client.save_user_data(
+                f"test_id_{i % 3}", "test_user_name", f"test_request_id_{i}",
+                "test_problem_description", "test_contact_info", "test_contact_time") for i in range(20)))
+        try:
+            asyncio.run(save_all())
+            asyncio.run(save_all())  # Новый цикл событий: соединение открывается заново
+        finally:
+            BotDatabase.write_listeners.remove(listener)
+
+        self.assertEqual(self.request_ids(), sorted([f'test_request_id_{i}' for i in range(20)] * 2))
+        # Заявки, пришедшие одновременно, записываются пачками
+        self.assertEqual(sum(call.args[0] for call in listener.call_args_list), 40)
+        self.assertLess(listener.call_count, 40)
+
+    def test_error(self):
+        client = WriterClient(self.socket_path)
+        with patch('writer.BotDatabase.record_request_row', side_effect=sqlite3.IntegrityError('test error')):
+            with self.assertRaises(sqlite3.DatabaseError):
+                asyncio.run(client.send(('user_id', 'user_name', 'contact_info', None, 'user_key'),
+                                        ('request_id', 'user_id', 'problem', 'time', None)))
+        self.assertEqual(self.request_ids(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
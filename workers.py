@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import multiprocessing
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ApplicationHandlerStop, TypeHandler
+
+from commands import CommandsFactory
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """
+    Класс для обработки обновлений бота в нескольких процессах.
+
+    Главный процесс получает обновления (polling) и только пересылает их процессам-обработчикам
+    через очереди multiprocessing. Процесс выбирается по идентификатору пользователя, поэтому
+    все сообщения одного пользователя обрабатываются одним процессом по порядку, и состояние
+    диалога (context.user_data) остается в нем. Процессы-обработчики сами шифруют заявки и
+    записывают их через сервис записи (writer.py), которым владеет главный процесс.
+    """
+    def __init__(self, token: str, workers: int):
+        """
+        Создает процессы-обработчики (они запускаются методом start).
+
+        Параметры:
+        token (str): Токен для аутентификации бота в API.
+        workers (int): Количество процессов-обработчиков.
+        """
+        # spawn: в главном процессе уже работают потоки (планировщик, сервис записи), fork с ними небезопасен
+        context = multiprocessing.get_context('spawn')
+        self.queues = [context.Queue() for _ in range(workers)]
+        self.processes = [
+            context.Process(target=run_worker, args=(token, queue), name=f'bot-worker-{i}', daemon=True)
+            for i, queue in enumerate(self.queues)]
+
+    def setup(self, application) -> None:
+        """
+        Перехватывает все обновления приложения главного процесса и пересылает их обработчикам.
+
+        Параметры:
+        application: Приложение telegram.ext главного процесса.
+        """
+        application.add_handler(TypeHandler(Update, self.forward), group=-1)
+
+    async def forward(self, update: Update, context) -> None:
+        """
+        Пересылает обновление процессу, который обслуживает пользователя.
+
+        Параметры:
+        update (Update): Объект обновления.
+        context: Контекст, содержащий информацию о состоянии бота.
+
+        Исключения:
+        ApplicationHandlerStop: Всегда, чтобы главный процесс не обрабатывал обновление сам.
+        """
+        user = update.effective_user
+        self.queues[(user.id if user else 0) % len(self.queues)].put(update.to_dict())
+        raise ApplicationHandlerStop
+
+    def start(self) -> None:
+        """
+        Запускает процессы-обработчики.
+        """
+        for process in self.processes:
+            process.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        """
+        Останавливает процессы-обработчики после обработки уже пересланных обновлений.
+
+        Параметры:
+        timeout (float): Сколько секунд ждать завершения каждого процесса.
+        """
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f'Процесс {process.name} не завершился за {timeout} с')
+                process.terminate()
+
+
+def run_worker(token: str, queue) -> None:
+    """
+    Точка входа процесса-обработчика.
+
+    Параметры:
+    token (str): Токен для аутентификации бота в API.
+    queue (multiprocessing.Queue): Очередь обновлений (None - сигнал остановки).
+    """
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    asyncio.run(_process_updates(ApplicationBuilder().token(token).updater(None).build(), queue))
+
+
+async def _process_updates(application, queue) -> None:
+    """
+    Передает обновления из очереди приложению процесса-обработчика.
+
+    Параметры:
+    application: Приложение telegram.ext без собственного получения обновлений.
+    queue (multiprocessing.Queue): Очередь обновлений (None - сигнал остановки).
+    """
+    CommandsFactory.create_commands(application)
+    loop = asyncio.get_running_loop()
+    async with application:
+        await application.start()
+        while (data := await loop.run_in_executor(None, queue.get)) is not None:
+            await application.update_queue.put(Update.de_json(data, application.bot))
+        await application.stop()  # Обновления, уже поставленные в очередь, обрабатываются до остановки
@@ -0,0 +1,298 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from crypt_data import Crypt
+from dbscripts import BotDatabase
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseWriter:
+    """
+    Единственный писатель базы данных для многопроцессного режима бота.
+
+    Сервис владеет соединением с SQLite и принимает уже зашифрованные заявки от процессов-
+    обработчиков (WriterClient) через Unix-сокет: одна строка JSON на заявку в формате
+    BotDatabase.to_record с номером заявки ({"id", "user", "request"}). Заявки, пришедшие, пока
+    выполняется предыдущая транзакция, записываются следующей транзакцией одной пачкой (до batch_size
+    заявок), поэтому процессы не соревнуются за блокировку SQLite. Ответ {"id"} (или
+    {"id", "error"}) отправляется только после фиксации транзакции.
+
+    Сервис работает в отдельном потоке со своим циклом событий (start/stop).
+    """
+    def __init__(self, database_path: str, socket_path: str, batch_size: int = 500):
+        """
+        Инициализирует сервис записи.
+
+        Параметры:
+        database_path (str): Путь к файлу базы данных.
+        socket_path (str): Путь к Unix-сокету сервиса.
+        batch_size (int): Максимальное количество заявок в одной транзакции.
+        """
+        self.database_path = database_path
+        self.socket_path = socket_path
+        self.batch_size = batch_size
+        self._queue = None  # Создаются в цикле событий сервиса
+        self._stopped = None
+        self._loop = None
+        self._thread = None
+
+        BotDatabase(database_path).create_tables()
+        metrics.gauge('writer_queue_size', lambda: self._queue.qsize() if self._queue else 0)
+
+    def start(self) -> None:
+        """
+        Запускает сервис в фоновом потоке и ждет, пока сокет начнет принимать соединения.
+        """
+        ready = threading.Event()
+        self._thread = threading.Thread(target=asyncio.run, args=(self.serve(ready),), name='writer', daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop(self) -> None:
+        """
+        Останавливает сервис. Принятые заявки записываются в базу данных до остановки.
+        """
+        self._loop.call_soon_threadsafe(self._stopped.set)
+        self._thread.join()
+
+    async def serve(self, ready: threading.Event = None) -> None:
+        """
+        Принимает заявки через сокет и записывает их в базу данных до вызова stop.
+
+        Параметры:
+        ready (threading.Event): Событие, которое устанавливается, когда сокет готов.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._stopped = asyncio.Event()
+        connection = sqlite3.connect(self.database_path, check_same_thread=False)
+
+        if os.path.exists(self.socket_path):  # Сокет, оставшийся после аварийной остановки
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, self.socket_path)
+        committer = asyncio.create_task(self._commit_loop(connection))
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await self._stopped.wait()
+            await self._queue.join()
+        finally:
+            committer.cancel()
+            connection.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Обслуживает соединение процесса-обработчика: ставит заявки в очередь и отвечает после записи.
+
+        Параметры:
+        reader (asyncio.StreamReader): Входящий поток соединения.
+        writer (asyncio.StreamWriter): Исходящий поток соединения.
+        """
+        replies = set()
+        try:
+            while line := await reader.readline():
+                record = json.loads(line)
+                future = self._loop.create_future()
+                await self._queue.put((record, future))
+                reply = asyncio.create_task(self._reply(writer, record['id'], future))
+                replies.add(reply)
+                reply.add_done_callback(replies.discard)
+            await asyncio.gather(*replies, return_exceptions=True)
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _reply(writer: asyncio.StreamWriter, record_id: int, future: asyncio.Future) -> None:
+        """
+        Отправляет результат записи заявки после фиксации транзакции.
+
+        Параметры:
+        writer (asyncio.StreamWriter): Исходящий поток соединения.
+        record_id (int): Номер заявки в соединении.
+        future (asyncio.Future): Результат записи.
+        """
+        try:
+            await future
+            reply = {'id': record_id}
+        except Exception as e:
+            reply = {'id': record_id, 'error': str(e)}
+        writer.write(json.dumps(reply).encode() + b'\n')
+        await writer.drain()
+
+    async def _commit_loop(self, connection: sqlite3.Connection) -> None:
+        """
+        Записывает накопившиеся в очереди заявки пачками, по одной транзакции на пачку.
+
+        Параметры:
+        connection (sqlite3.Connection): Соединение с базой данных (используется только здесь).
+        """
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                # Пока транзакция выполняется в потоке, цикл событий продолжает принимать заявки
+                await asyncio.to_thread(self._commit, connection, [record for record, _ in batch])
+            except Exception as e:
+                logger.error(f'Сервис записи: ошибка записи {len(batch)} заявок: {e}')
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+            for _ in batch:
+                self._queue.task_done()
+
+    @staticmethod
+    def _commit(connection: sqlite3.Connection, records: list) -> None:
+        """
+        Записывает заявки в базу данных одной транзакцией.
+
+        Параметры:
+        connection (sqlite3.Connection): Соединение с базой данных.
+        records (list): Записи в формате BotDatabase.to_record.
+        """
+        with metrics.time('db_operation_seconds', operation='writer_commit'), connection:
+            connection.executemany(
+                BotDatabase.INSERT_USER_SQL, [BotDatabase.record_user_row(record) for record in records])
+            connection.executemany(
+                BotDatabase.INSERT_REQUEST_SQL, [BotDatabase.record_request_row(record) for record in records])
+        BotDatabase.notify_write(len(records))
+
+
+class WriterClient:
+    """
+    Клиент сервиса записи для процессов-обработчиков (аналог BotDatabase.save_user_data).
+
+    Заявка шифруется в процессе-обработчике (шифрование масштабируется по ядрам), отправляется
+    в DatabaseWriter, и save_user_data завершается после фиксации транзакции. Соединение
+    открывается при первой записи и переоткрывается, если оно было закрыто или цикл событий сменился.
+    """
+    def __init__(self, socket_path: str):
+        """
+        Инициализирует клиент.
+
+        Параметры:
+        socket_path (str): Путь к Unix-сокету сервиса записи.
+        """
+        self.socket_path = socket_path
+        self._loop = None
+        self._lock = None
+        self._writer = None
+        self._futures = {}
+        self._next_id = 0
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def open(socket_path: str) -> 'WriterClient':
+        """
+        Возвращает общий для процесса клиент сервиса записи.
+
+        Параметры:
+        socket_path (str): Путь к Unix-сокету сервиса записи.
+
+        Возвращает:
+        WriterClient: Клиент (один экземпляр на сокет).
+        """
+        return WriterClient(socket_path)
+
+    async def save_user_data(self,
+            user_id: str,
+            user_name: str,
+            request_id: str,
+            problem_description: str,
+            contact_info: str,
+            contact_time: str
+    ) -> None:
+        """
+        Шифрует заявку и записывает ее в базу данных через сервис записи.
+
+        Параметры:
+        user_id (str): Идентификатор пользователя.
+        user_name (str): Имя пользователя.
+        request_id (str): Идентификатор заявки.
+        problem_description (str): Описание проблемы.
+        contact_info (str): Контактная информация пользователя.
+        contact_time (str): Предпочтительное время для связи.
+
+        Исключения:
+        sqlite3.DatabaseError: Если сервис не смог записать заявку.
+        ConnectionError: Если соединение с сервисом разорвано до ответа.
+        """
+        user_row, request_row = await Crypt.encrypt_rows(
+            [(user_id, user_name, contact_info), (request_id, user_id, problem_description, contact_time)])
+        await self.send((*user_row, Crypt.user_key(user_id)), request_row)
+
+    async def send(self, user_row: tuple, request_row: tuple) -> None:
+        """
+        Отправляет зашифрованную заявку в сервис записи и ждет фиксации транзакции.
+
+        Параметры:
+        user_row (tuple): Зашифрованные значения и user_key для таблицы users.
+        request_row (tuple): Зашифрованные значения для таблицы requests.
+        """
+        writer = await self._connect()
+        self._next_id += 1
+        future = self._loop.create_future()
+        self._futures[self._next_id] = future
+
+        record = json.dumps({'id': self._next_id, **BotDatabase.to_record(user_row, request_row)})
+        with metrics.time('db_operation_seconds', operation='writer_send'):
+            writer.write(record.encode() + b'\n')
+            await writer.drain()
+            await future
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        """
+        Возвращает открытое соединение с сервисом записи, открывая его при необходимости.
+
+        Возвращает:
+        asyncio.StreamWriter: Исходящий поток соединения.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:  # Соединение и блокировка привязаны к циклу событий
+            self._loop, self._lock, self._writer = loop, asyncio.Lock(), None
+        async with self._lock:
+            if self._writer is None or self._writer.is_closing():
+                reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+                self._futures = {}  # Заявки, ожидающие ответа в этом соединении
+                loop.create_task(self._read_replies(reader, self._writer, self._futures))
+        return self._writer
+
+    @staticmethod
+    async def _read_replies(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, futures: dict) -> None:
+        """
+        Передает ответы сервиса ожидающим заявкам. При разрыве соединения заявки завершаются ошибкой,
+        а соединение закрывается, чтобы следующая запись открыла новое.
+
+        Параметры:
+        reader (asyncio.StreamReader): Входящий поток соединения.
+        writer (asyncio.StreamWriter): Исходящий поток соединения.
+        futures (dict): Ожидающие ответа заявки по номеру.
+        """
+        try:
+            while line := await reader.readline():
+                reply = json.loads(line)
+                future = futures.pop(reply['id'], None)
+                if future is None or future.done():
+                    continue
+                if 'error' in reply:
+                    future.set_exception(sqlite3.DatabaseError(reply['error']))
+                else:
+                    future.set_result(None)
+        finally:
+            writer.close()
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('Соединение с сервисом записи разорвано'))
+            futures.clear()